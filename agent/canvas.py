@@ -15,13 +15,91 @@
 #
 import logging
 import json
+import os
+import threading
 from copy import deepcopy
 from functools import partial
 
 import pandas as pd
+import xxhash
+from cachetools import LRUCache
 
 from agent.component import component_class
-from agent.component.base import ComponentBase
+from agent.component.base import ComponentBase, _CHECKED
+
+CANVAS_COMPILED_CACHE_SIZE = int(os.environ.get("CANVAS_COMPILED_CACHE_SIZE", 256))
+# param fields written by runs, they belong to a session and not to the compiled DSL
+RUN_STATE_PARAMS = {"output", "inputs", "debug_inputs"}
+
+
+def _run_state_params(params):
+    return RUN_STATE_PARAMS | {params.get("output_var_name", "output")}
+
+
+class CompiledCanvas:
+    """
+    The components of a DSL parsed and checked once, shared by every session running it.
+    A session copies the params and puts its own run state back instead of updating and
+    checking them again. The cache key is the DSL without the run state, so it changes with
+    every edit of the agent but not with the outputs of a session.
+    """
+    _cache = LRUCache(maxsize=max(CANVAS_COMPILED_CACHE_SIZE, 1))
+    _lock = threading.Lock()
+
+    def __init__(self, components):
+        self.params = {}
+        self.downstream = {}
+        for k, cpn in components.items():
+            params = cpn["obj"]["params"]
+            state = _run_state_params(params)
+            param = component_class(cpn["obj"]["component_name"] + "Param")()
+            param.update(deepcopy({n: v for n, v in params.items() if n not in state}))
+            param.check()
+            setattr(param, _CHECKED, True)
+            self.params[k] = param
+            downstream = list(cpn["downstream"])
+            if cpn["obj"]["component_name"] == "Categorize":
+                for _, desc in param.category_description.items():
+                    if desc["to"] not in downstream:
+                        downstream.append(desc["to"])
+            self.downstream[k] = downstream
+
+    @staticmethod
+    def key(components):
+        hasher = xxhash.xxh64()
+        for k in sorted(components.keys()):
+            cpn = components[k]
+            params = cpn["obj"]["params"]
+            state = _run_state_params(params)
+            hasher.update(json.dumps([k, cpn["obj"]["component_name"],
+                                      {n: v for n, v in params.items() if n not in state},
+                                      cpn.get("downstream"), cpn.get("upstream"), cpn.get("parent_id")],
+                                     ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        return hasher.hexdigest()
+
+    @classmethod
+    def get(cls, components):
+        if CANVAS_COMPILED_CACHE_SIZE <= 0:
+            return cls(components)
+        k = cls.key(components)
+        with cls._lock:
+            compiled = cls._cache.get(k)
+        if compiled is None:
+            compiled = cls(components)
+            with cls._lock:
+                cls._cache[k] = compiled
+        return compiled
+
+    def instantiate(self, canvas, cid, cpn):
+        """A fresh component of the session, with the run state found in its DSL."""
+        params = cpn["obj"]["params"]
+        param = deepcopy(self.params[cid])
+        for n in _run_state_params(params):
+            if n in params:
+                setattr(param, n, params[n])
+        obj = component_class(cpn["obj"]["component_name"])(canvas, cid, param)
+        obj._dirty = False
+        return obj
 
 
 class Canvas:
@@ -108,16 +186,14 @@ class Canvas:
         assert "Begin" in cpn_nms, "There have to be an 'Begin' component."
         assert "Answer" in cpn_nms, "There have to be an 'Answer' component."
 
+        compiled = CompiledCanvas.get(self.components)
+        self._serialized = {}
         for k, cpn in self.components.items():
-            cpn_nms.add(cpn["obj"]["component_name"])
-            param = component_class(cpn["obj"]["component_name"] + "Param")()
-            param.update(cpn["obj"]["params"])
-            param.check()
-            cpn["obj"] = component_class(cpn["obj"]["component_name"])(self, k, param)
-            if cpn["obj"].component_name == "Categorize":
-                for _, desc in param.category_description.items():
-                    if desc["to"] not in cpn["downstream"]:
-                        cpn["downstream"].append(desc["to"])
+            # components no run touches are written back as they were read
+            if {"component_name", "params", "output", "inputs"} <= set(cpn["obj"].keys()):
+                self._serialized[k] = cpn["obj"]
+            cpn["obj"] = compiled.instantiate(self, k, cpn)
+            cpn["downstream"] = list(compiled.downstream[k])
 
         self.path = self.dsl["path"]
         self.history = self.dsl["history"]
@@ -127,6 +203,14 @@ class Canvas:
         self._embed_id = self.dsl.get("embed_id", "")
 
     def __str__(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def to_dict(self):
+        """
+        The DSL to persist. Only the components touched since loading are serialized again,
+        and the rest of the state is copied shallowly: it is a snapshot to be written, not to be
+        modified.
+        """
         self.dsl["path"] = self.path
         self.dsl["history"] = self.history
         self.dsl["messages"] = self.messages
@@ -139,17 +223,21 @@ class Canvas:
         for k in self.dsl.keys():
             if k in ["components"]:
                 continue
-            dsl[k] = deepcopy(self.dsl[k])
+            v = self.dsl[k]
+            dsl[k] = [list(p) for p in v] if k == "path" else list(v) if isinstance(v, list) else v
 
         for k, cpn in self.components.items():
             if k not in dsl["components"]:
                 dsl["components"][k] = {}
             for c in cpn.keys():
                 if c == "obj":
-                    dsl["components"][k][c] = json.loads(str(cpn["obj"]))
+                    if cpn["obj"]._dirty or k not in self._serialized:
+                        dsl["components"][k][c] = json.loads(str(cpn["obj"]))
+                    else:
+                        dsl["components"][k][c] = self._serialized[k]
                     continue
                 dsl["components"][k][c] = deepcopy(cpn[c])
-        return json.dumps(dsl, ensure_ascii=False)
+        return dsl
 
     def reset(self):
         self.path = []
@@ -352,6 +440,7 @@ class Canvas:
         return self.components["begin"]["obj"]._param.prologue
 
     def set_global_param(self, **kwargs):
+        self.components["begin"]["obj"]._dirty = True
         for k, v in kwargs.items():
             for q in self.components["begin"]["obj"]._param.query:
                 if k != q["key"]:
@@ -359,6 +448,8 @@ class Canvas:
                 q["value"] = v
 
     def get_preset_param(self):
+        # callers fill in the values
+        self.components["begin"]["obj"]._dirty = True
         return self.components["begin"]["obj"]._param.query
 
     def get_component_input_elements(self, cpnnm):
@@ -29,6 +29,8 @@ _FEEDED_DEPRECATED_PARAMS = "_feeded_deprecated_params"
 _DEPRECATED_PARAMS = "_deprecated_params"
 _USER_FEEDED_PARAMS = "_user_feeded_params"
 _IS_RAW_CONF = "_is_raw_conf"
+# set on params checked once by a compiled canvas, their copies are not checked again
+_CHECKED = "_checked"
 
 
 class ComponentParamBase(ABC):
@@ -89,7 +91,7 @@ class ComponentParamBase(ABC):
         def _recursive_convert_obj_to_dict(obj):
             ret_dict = {}
             for attr_name in list(obj.__dict__):
-                if attr_name in [_FEEDED_DEPRECATED_PARAMS, _DEPRECATED_PARAMS, _USER_FEEDED_PARAMS, _IS_RAW_CONF]:
+                if attr_name in [_FEEDED_DEPRECATED_PARAMS, _DEPRECATED_PARAMS, _USER_FEEDED_PARAMS, _IS_RAW_CONF, _CHECKED]:
                     continue
                 # get attr
                 attr = getattr(obj, attr_name)
@@ -399,7 +401,10 @@ class ComponentBase(ABC):
         self._canvas = canvas
         self._id = id
         self._param = param
-        self._param.check()
+        # whether the run state changed since the canvas loaded it
+        self._dirty = True
+        if not getattr(self._param, _CHECKED, False):
+            self._param.check()
 
     def get_dependent_components(self):
         cpnts = set([para["component_id"].split("@")[0] for para in self._param.query \
@@ -412,6 +417,7 @@ class ComponentBase(ABC):
         logging.debug("{}, history: {}, kwargs: {}".format(self, json.dumps(history, ensure_ascii=False),
                                                               json.dumps(kwargs, ensure_ascii=False)))
         self._param.debug_inputs = []
+        self._dirty = True
         try:
             res = self._run(history, **kwargs)
             self.set_output(res)
@@ -449,13 +455,16 @@ class ComponentBase(ABC):
         return self._param.output_var_name, outs
 
     def reset(self):
+        self._dirty = True
         setattr(self._param, self._param.output_var_name, None)
         self._param.inputs = []
 
     def set_output(self, v):
+        self._dirty = True
         setattr(self._param, self._param.output_var_name, v)
 
     def get_input(self):
+        self._dirty = True
         if self._param.debug_inputs:
             return pd.DataFrame([{"content": v["value"]} for v in self._param.debug_inputs if v.get("value")])
 
@@ -150,13 +150,13 @@ def run():
                     canvas.path.pop(-1)
                 if final_ans.get("reference"):
                     canvas.reference.append(final_ans["reference"])
-                cvs.dsl = json.loads(str(canvas))
-                UserCanvasService.update_by_id(req["id"], cvs.to_dict())
+                cvs.dsl = canvas.to_dict()
+                UserCanvasService.update_by_id(req["id"], {"dsl": cvs.dsl})
             except Exception as e:
-                cvs.dsl = json.loads(str(canvas))
+                cvs.dsl = canvas.to_dict()
                 if not canvas.path[-1]:
                     canvas.path.pop(-1)
-                UserCanvasService.update_by_id(req["id"], cvs.to_dict())
+                UserCanvasService.update_by_id(req["id"], {"dsl": cvs.dsl})
                 traceback.print_exc()
                 yield "data:" + json.dumps({"code": 500, "message": str(e),
                                             "data": {"answer": "**ERROR**: " + str(e), "reference": []}},
@@ -177,8 +177,8 @@ def run():
         canvas.messages.append({"role": "assistant", "content": final_ans["content"], "id": message_id})
         if final_ans.get("reference"):
             canvas.reference.append(final_ans["reference"])
-        cvs.dsl = json.loads(str(canvas))
-        UserCanvasService.update_by_id(req["id"], cvs.to_dict())
+        cvs.dsl = canvas.to_dict()
+        UserCanvasService.update_by_id(req["id"], {"dsl": cvs.dsl})
         return get_json_result(data={"answer": final_ans["content"], "reference": final_ans.get("reference", [])})
 
 
@@ -198,7 +198,7 @@ def reset():
 
         canvas = Canvas(json.dumps(user_canvas.dsl), current_user.id)
         canvas.reset()
-        req["dsl"] = json.loads(str(canvas))
+        req["dsl"] = canvas.to_dict()
         UserCanvasService.update_by_id(req["id"], {"dsl": req["dsl"]})
         return get_json_result(data=req["dsl"])
     except Exception as e:
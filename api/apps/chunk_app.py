@@ -25,6 +25,7 @@ from rag.nlp import search, rag_tokenizer
 from rag.prompts import keyword_extraction
 from rag.settings import PAGERANK_FLD
 from rag.utils import rmSpace
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
 from api.db import LLMType, ParserType
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.llm_service import LLMBundle
@@ -165,6 +166,7 @@ def set():
         v = 0.1 * v[0] + 0.9 * v[1] if doc.parser_id != ParserType.QA else v[1]
         d["q_%d_vec" % len(v)] = v.tolist()
         settings.docStoreConn.update({"id": req["chunk_id"]}, d, search.index_name(tenant_id), doc.kb_id)
+        RETRIEVAL_CACHE.invalidate(doc.kb_id)
         return get_json_result(data=True)
     except Exception as e:
         return server_error_response(e)
@@ -185,6 +187,7 @@ def switch():
                                                 search.index_name(DocumentService.get_tenant_id(req["doc_id"])),
                                                 doc.kb_id):
                 return get_data_error_result(message="Index updating failure")
+        RETRIEVAL_CACHE.invalidate(doc.kb_id)
         return get_json_result(data=True)
     except Exception as e:
         return server_error_response(e)
@@ -24,6 +24,8 @@ from flask_login import login_required, current_user
 
 from deepdoc.parser.html_parser import RAGFlowHtmlParser
 from rag.nlp import search
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
+from rag.utils.progress_reporter import publish_task_cancel
 
 from api.db import FileType, TaskStatus, ParserType, FileSource
 from api.db.db_models import File, Task
@@ -288,6 +290,7 @@ def change_status():
         status = int(req["status"])
         settings.docStoreConn.update({"doc_id": req["doc_id"]}, {"available_int": status},
                                      search.index_name(kb.tenant_id), doc.kb_id)
+        RETRIEVAL_CACHE.invalidate(doc.kb_id)
         return get_json_result(data=True)
     except Exception as e:
         return server_error_response(e)
@@ -385,7 +388,7 @@ def run():
                 TaskService.filter_delete([Task.doc_id == id])
                 # 如果索引存在，则删除索引中的文档数据
                 if settings.docStoreConn.indexExist(search.index_name(tenant_id), doc.kb_id):
-                    settings.docStoreConn.delete({"doc_id": id}, search.index_name(tenant_id), doc.kb_id)
+                    DocumentService.delete_chunks({"doc_id": id}, tenant_id, doc.kb_id)
             
             # 如果是运行状态，则创建解析任务
             if str(req["run"]) == TaskStatus.RUNNING.value:
@@ -397,6 +400,8 @@ def run():
                 # 将任务加入队列
                 queue_tasks(doc, bucket, name)
 
+        if str(req["run"]) == TaskStatus.CANCEL.value:
+            publish_task_cancel(req["doc_ids"])
         return get_json_result(data=True)
     except Exception as e:
         return server_error_response(e)
@@ -512,7 +517,7 @@ def change_parser():
             if not tenant_id:
                 return get_data_error_result(message="Tenant not found!")
             if settings.docStoreConn.indexExist(search.index_name(tenant_id), doc.kb_id):
-                settings.docStoreConn.delete({"doc_id": doc.id}, search.index_name(tenant_id), doc.kb_id)
+                DocumentService.delete_chunks({"doc_id": doc.id}, tenant_id, doc.kb_id)
 
         return get_json_result(data=True)
     except Exception as e:
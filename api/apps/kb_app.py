@@ -28,12 +28,14 @@ from api.utils.api_utils import server_error_response, get_data_error_result, va
 from api.utils import get_uuid
 from api.db import StatusEnum, FileSource
 from api.db.services.knowledgebase_service import KnowledgebaseService
+from api.db.services.dialog_context import DIALOG_CONTEXT_CACHE
 from api.db.db_models import File
 from api.utils.api_utils import get_json_result
 from api import settings
 from rag.nlp import search
 from api.constants import DATASET_NAME_LIMIT
 from rag.settings import PAGERANK_FLD
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
 
 
 @manager.route('/create', methods=['post'])  # noqa: F821
@@ -112,6 +114,7 @@ def update():
         del req["kb_id"]
         if not KnowledgebaseService.update_by_id(kb.id, req):
             return get_data_error_result()
+        DIALOG_CONTEXT_CACHE.invalidate_kbs(kb.id)
 
         if kb.pagerank != req.get("pagerank", 0):
             if req.get("pagerank", 0) > 0:
@@ -121,6 +124,7 @@ def update():
                 # Elasticsearch requires PAGERANK_FLD be non-zero!
                 settings.docStoreConn.update({"exists": PAGERANK_FLD}, {"remove": PAGERANK_FLD},
                                          search.index_name(kb.tenant_id), kb.id)
+            RETRIEVAL_CACHE.invalidate(kb.id)
 
         e, kb = KnowledgebaseService.get_by_id(kb.id)
         if not e:
@@ -208,6 +212,7 @@ def rm():
         if not KnowledgebaseService.delete_by_id(req["kb_id"]):
             return get_data_error_result(
                 message="Database error (Knowledgebase removal)!")
+        DIALOG_CONTEXT_CACHE.invalidate_kbs(req["kb_id"])
         for kb in kbs:
             settings.docStoreConn.delete({"kb_id": kb.id}, search.index_name(kb.tenant_id), kb.id)
             settings.docStoreConn.deleteIdx(search.index_name(kb.tenant_id), kb.id)
@@ -263,6 +268,7 @@ def rm_tags(kb_id):
                                      {"remove": {"tag_kwd": t}},
                                      search.index_name(kb.tenant_id),
                                      kb_id)
+    RETRIEVAL_CACHE.invalidate(kb_id)
     return get_json_result(data=True)
 
 
@@ -282,6 +288,7 @@ def rename_tags(kb_id):
                                      {"remove": {"tag_kwd": req["from_tag"].strip()}, "add": {"tag_kwd": req["to_tag"]}},
                                      search.index_name(kb.tenant_id),
                                      kb_id)
+    RETRIEVAL_CACHE.invalidate(kb_id)
     return get_json_result(data=True)
 
 
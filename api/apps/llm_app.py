@@ -19,6 +19,7 @@ import os
 from flask import request
 from flask_login import login_required, current_user
 from api.db.services.llm_service import LLMFactoriesService, TenantLLMService, LLMService
+from api.db.services.dialog_context import DIALOG_CONTEXT_CACHE
 from api import settings
 from api.utils.api_utils import server_error_response, get_data_error_result, validate_request
 from api.db import StatusEnum, LLMType
@@ -125,6 +126,7 @@ def set_api_key():
                 api_base=llm_config["api_base"],
                 max_tokens=llm_config["max_tokens"]
             )
+    DIALOG_CONTEXT_CACHE.invalidate_tenant(current_user.id)
 
     return get_json_result(data=True)
 
@@ -275,6 +277,7 @@ def add_llm():
             [TenantLLM.tenant_id == current_user.id, TenantLLM.llm_factory == factory,
              TenantLLM.llm_name == llm["llm_name"]], llm):
         TenantLLMService.save(**llm)
+    DIALOG_CONTEXT_CACHE.invalidate_tenant(current_user.id)
 
     return get_json_result(data=True)
 
@@ -287,6 +290,7 @@ def delete_llm():
     TenantLLMService.filter_delete(
         [TenantLLM.tenant_id == current_user.id, TenantLLM.llm_factory == req["llm_factory"],
          TenantLLM.llm_name == req["llm_name"]])
+    DIALOG_CONTEXT_CACHE.invalidate_tenant(current_user.id)
     return get_json_result(data=True)
 
 
@@ -297,6 +301,7 @@ def delete_factory():
     req = request.json
     TenantLLMService.filter_delete(
         [TenantLLM.tenant_id == current_user.id, TenantLLM.llm_factory == req["llm_factory"]])
+    DIALOG_CONTEXT_CACHE.invalidate_tenant(current_user.id)
     return get_json_result(data=True)
 
 
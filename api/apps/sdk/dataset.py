@@ -21,6 +21,7 @@ from api.db.services.document_service import DocumentService
 from api.db.services.file2document_service import File2DocumentService
 from api.db.services.file_service import FileService
 from api.db.services.knowledgebase_service import KnowledgebaseService
+from api.db.services.dialog_context import DIALOG_CONTEXT_CACHE
 from api.db.services.llm_service import TenantLLMService, LLMService
 from api.db.services.user_service import TenantService
 from api import settings
@@ -264,6 +265,7 @@ def delete(tenant_id):
         if not KnowledgebaseService.delete_by_id(id):
             errors.append(f"Delete dataset error for {id}")
             continue
+        DIALOG_CONTEXT_CACHE.invalidate_kbs(id)
         success_count += 1
     if errors:
         if success_count > 0:
@@ -445,6 +447,7 @@ def update(tenant_id, dataset_id):
             del req[f]
     if not KnowledgebaseService.update_by_id(kb.id, req):
         return get_error_data_result(message="Update dataset error.(Database error)")
+    DIALOG_CONTEXT_CACHE.invalidate_kbs(kb.id)
     return get_result(code=settings.RetCode.SUCCESS)
 
 
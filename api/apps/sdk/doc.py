@@ -18,6 +18,8 @@ import datetime
 
 from rag.app.qa import rmPrefix, beAdoc
 from rag.nlp import rag_tokenizer
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
+from rag.utils.progress_reporter import publish_task_cancel
 from api.db import LLMType, ParserType
 from api.db.services.llm_service import TenantLLMService, LLMBundle
 from api import settings
@@ -320,7 +322,7 @@ def update_doc(tenant_id, dataset_id, document_id):
             )
             if not e:
                 return get_error_data_result(message="Document not found!")
-            settings.docStoreConn.delete({"doc_id": doc.id}, search.index_name(tenant_id), dataset_id)
+            DocumentService.delete_chunks({"doc_id": doc.id}, tenant_id, dataset_id)
 
     return get_result()
 
@@ -674,7 +676,7 @@ def parse(tenant_id, dataset_id):
         info["chunk_num"] = 0
         info["token_num"] = 0
         DocumentService.update_by_id(id, info)
-        settings.docStoreConn.delete({"doc_id": id}, search.index_name(tenant_id), dataset_id)
+        DocumentService.delete_chunks({"doc_id": id}, tenant_id, dataset_id)
         TaskService.filter_delete([Task.doc_id == id])
         e, doc = DocumentService.get_by_id(id)
         doc = doc.to_dict()
@@ -738,7 +740,8 @@ def stop_parsing(tenant_id, dataset_id):
             )
         info = {"run": "2", "progress": 0, "chunk_num": 0}
         DocumentService.update_by_id(id, info)
-        settings.docStoreConn.delete({"doc_id": doc[0].id}, search.index_name(tenant_id), dataset_id)
+        DocumentService.delete_chunks({"doc_id": doc[0].id}, tenant_id, dataset_id)
+    publish_task_cancel(req["document_ids"])
     return get_result()
 
 
@@ -1217,6 +1220,7 @@ def update_chunk(tenant_id, dataset_id, document_id, chunk_id):
     v = 0.1 * v[0] + 0.9 * v[1] if doc.parser_id != ParserType.QA else v[1]
     d["q_%d_vec" % len(v)] = v.tolist()
     settings.docStoreConn.update({"id": chunk_id}, d, search.index_name(tenant_id), dataset_id)
+    RETRIEVAL_CACHE.invalidate(dataset_id)
     return get_result()
 
 
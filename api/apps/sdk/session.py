@@ -120,7 +120,7 @@ def create_agent_session(tenant_id, agent_id):
     else:
         for ans in canvas.run(stream=False):
             pass
-    cvs.dsl = json.loads(str(canvas))
+    cvs.dsl = canvas.to_dict()
     conv = {
         "id": get_uuid(),
         "dialog_id": cvs.id,
@@ -35,7 +35,10 @@ from api.versions import get_ragflow_version
 from rag.utils.storage_factory import STORAGE_IMPL, STORAGE_IMPL_TYPE
 from timeit import default_timer as timer
 
+from rag.nlp import rag_tokenizer
 from rag.utils.redis_conn import REDIS_CONN
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
+from api.db.services.dialog_context import DIALOG_CONTEXT_CACHE
 
 
 @manager.route("/version", methods=["GET"])  # noqa: F821
@@ -166,6 +169,9 @@ def status():
     except Exception:
         logging.exception("get task executor heartbeats failed!")
     res["task_executor_heartbeats"] = task_executor_heartbeats
+    res["retrieval_cache"] = RETRIEVAL_CACHE.stats()
+    res["dialog_context_cache"] = DIALOG_CONTEXT_CACHE.stats()
+    res["tokenizer_cache"] = {**rag_tokenizer.cache_stats(), "term_weight": settings.retrievaler.qryr.tw.cache_stats()}
 
     return get_json_result(data=res)
 
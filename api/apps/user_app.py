@@ -24,6 +24,7 @@ from flask_login import login_required, current_user, login_user, logout_user
 
 from api.db.db_models import TenantLLM
 from api.db.services.llm_service import TenantLLMService, LLMService
+from api.db.services.dialog_context import DIALOG_CONTEXT_CACHE
 from api.utils.api_utils import (
     server_error_response,
     validate_request,
@@ -699,6 +700,7 @@ def set_tenant_info():
     try:
         tid = req.pop("tenant_id")
         TenantService.update_by_id(tid, req)
+        DIALOG_CONTEXT_CACHE.invalidate_tenant(tid)
         return get_json_result(data=True)
     except Exception as e:
         return server_error_response(e)
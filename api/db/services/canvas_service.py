@@ -75,7 +75,7 @@ def completion(tenant_id, agent_id, question, session_id=None, stream=True, **kw
                     else:
                         if "value" in ele:
                             ele.pop("value")
-        cvs.dsl = json.loads(str(canvas))
+        cvs.dsl = canvas.to_dict()
         session_id=get_uuid()
         conv = {
             "id": session_id,
@@ -127,11 +127,11 @@ def completion(tenant_id, agent_id, question, session_id=None, stream=True, **kw
             canvas.history.append(("assistant", final_ans["content"]))
             if final_ans.get("reference"):
                 canvas.reference.append(final_ans["reference"])
-            conv.dsl = json.loads(str(canvas))
+            conv.dsl = canvas.to_dict()
             API4ConversationService.append_message(conv.id, conv.to_dict())
         except Exception as e:
             traceback.print_exc()
-            conv.dsl = json.loads(str(canvas))
+            conv.dsl = canvas.to_dict()
             API4ConversationService.append_message(conv.id, conv.to_dict())
             yield "data:" + json.dumps({"code": 500, "message": str(e),
                                         "data": {"answer": "**ERROR**: " + str(e), "reference": []}},
@@ -146,7 +146,7 @@ def completion(tenant_id, agent_id, question, session_id=None, stream=True, **kw
             canvas.messages.append({"role": "assistant", "content": final_ans["content"], "id": message_id})
             if final_ans.get("reference"):
                 canvas.reference.append(final_ans["reference"])
-            conv.dsl = json.loads(str(canvas))
+            conv.dsl = canvas.to_dict()
 
             result = {"answer": final_ans["content"], "reference": final_ans.get("reference", []) , "param": canvas.get_preset_param()}
             result = structure_answer(conv, result, message_id, session_id)
@@ -58,6 +58,11 @@ def structure_answer(conv, ans, message_id, session_id):
     chunk_list = chunks_format(reference)
 
     reference["chunks"] = chunk_list
+    delta = ans.get("reference_delta")
+    if delta is not None:
+        # 增量引用：只格式化本帧新增的 chunk，键为回答中 ##i$$ 的序号
+        keys = list(delta.get("chunks", {}).keys())
+        delta["chunks"] = dict(zip(keys, chunks_format({"chunks": list(delta.get("chunks", {}).values())})))
     ans["id"] = message_id
     ans["session_id"] = session_id
 
@@ -71,10 +76,27 @@ def structure_answer(conv, ans, message_id, session_id):
     else:
         conv.message[-1] = {"role": "assistant", "content": ans["answer"], "created_at": time.time(), "id": message_id}
     if conv.reference:
-        conv.reference[-1] = reference
+        if delta is not None:
+            merge_reference_delta(conv.reference[-1], delta)
+        else:
+            conv.reference[-1] = reference
     return ans
 
 
+def merge_reference_delta(reference, delta):
+    """把增量引用合并进保存的 reference，chunks 按序号放置，合并完所有帧后与非增量模式一致"""
+    chunks = reference.setdefault("chunks", [])
+    for i, ck in delta.get("chunks", {}).items():
+        i = int(i)
+        if i >= len(chunks):
+            chunks.extend([None] * (i + 1 - len(chunks)))
+        chunks[i] = ck
+    reference.setdefault("doc_aggs", []).extend(delta.get("doc_aggs", []))
+    if "total" in delta:
+        reference["total"] = delta["total"]
+    return reference
+
+
 def completion(tenant_id, chat_id, question, name="New session", session_id=None, stream=True, **kwargs):
     assert name, "`name` can not be empty."
     dia = DialogService.query(id=chat_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
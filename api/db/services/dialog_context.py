@@ -0,0 +1,136 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Per-process cache of what chat() resolves for a dialog before answering: the model configs,
+the knowledge bases and their field map, and the LLMBundles.
+
+The key holds the dialog id, its update_time and the dialog fields the context is built from,
+plus version stamps in Redis for the tenant and every knowledge base of the dialog. Changing
+tenant LLM settings or a knowledge base bumps its stamp, which makes every context built from
+it unreachable in all processes; the TTL bounds the staleness of changes made behind the API's
+back (e.g. by the management server).
+"""
+import logging
+import os
+import threading
+import time
+
+import xxhash
+from cachetools import TTLCache
+
+from api.db import LLMType
+from api.db.services.knowledgebase_service import KnowledgebaseService
+from api.db.services.llm_service import TenantLLMService, LLMBundle
+from rag.prompts import llm_id2llm_type
+from rag.utils.redis_conn import REDIS_CONN
+
+DIALOG_CONTEXT_CACHE_SIZE = int(os.environ.get("DIALOG_CONTEXT_CACHE_SIZE", 256))
+DIALOG_CONTEXT_CACHE_TTL = int(os.environ.get("DIALOG_CONTEXT_CACHE_TTL", 300))
+CONTEXT_VERSION_TTL = 7 * 24 * 3600
+
+
+def _tenant_version_key(tenant_id):
+    return f"dialog_context_version:tenant:{tenant_id}"
+
+
+def _kb_version_key(kb_id):
+    return f"dialog_context_version:kb:{kb_id}"
+
+
+class DialogContext:
+    """The models and knowledge bases of a dialog, resolved once."""
+
+    def __init__(self, dialog):
+        self.llm_type = LLMType.IMAGE2TEXT if llm_id2llm_type(dialog.llm_id) == "image2text" else LLMType.CHAT
+        self.llm_model_config = TenantLLMService.get_model_config(dialog.tenant_id, self.llm_type, dialog.llm_id)
+        self.max_tokens = self.llm_model_config.get("max_tokens", 8192)
+
+        self.kbs = KnowledgebaseService.get_by_ids(dialog.kb_ids) if dialog.kb_ids else []
+        self.embedding_list = list(set([kb.embd_id for kb in self.kbs]))
+        self.field_map = {}
+        for kb in self.kbs:
+            if kb.parser_config and "field_map" in kb.parser_config:
+                self.field_map.update(kb.parser_config["field_map"])
+
+        self.embd_mdl = None
+        if len(self.embedding_list) == 1:
+            self.embd_mdl = LLMBundle(dialog.tenant_id, LLMType.EMBEDDING, self.embedding_list[0])
+        self.chat_mdl = LLMBundle(dialog.tenant_id, self.llm_type, dialog.llm_id)
+        self.tts_mdl = None
+        if dialog.prompt_config.get("tts"):
+            self.tts_mdl = LLMBundle(dialog.tenant_id, LLMType.TTS)
+        self.rerank_mdl = None
+        if dialog.rerank_id:
+            self.rerank_mdl = LLMBundle(dialog.tenant_id, LLMType.RERANK, dialog.rerank_id)
+
+
+class DialogContextCache:
+    def __init__(self, maxsize=DIALOG_CONTEXT_CACHE_SIZE, ttl=DIALOG_CONTEXT_CACHE_TTL):
+        self.enabled = maxsize > 0 and ttl > 0
+        self.cache = TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 1))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, dialog):
+        kb_ids = sorted(dialog.kb_ids or [])
+        versions = REDIS_CONN.mget([_tenant_version_key(dialog.tenant_id)] + [_kb_version_key(kb_id) for kb_id in kb_ids])
+        hasher = xxhash.xxh64()
+        for v in [dialog.id, getattr(dialog, "update_time", None), dialog.tenant_id, dialog.llm_id, dialog.rerank_id,
+                  bool(dialog.prompt_config.get("tts")), kb_ids, versions]:
+            hasher.update(str(v).encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def get(self, dialog) -> DialogContext:
+        """The resolved context of the dialog, built on a miss. Build errors are raised, not cached."""
+        if not self.enabled:
+            return DialogContext(dialog)
+        k = self.key(dialog)
+        with self.lock:
+            ctx = self.cache.get(k)
+            if ctx is not None:
+                self.hits += 1
+                return ctx
+            self.misses += 1
+        ctx = DialogContext(dialog)
+        with self.lock:
+            self.cache[k] = ctx
+        return ctx
+
+    def _bump(self, keys):
+        stamp = str(time.time_ns())
+        if not REDIS_CONN.set_many({k: stamp for k in keys}, CONTEXT_VERSION_TTL):
+            logging.warning(f"DialogContextCache can't bump {keys}, clear local cache")
+            with self.lock:
+                self.cache.clear()
+
+    def invalidate_tenant(self, tenant_id):
+        """Call when the tenant's LLM settings or default models change."""
+        self._bump([_tenant_version_key(tenant_id)])
+
+    def invalidate_kbs(self, kb_ids):
+        if isinstance(kb_ids, str):
+            kb_ids = [kb_ids]
+        self._bump([_kb_version_key(kb_id) for kb_id in kb_ids])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.,
+                "size": len(self.cache), "maxsize": self.cache.maxsize, "ttl": self.cache.ttl}
+
+
+DIALOG_CONTEXT_CACHE = DialogContextCache()
@@ -16,23 +16,24 @@
 import logging
 import binascii
 import time
-from functools import partial
 import re
 from copy import deepcopy
 from timeit import default_timer as timer
-from agentic_reasoning import DeepResearcher
 from api.db import LLMType, ParserType, StatusEnum
 from api.db.db_models import Dialog, DB
 from api.db.services.common_service import CommonService
+from api.db.services.dialog_context import DIALOG_CONTEXT_CACHE
 from api.db.services.knowledgebase_service import KnowledgebaseService
-from api.db.services.llm_service import TenantLLMService, LLMBundle
+from api.db.services.llm_service import LLMBundle
 from api import settings
 from rag.app.resume import forbidden_select_fields4resume
 from rag.app.tag import label_question
-from rag.nlp.search import index_name
-from rag.prompts import kb_prompt, message_fit_in, llm_id2llm_type, keyword_extraction, full_question, chunks_format, \
+from rag.nlp.search import index_name, CITATION_THRESHOLD, CITATION_THRESHOLD_DECAY, CITATION_THRESHOLD_MIN
+from rag.prompts import kb_prompt, message_fit_in, keyword_extraction, full_question, chunks_format, \
     citation_prompt
 from rag.utils import rmSpace, num_tokens_from_string
+from rag.utils.retrieval_fanout import RetrievalFanout, RETRIEVAL_KB_DEADLINE_MS, RETRIEVAL_WEB_DEADLINE_MS, \
+    RETRIEVAL_KG_DEADLINE_MS
 from rag.utils.tavily_conn import Tavily
 
 
@@ -63,15 +64,11 @@ class DialogService(CommonService):
 
 
 def chat_solo(dialog, messages, stream=True):
-    if llm_id2llm_type(dialog.llm_id) == "image2text":
-        chat_mdl = LLMBundle(dialog.tenant_id, LLMType.IMAGE2TEXT, dialog.llm_id)
-    else:
-        chat_mdl = LLMBundle(dialog.tenant_id, LLMType.CHAT, dialog.llm_id)
+    ctx = DIALOG_CONTEXT_CACHE.get(dialog)
+    chat_mdl = ctx.chat_mdl
 
     prompt_config = dialog.prompt_config
-    tts_mdl = None
-    if prompt_config.get("tts"):
-        tts_mdl = LLMBundle(dialog.tenant_id, LLMType.TTS)
+    tts_mdl = ctx.tts_mdl
     msg = [{"role": m["role"], "content": re.sub(r"##\d+\$\$", "", m["content"])}
            for m in messages if m["role"] != "system"]
     if stream:
@@ -92,6 +89,129 @@ def chat_solo(dialog, messages, stream=True):
         yield {"answer": answer, "reference": {}, "audio_binary": tts(tts_mdl, answer), "prompt": "", "created_at": time.time()}
 
 
+class IncrementalCitation:
+    """
+    Cites a streamed answer sentence by sentence, so the ##i$$ markers and the chunks they
+    point to go out in the same frame as the text, instead of all at once in the last frame.
+
+    The answer is cut into the pieces insert_citations would cut the whole answer into, and a
+    piece is scored as soon as it is complete (an open code block waits for its closing fence).
+    A piece reaching CITATION_THRESHOLD is cited at once; the decaying threshold only applies
+    when no piece of the whole answer reaches it, which is known at the end, so finish() does it.
+    Once the LLM writes ##i$$ markers itself nothing more is computed and the markers sent so
+    far are dropped from the next frames, since the full answer would not be cited either; the
+    chunks they pointed to stay in the reference.
+    """
+    SENTENCE_END = re.compile(r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])")
+
+    def __init__(self, retriever, kbinfos, embd_mdl, tkweight=0.1, vtweight=0.9):
+        self.retriever = retriever
+        self.kbinfos = kbinfos
+        self.embd_mdl = embd_mdl
+        self.tkweight = tkweight
+        self.vtweight = vtweight
+        self.chunks = [ck["content_ltks"] for ck in kbinfos["chunks"]]
+        self.chunk_v = [ck["vector"] for ck in kbinfos["chunks"]]
+        self.chunks_tks = None
+        self.pieces = []  # pieces of the answer cited so far
+        self.scores = {}  # piece index -> (similarities, score) of the pieces long enough to cite
+        self.cites = {}  # piece index -> chunk indices
+        self.done = 0  # length of the answer covered by self.pieces
+        self.llm_cited = False
+        self.sent_chunks = set()
+        self.sent_docs = set()
+
+    def _completed(self, answer):
+        tail = answer[self.done:]
+        fences = [m.start() for m in re.finditer("```", tail)]
+        if len(fences) % 2:
+            tail = tail[:fences[-1]]
+        end = 0
+        for m in self.SENTENCE_END.finditer(tail):
+            end = m.end()
+        return self.done + end
+
+    def _advance(self, answer, final=False):
+        if re.search(r"##[0-9]+\$\$", answer):
+            self.llm_cited = True
+        end = len(answer) if final else self._completed(answer)
+        if end <= self.done:
+            return
+        base = len(self.pieces)
+        self.pieces.extend(self.retriever.split_citation_pieces(answer[self.done:end]))
+        self.done = end
+        idx = [i for i in range(base, len(self.pieces)) if len(self.pieces[i]) >= 5]
+        if not idx or not self.chunks or self.llm_cited:
+            return
+        if self.chunks_tks is None:
+            self.chunks_tks = self.retriever.citation_tokens(self.chunks)
+        sims, mxs = self.retriever.citation_similarities([self.pieces[i] for i in idx], self.chunks, self.chunk_v,
+                                                         self.embd_mdl, self.tkweight, self.vtweight, self.chunks_tks)
+        for i, sim, mx in zip(idx, sims, mxs):
+            self.scores[i] = (sim, mx)
+            if mx >= CITATION_THRESHOLD:
+                self.cites[i] = self.retriever.cite_piece(sim, mx)
+
+    def _render(self, answer):
+        res, _ = self.retriever.render_citations(self.pieces, {} if self.llm_cited else self.cites)
+        return res + answer[self.done:]
+
+    def _cited(self, answer):
+        idx = set([])
+        for r in re.finditer(r"##([0-9]+)\$\$", answer):
+            i = int(r.group(1))
+            if i < len(self.kbinfos["chunks"]):
+                idx.add(i)
+        return idx
+
+    def _delta(self, chunk_indices, docs):
+        chunks = {}
+        for i in sorted(chunk_indices):
+            ck = deepcopy(self.kbinfos["chunks"][i])
+            if ck.get("vector"):
+                del ck["vector"]
+            chunks[str(i)] = ck
+        self.sent_chunks.update(chunk_indices)
+        doc_aggs = [d for d in docs if d["doc_id"] not in self.sent_docs]
+        self.sent_docs.update([d["doc_id"] for d in doc_aggs])
+        return {"chunks": chunks, "doc_aggs": doc_aggs}
+
+    def feed(self, answer):
+        """Cite the newly completed sentences of the answer so far -> (answer with markers, reference delta)."""
+        think = ""
+        ans = answer.split("</think>")
+        if len(ans) == 2:
+            think = ans[0] + "</think>"
+            answer = ans[1]
+        elif "<think>" in answer:
+            return answer, {"chunks": {}, "doc_aggs": []}
+        answer = re.sub(r"##[ij]\$\$", "", answer, flags=re.DOTALL)
+        self._advance(answer)
+        answer = self._render(answer)
+        new = self._cited(answer) - self.sent_chunks
+        doc_ids = set([self.kbinfos["chunks"][i]["doc_id"] for i in new])
+        return think + answer, self._delta(new, [d for d in self.kbinfos["doc_aggs"] if d["doc_id"] in doc_ids])
+
+    def finish(self, answer):
+        """Cite the rest of the (think-stripped) answer -> (answer with markers, cited chunk indices)."""
+        self._advance(answer, final=True)
+        if not self.cites and not self.llm_cited:
+            thr = CITATION_THRESHOLD
+            while thr > CITATION_THRESHOLD_MIN and not self.cites:
+                for i, (sim, mx) in self.scores.items():
+                    if mx >= thr:
+                        self.cites[i] = self.retriever.cite_piece(sim, mx)
+                thr *= CITATION_THRESHOLD_DECAY
+        answer = self._render(answer)
+        return answer, self._cited(answer)
+
+    def final_delta(self, recall_docs):
+        """Everything of the reference not sent yet, so merging all deltas gives the full reference."""
+        delta = self._delta(set(range(len(self.kbinfos["chunks"]))) - self.sent_chunks, recall_docs)
+        delta["total"] = self.kbinfos.get("total", 0)
+        return delta
+
+
 def chat(dialog, messages, stream=True, **kwargs):
     assert messages[-1]["role"] == "user", "The last content of this conversation is not from user."
     if not dialog.kb_ids:
@@ -101,17 +221,14 @@ def chat(dialog, messages, stream=True, **kwargs):
 
     chat_start_ts = timer()
 
-    if llm_id2llm_type(dialog.llm_id) == "image2text":
-        llm_model_config = TenantLLMService.get_model_config(dialog.tenant_id, LLMType.IMAGE2TEXT, dialog.llm_id)
-    else:
-        llm_model_config = TenantLLMService.get_model_config(dialog.tenant_id, LLMType.CHAT, dialog.llm_id)
-
-    max_tokens = llm_model_config.get("max_tokens", 8192)
+    # 模型配置、知识库信息和 LLMBundle 按对话缓存，对话、知识库或租户模型设置变更后失效
+    ctx = DIALOG_CONTEXT_CACHE.get(dialog)
+    max_tokens = ctx.max_tokens
 
     check_llm_ts = timer()
 
-    kbs = KnowledgebaseService.get_by_ids(dialog.kb_ids)
-    embedding_list = list(set([kb.embd_id for kb in kbs]))
+    kbs = ctx.kbs
+    embedding_list = ctx.embedding_list
     if len(embedding_list) != 1:
         yield {"answer": "**ERROR**: Knowledge bases use different embedding models.", "reference": []}
         return {"answer": "**ERROR**: Knowledge bases use different embedding models.", "reference": []}
@@ -127,24 +244,19 @@ def chat(dialog, messages, stream=True, **kwargs):
 
     create_retriever_ts = timer()
 
-    embd_mdl = LLMBundle(dialog.tenant_id, LLMType.EMBEDDING, embedding_model_name)
+    embd_mdl = ctx.embd_mdl
     if not embd_mdl:
         raise LookupError("Embedding model(%s) not found" % embedding_model_name)
 
     bind_embedding_ts = timer()
 
-    if llm_id2llm_type(dialog.llm_id) == "image2text":
-        chat_mdl = LLMBundle(dialog.tenant_id, LLMType.IMAGE2TEXT, dialog.llm_id)
-    else:
-        chat_mdl = LLMBundle(dialog.tenant_id, LLMType.CHAT, dialog.llm_id)
+    chat_mdl = ctx.chat_mdl
 
     bind_llm_ts = timer()
 
     prompt_config = dialog.prompt_config
-    field_map = KnowledgebaseService.get_field_map(dialog.kb_ids)
-    tts_mdl = None
-    if prompt_config.get("tts"):
-        tts_mdl = LLMBundle(dialog.tenant_id, LLMType.TTS)
+    field_map = ctx.field_map
+    tts_mdl = ctx.tts_mdl
     # try to use sql if field mapping is good to go
     if field_map:
         logging.debug("Use SQL to retrieval:{}".format(questions[-1]))
@@ -171,14 +283,13 @@ def chat(dialog, messages, stream=True, **kwargs):
 
     refine_question_ts = timer()
 
-    rerank_mdl = None
-    if dialog.rerank_id:
-        rerank_mdl = LLMBundle(dialog.tenant_id, LLMType.RERANK, dialog.rerank_id)
+    rerank_mdl = ctx.rerank_mdl
 
     bind_reranker_ts = timer()
     generate_keyword_ts = bind_reranker_ts
     thought = ""
     kbinfos = {"total": 0, "chunks": [], "doc_aggs": []}
+    fanout = RetrievalFanout()
 
     if "knowledge" not in [p["key"] for p in prompt_config["parameters"]]:
         knowledges = []
@@ -191,48 +302,34 @@ def chat(dialog, messages, stream=True, **kwargs):
 
         knowledges = []
         
-        # 不再使用推理
-        # if prompt_config.get("reasoning", False):
-        #     reasoner = DeepResearcher(chat_mdl,
-        #                               prompt_config,
-        #                               partial(retriever.retrieval, embd_mdl=embd_mdl, tenant_ids=tenant_ids, kb_ids=dialog.kb_ids, page=1, page_size=dialog.top_n, similarity_threshold=0.2, vector_similarity_weight=0.3))
-
-        #     for think in reasoner.thinking(kbinfos, " ".join(questions)):
-        #         if isinstance(think, str):
-        #             thought = think
-        #             knowledges = [t for t in think.split("\n") if t]
-        #         elif stream:
-        #             yield think
-        # else:
-        #     kbinfos = retriever.retrieval(" ".join(questions), embd_mdl, tenant_ids, dialog.kb_ids, 1, dialog.top_n,
-        #                                   dialog.similarity_threshold,
-        #                                   dialog.vector_similarity_weight,
-        #                                   doc_ids=attachments,
-        #                                   top=dialog.top_k, aggs=False, rerank_mdl=rerank_mdl,
-        #                                   rank_feature=label_question(" ".join(questions), kbs)
-        #                                   )
-        #     if prompt_config.get("tavily_api_key"):
-        #         tav = Tavily(prompt_config["tavily_api_key"])
-        #         tav_res = tav.retrieve_chunks(" ".join(questions))
-        #         kbinfos["chunks"].extend(tav_res["chunks"])
-        #         kbinfos["doc_aggs"].extend(tav_res["doc_aggs"])
-        #     if prompt_config.get("use_kg"):
-        #         ck = settings.kg_retrievaler.retrieval(" ".join(questions),
-        #                                                tenant_ids,
-        #                                                dialog.kb_ids,
-        #                                                embd_mdl,
-        #                                                LLMBundle(dialog.tenant_id, LLMType.CHAT))
-        #         if ck["content_with_weight"]:
-        #             kbinfos["chunks"].insert(0, ck)
-
-        #     knowledges = kb_prompt(kbinfos, max_tokens)
-        kbinfos = retriever.retrieval(" ".join(questions), embd_mdl, tenant_ids, dialog.kb_ids, 1, dialog.top_n,
-                                        dialog.similarity_threshold,
-                                        dialog.vector_similarity_weight,
-                                        doc_ids=attachments,
-                                        top=dialog.top_k, aggs=False, rerank_mdl=rerank_mdl,
-                                        rank_feature=label_question(" ".join(questions), kbs)
-                                        )
+        # 知识库、网络搜索、知识图谱并发检索，有截止时间的来源超时即丢弃
+        question = " ".join(questions)
+
+        def kb_retrieval():
+            return retriever.retrieval(question, embd_mdl, tenant_ids, dialog.kb_ids, 1, dialog.top_n,
+                                       dialog.similarity_threshold,
+                                       dialog.vector_similarity_weight,
+                                       doc_ids=attachments,
+                                       top=dialog.top_k, aggs=False, rerank_mdl=rerank_mdl,
+                                       rank_feature=label_question(question, kbs)
+                                       )
+
+        fanout.add("Knowledge base", kb_retrieval, deadline_ms=RETRIEVAL_KB_DEADLINE_MS)
+        if prompt_config.get("tavily_api_key"):
+            fanout.add("Web search", lambda: Tavily(prompt_config["tavily_api_key"]).retrieve_chunks(question),
+                       deadline_ms=RETRIEVAL_WEB_DEADLINE_MS)
+        if prompt_config.get("use_kg"):
+            fanout.add("Knowledge graph", settings.kg_retrievaler.retrieval, question, tenant_ids, dialog.kb_ids,
+                       embd_mdl, LLMBundle(dialog.tenant_id, LLMType.CHAT), deadline_ms=RETRIEVAL_KG_DEADLINE_MS)
+        results = fanout.run()
+
+        # 按固定顺序合并，与来源返回的先后无关
+        kbinfos = results.get("Knowledge base", kbinfos)
+        if results.get("Web search"):
+            kbinfos["chunks"].extend(results["Web search"]["chunks"])
+            kbinfos["doc_aggs"].extend(results["Web search"]["doc_aggs"])
+        if results.get("Knowledge graph") and results["Knowledge graph"]["content_with_weight"]:
+            kbinfos["chunks"].insert(0, results["Knowledge graph"])
         knowledges = kb_prompt(kbinfos, max_tokens)
 
     logging.debug(
@@ -267,6 +364,7 @@ def chat(dialog, messages, stream=True, **kwargs):
         nonlocal prompt_config, knowledges, kwargs, kbinfos, prompt, retrieval_ts, questions
 
         refs = []
+        reference_delta = None
         image_markdowns = [] # 用于存储图片的 Markdown 字符串
         ans = answer.split("</think>")
         think = ""
@@ -276,7 +374,11 @@ def chat(dialog, messages, stream=True, **kwargs):
         if knowledges and (prompt_config.get("quote", True) and kwargs.get("quote", True)):
             answer = re.sub(r"##[ij]\$\$", "", answer, flags=re.DOTALL)
             cited_chunk_indices = set() # 用于存储被引用的 chunk 索引
-            if not re.search(r"##[0-9]+\$\$", answer):
+            if citer:
+                # 流式逐句引用：剩余部分在这里补齐
+                answer, idx = citer.finish(answer)
+                cited_chunk_indices = idx
+            elif not re.search(r"##[0-9]+\$\$", answer):
                 answer, idx = retriever.insert_citations(answer,
                                                          [ck["content_ltks"]
                                                           for ck in kbinfos["chunks"]],
@@ -321,10 +423,14 @@ def chat(dialog, messages, stream=True, **kwargs):
                 recall_docs = kbinfos["doc_aggs"]
             kbinfos["doc_aggs"] = recall_docs
 
-            refs = deepcopy(kbinfos)
-            for c in refs["chunks"]:
-                if c.get("vector"):
-                    del c["vector"]
+            if citer:
+                # 之前的帧已经发送过的引用不再重复，最后一帧只携带剩余部分
+                reference_delta = citer.final_delta(recall_docs)
+            else:
+                refs = deepcopy(kbinfos)
+                for c in refs["chunks"]:
+                    if c.get("vector"):
+                        del c["vector"]
         
         # 将图片的 Markdown 字符串追加到回答末尾
         if image_markdowns:
@@ -345,9 +451,29 @@ def chat(dialog, messages, stream=True, **kwargs):
         retrieval_time_cost = (retrieval_ts - generate_keyword_ts) * 1000
         generate_result_time_cost = (finish_chat_ts - retrieval_ts) * 1000
 
+        retrieval_sources = "".join(line + "\n" for line in fanout.timing_lines())
         prompt += "\n\n### Query:\n%s" % " ".join(questions)
-        prompt = f"{prompt}\n\n - Total: {total_time_cost:.1f}ms\n  - Check LLM: {check_llm_time_cost:.1f}ms\n  - Create retriever: {create_retriever_time_cost:.1f}ms\n  - Bind embedding: {bind_embedding_time_cost:.1f}ms\n  - Bind LLM: {bind_llm_time_cost:.1f}ms\n  - Tune question: {refine_question_time_cost:.1f}ms\n  - Bind reranker: {bind_reranker_time_cost:.1f}ms\n  - Generate keyword: {generate_keyword_time_cost:.1f}ms\n  - Retrieval: {retrieval_time_cost:.1f}ms\n  - Generate answer: {generate_result_time_cost:.1f}ms"
-        return {"answer": think+answer, "reference": refs, "prompt": re.sub(r"\n", "  \n", prompt), "created_at": time.time()}
+        prompt = f"{prompt}\n\n - Total: {total_time_cost:.1f}ms\n  - Check LLM: {check_llm_time_cost:.1f}ms\n  - Create retriever: {create_retriever_time_cost:.1f}ms\n  - Bind embedding: {bind_embedding_time_cost:.1f}ms\n  - Bind LLM: {bind_llm_time_cost:.1f}ms\n  - Tune question: {refine_question_time_cost:.1f}ms\n  - Bind reranker: {bind_reranker_time_cost:.1f}ms\n  - Generate keyword: {generate_keyword_time_cost:.1f}ms\n  - Retrieval: {retrieval_time_cost:.1f}ms\n{retrieval_sources}  - Generate answer: {generate_result_time_cost:.1f}ms"
+        res = {"answer": think+answer, "reference": refs, "prompt": re.sub(r"\n", "  \n", prompt), "created_at": time.time()}
+        if reference_delta is not None:
+            res["reference"] = {}
+            res["reference_delta"] = reference_delta
+        return res
+
+    citer = None
+    if stream and kwargs.get("incremental_citation") and knowledges and \
+            (prompt_config.get("quote", True) and kwargs.get("quote", True)):
+        # 增量引用：每句话完成后立即计算引用，引用标记与对应的 reference 增量在同一帧发送
+        citer = IncrementalCitation(retriever, kbinfos, embd_mdl,
+                                    tkweight=1 - dialog.vector_similarity_weight,
+                                    vtweight=dialog.vector_similarity_weight)
+
+    def stream_frame(answer, delta_ans):
+        frame = {"answer": thought+answer, "reference": {}, "audio_binary": tts(tts_mdl, delta_ans)}
+        if citer:
+            cited, frame["reference_delta"] = citer.feed(answer)
+            frame["answer"] = thought+cited
+        return frame
 
     if stream:
         last_ans = "" # 记录上一次返回的完整回答
@@ -364,10 +490,10 @@ def chat(dialog, messages, stream=True, **kwargs):
                 continue
             last_ans = answer
             # 返回当前累计回答(包含思考过程)+新增片段)
-            yield {"answer": thought+answer, "reference": {}, "audio_binary": tts(tts_mdl, delta_ans)}
+            yield stream_frame(answer, delta_ans)
         delta_ans = answer[len(last_ans):]
         if delta_ans:
-            yield {"answer": thought+answer, "reference": {}, "audio_binary": tts(tts_mdl, delta_ans)}
+            yield stream_frame(answer, delta_ans)
         yield decorate_answer(thought+answer)
     else:
         answer = chat_mdl.chat(prompt+prompt4citation, msg[1:], gen_conf)
@@ -30,6 +30,7 @@ from api.db.db_utils import bulk_insert_into_db
 from api import settings
 from api.utils import current_timestamp, get_format_time, get_uuid
 from rag.settings import SVR_QUEUE_NAME
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
 from rag.utils.storage_factory import STORAGE_IMPL
 from rag.nlp import search, rag_tokenizer
 
@@ -102,12 +103,23 @@ class DocumentService(CommonService):
             raise RuntimeError("Database error (Knowledgebase)!")
         return Document(**doc)
 
+    @classmethod
+    def delete_chunks(cls, condition, tenant_id, kb_id):
+        """
+        Delete the chunks of the knowledge base matching condition from the doc store.
+        The cached retrievals of the knowledge base are invalidated after the delete, so a
+        retrieval running in between can't keep the deleted chunks cached.
+        """
+        res = settings.docStoreConn.delete(condition, search.index_name(tenant_id), kb_id)
+        RETRIEVAL_CACHE.invalidate(kb_id)
+        return res
+
     @classmethod
     @DB.connection_context()
     def remove_document(cls, doc, tenant_id):
         cls.clear_chunk_num(doc.id)
         try:
-            settings.docStoreConn.delete({"doc_id": doc.id}, search.index_name(tenant_id), doc.kb_id)
+            cls.delete_chunks({"doc_id": doc.id}, tenant_id, doc.kb_id)
             settings.docStoreConn.update({"kb_id": doc.kb_id, "knowledge_graph_kwd": ["entity", "relation", "graph", "community_report"], "source_id": doc.id},
                                          {"remove": {"source_id": doc.id}},
                                          search.index_name(tenant_id), doc.kb_id)
@@ -118,6 +130,8 @@ class DocumentService(CommonService):
                                          search.index_name(tenant_id), doc.kb_id)
         except Exception:
             pass
+        # the knowledge graph chunks changed after the first invalidation
+        RETRIEVAL_CACHE.invalidate(doc.kb_id)
         return cls.delete_by_id(doc.id)
 
     @classmethod
@@ -178,6 +192,7 @@ class DocumentService(CommonService):
             chunk_num=Knowledgebase.chunk_num +
                       chunk_num).where(
             Knowledgebase.id == kb_id).execute()
+        RETRIEVAL_CACHE.invalidate(kb_id)
         return num
 
     @classmethod
@@ -197,6 +212,7 @@ class DocumentService(CommonService):
                       chunk_num
         ).where(
             Knowledgebase.id == kb_id).execute()
+        RETRIEVAL_CACHE.invalidate(kb_id)
         return num
 
     @classmethod
@@ -213,6 +229,7 @@ class DocumentService(CommonService):
             doc_num=Knowledgebase.doc_num - 1
         ).where(
             Knowledgebase.id == doc.kb_id).execute()
+        RETRIEVAL_CACHE.invalidate(doc.kb_id)
         return num
 
     @classmethod
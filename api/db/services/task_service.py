@@ -20,7 +20,7 @@ from datetime import datetime
 
 from api.db.db_utils import bulk_insert_into_db
 from deepdoc.parser import PdfParser
-from peewee import JOIN
+from peewee import JOIN, Case
 from api.db.db_models import DB, File2Document, File
 from api.db import StatusEnum, FileType, TaskStatus
 from api.db.db_models import Task, Document, Knowledgebase, Tenant
@@ -31,8 +31,6 @@ from deepdoc.parser.excel_parser import RAGFlowExcelParser
 from rag.settings import SVR_QUEUE_NAME
 from rag.utils.storage_factory import STORAGE_IMPL
 from rag.utils.redis_conn import REDIS_CONN
-from api import settings
-from rag.nlp import search
 
 
 def trim_header_by_lines(text: str, max_length) -> str:
@@ -172,9 +170,15 @@ class TaskService(CommonService):
     @classmethod
     @DB.connection_context()
     def do_cancel(cls, id):
+        return cls.cancel_state(id)[1]
+
+    @classmethod
+    @DB.connection_context()
+    def cancel_state(cls, id):
+        """Return (doc_id, canceled) of the task."""
         task = cls.model.get_by_id(id)
         _, doc = DocumentService.get_by_id(task.doc_id)
-        return doc.run == TaskStatus.CANCEL.value or doc.progress < 0
+        return task.doc_id, doc.run == TaskStatus.CANCEL.value or doc.progress < 0
 
     @classmethod
     @DB.connection_context()
@@ -200,6 +204,35 @@ class TaskService(CommonService):
                     cls.model.id == id
                 ).execute()
 
+    @classmethod
+    @DB.connection_context()
+    def update_progress_many(cls, infos: dict):
+        """
+        Same as update_progress for several tasks at once: {task_id: {"progress_msg": str, "progress": float}}.
+        Reads the current messages with one SELECT and writes all tasks with one UPDATE.
+        """
+        def apply():
+            msgs = {id: info["progress_msg"] for id, info in infos.items() if info.get("progress_msg")}
+            olds = {}
+            if msgs:
+                olds = {t.id: t.progress_msg or "" for t in
+                        cls.model.select(cls.model.id, cls.model.progress_msg).where(cls.model.id.in_(list(msgs)))}
+            new_msgs = [(id, trim_header_by_lines(olds[id] + "\n" + msg, 3000)) for id, msg in msgs.items() if id in olds]
+            progs = [(id, info["progress"]) for id, info in infos.items() if "progress" in info]
+            fields = {}
+            if new_msgs:
+                fields[cls.model.progress_msg] = Case(cls.model.id, new_msgs, cls.model.progress_msg)
+            if progs:
+                fields[cls.model.progress] = Case(cls.model.id, progs, cls.model.progress)
+            if fields:
+                cls.model.update(fields).where(cls.model.id.in_(list(infos))).execute()
+
+        if os.environ.get("MACOS"):
+            apply()
+            return
+        with DB.lock("update_progress", -1):
+            apply()
+
 
 def queue_tasks(doc: dict, bucket: str, name: str):
     """
@@ -321,8 +354,7 @@ def queue_tasks(doc: dict, bucket: str, name: str):
                 chunk_ids.extend(task["chunk_ids"].split())
         # 从文档存储中删除这些块
         if chunk_ids:
-            settings.docStoreConn.delete({"id": chunk_ids}, search.index_name(chunking_config["tenant_id"]),
-                                         chunking_config["kb_id"])
+            DocumentService.delete_chunks({"id": chunk_ids}, chunking_config["tenant_id"], chunking_config["kb_id"])
     # 更新文档的块数量
     DocumentService.update_by_id(doc["id"], {"chunk_num": ck_num})
 
@@ -20,6 +20,7 @@ import random
 from timeit import default_timer as timer
 import sys
 import threading
+from collections import OrderedDict
 
 import xgboost as xgb
 from io import BytesIO
@@ -31,7 +32,7 @@ from pypdf import PdfReader as pdf2_read
 
 from api import settings
 from api.utils.file_utils import get_project_base_directory
-from deepdoc.vision import OCR, Recognizer, LayoutRecognizer, TableStructureRecognizer
+from deepdoc.vision import OCR, OCRPool, BoxIndex, Recognizer, LayoutRecognizer, TableStructureRecognizer
 from rag.nlp import rag_tokenizer
 from copy import deepcopy
 from huggingface_hub import snapshot_download
@@ -40,6 +41,188 @@ LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
+# 流式渲染窗口：>0 时按页渲染、OCR 并释放页面图像，最多同时保留该数量的页面；0 表示一次性渲染全部页面
+PDF_STREAMING_WINDOW = int(os.environ.get("PDF_STREAMING_WINDOW", 0))
+# 跨页累积的待识别文本框数量，达到后统一送入文本识别
+OCR_RECOGNIZE_BATCH = int(os.environ.get("OCR_RECOGNIZE_BATCH", 128))
+
+
+class PdfPageImage:
+    """
+    单个页面图像的惰性代理
+
+    尺寸在首次渲染后缓存，访问尺寸不会保留图像；crop、np.array 及其他 PIL 方法按需从所属的
+    PdfPageImages 渲染（窗口内命中则直接复用）。
+    """
+
+    def __init__(self, pages, idx):
+        self._pages = pages
+        self._idx = idx
+
+    @property
+    def size(self):
+        return self._pages.size(self._idx)
+
+    def image(self):
+        return self._pages.render(self._idx)
+
+    def crop(self, box):
+        return self.image().crop(box)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = np.asarray(self.image())
+        return arr.astype(dtype) if dtype is not None else arr
+
+    def __deepcopy__(self, memo):
+        return deepcopy(self.image(), memo)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.image(), name)
+
+
+class PdfPageImages:
+    """
+    按需渲染页面图像的只读序列，接口与原来的 page_images 列表一致
+
+    只有渲染时才持有 pdfplumber 全局锁；渲染结果放在大小为 window 的 LRU 中，
+    超出窗口的页面被释放，再次访问（如表格、图片裁剪）时重新渲染。
+    """
+
+    def __init__(self, fnm, zoomin, page_from, page_to, window):
+        self.fnm = fnm
+        self.zoomin = zoomin
+        self.page_from = page_from
+        self.window = max(1, window)
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.renders = 0
+        with sys.modules[LOCK_KEY_pdfplumber]:
+            self.pdf = pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))
+            self.sizes = [None] * len(self.pdf.pages[page_from:page_to])
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("page image index out of range")
+        return PdfPageImage(self, idx)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def size(self, idx):
+        if self.sizes[idx] is None:
+            self.render(idx)
+        return self.sizes[idx]
+
+    def render(self, idx):
+        with self.lock:
+            if idx in self.cache:
+                self.cache.move_to_end(idx)
+                return self.cache[idx]
+        with sys.modules[LOCK_KEY_pdfplumber]:
+            img = self.pdf.pages[self.page_from + idx].to_image(resolution=72 * self.zoomin).annotated
+        with self.lock:
+            self.renders += 1
+            self.sizes[idx] = img.size
+            self.cache[idx] = img
+            while len(self.cache) > self.window:
+                self.cache.popitem(last=False)
+        return img
+
+    def release(self):
+        with self.lock:
+            self.cache.clear()
+
+    def close(self):
+        self.release()
+        try:
+            self.pdf.close()
+        except Exception:
+            pass
+
+
+def _ocr_detect_page(ocr, pagenum, img, chars, ZM, mean_height):
+    """
+    单页 OCR 的检测阶段：检测文本框并合并 PDF 字符，没有字符的文本框带上裁剪图 box_image 等待识别
+
+    模块级函数，以便 OCRPool 在工作进程中调用。
+    返回 (文本框列表，未检测到文本框时为 None, 未匹配的字符)
+    """
+    lefted_chars = []
+    img_np = np.array(img)
+    start = timer()
+    bxs = ocr.detect(img_np)
+    logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
+
+    start = timer()
+    if not bxs:
+        return None, lefted_chars
+    bxs = [(line[0], line[1][0]) for line in bxs]
+    bxs = Recognizer.sort_Y_firstly(
+        [{"x0": b[0][0] / ZM, "x1": b[1][0] / ZM,
+          "top": b[0][1] / ZM, "text": "", "txt": t,
+          "bottom": b[-1][1] / ZM,
+          "page_number": pagenum} for b, t in bxs if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]],
+        mean_height / 3
+    )
+    
+    # merge chars in the same rect
+    bxs_index = BoxIndex(bxs)
+    for c in Recognizer.sort_Y_firstly(
+            chars, mean_height // 4):
+        ii = bxs_index.find_overlapped(c)
+        if ii is None:
+            lefted_chars.append(c)
+            continue
+        ch = c["bottom"] - c["top"]
+        bh = bxs[ii]["bottom"] - bxs[ii]["top"]
+        if abs(ch - bh) / max(ch, bh) >= 0.7 and c["text"] != ' ':
+            lefted_chars.append(c)
+            continue
+        if c["text"] == " " and bxs[ii]["text"]:
+            if re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", bxs[ii]["text"][-1]):
+                bxs[ii]["text"] += " "
+        else:
+            bxs[ii]["text"] += c["text"]
+
+    logging.info(f"__ocr sorting {len(chars)} chars cost {timer() - start}s")
+    for b in bxs:
+        if not b["text"]:
+            left, right, top, bott = b["x0"] * ZM, b["x1"] * \
+                                     ZM, b["top"] * ZM, b["bottom"] * ZM
+            b["box_image"] = ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
+        del b["txt"]
+    return bxs, lefted_chars
+
+
+def _ocr_finish_page(bxs, texts, mean_height):
+    """
+    单页 OCR 的收尾阶段：把识别结果 texts 按顺序写回带 box_image 的文本框，去掉空文本框
+
+    返回 (文本框列表, 该页字符中位高度)
+    """
+    if bxs is None:
+        return [], mean_height
+    boxes_to_reg = [b for b in bxs if "box_image" in b]
+    for i in range(len(boxes_to_reg)):
+        boxes_to_reg[i]["text"] = texts[i]
+        del boxes_to_reg[i]["box_image"]
+    bxs = [b for b in bxs if b["text"]]
+    if mean_height == 0:
+        mean_height = np.median([b["bottom"] - b["top"]
+                                 for b in bxs])
+    return bxs, mean_height
+
+
 class RAGFlowPdfParser:
     def __init__(self):
         """
@@ -238,10 +421,13 @@ class RAGFlowPdfParser:
                     pg.append(it)
             self.tb_cpns.extend(pg)
 
+        # 所有表格组件都与同一批文本框比较面积，索引只建一次
+        boxes_index = BoxIndex(self.boxes)
+
         def gather(kwd, fzy=10, ption=0.6):
             eles = Recognizer.sort_Y_firstly(
                 [r for r in self.tb_cpns if re.match(kwd, r["label"])], fzy)
-            eles = Recognizer.layouts_cleanup(self.boxes, eles, 5, ption)
+            eles = Recognizer.layouts_cleanup(boxes_index, eles, 5, ption)
             return Recognizer.sort_Y_firstly(eles, 0)
 
         # add R,H,C,SP tag to boxes within table layout
@@ -250,18 +436,20 @@ class RAGFlowPdfParser:
         spans = gather(r".*spanning")
         clmns = sorted([r for r in self.tb_cpns if re.match(
             r"table column$", r["label"])], key=lambda x: (x["pn"], x["layoutno"], x["x0"]))
-        clmns = Recognizer.layouts_cleanup(self.boxes, clmns, 5, 0.5)
+        clmns = Recognizer.layouts_cleanup(boxes_index, clmns, 5, 0.5)
+        rows_index, headers_index, clmns_index, spans_index = \
+            BoxIndex(rows), BoxIndex(headers), BoxIndex(clmns), BoxIndex(spans)
         for b in self.boxes:
             if b.get("layout_type", "") != "table":
                 continue
-            ii = Recognizer.find_overlapped_with_threashold(b, rows, thr=0.3)
+            ii = rows_index.find_overlapped_with_threashold(b, thr=0.3)
             if ii is not None:
                 b["R"] = ii
                 b["R_top"] = rows[ii]["top"]
                 b["R_bott"] = rows[ii]["bottom"]
 
-            ii = Recognizer.find_overlapped_with_threashold(
-                b, headers, thr=0.3)
+            ii = headers_index.find_overlapped_with_threashold(
+                b, thr=0.3)
             if ii is not None:
                 b["H_top"] = headers[ii]["top"]
                 b["H_bott"] = headers[ii]["bottom"]
@@ -269,13 +457,13 @@ class RAGFlowPdfParser:
                 b["H_right"] = headers[ii]["x1"]
                 b["H"] = ii
 
-            ii = Recognizer.find_horizontally_tightest_fit(b, clmns)
+            ii = clmns_index.find_horizontally_tightest_fit(b)
             if ii is not None:
                 b["C"] = ii
                 b["C_left"] = clmns[ii]["x0"]
                 b["C_right"] = clmns[ii]["x1"]
 
-            ii = Recognizer.find_overlapped_with_threashold(b, spans, thr=0.3)
+            ii = spans_index.find_overlapped_with_threashold(b, thr=0.3)
             if ii is not None:
                 b["H_top"] = spans[ii]["top"]
                 b["H_bott"] = spans[ii]["bottom"]
@@ -283,82 +471,6 @@ class RAGFlowPdfParser:
                 b["H_right"] = spans[ii]["x1"]
                 b["SP"] = ii
 
-    def __ocr(self, pagenum, img, chars, ZM=3):
-        """
-        对PDF页面图像进行OCR处理，识别文本内容并合并PDF提取的字符
-        
-        该方法完成以下任务：
-        1. 使用OCR模型检测图像中的文本框
-        2. 将PDF提取的字符与OCR检测的文本框匹配合并
-        3. 对没有文本的框进行文本识别
-        4. 计算文本高度统计信息
-        
-        参数:
-            pagenum: 当前处理的页码
-            img: 页面图像对象
-            chars: 从PDF中提取的字符列表
-            ZM: 缩放因子，用于坐标转换
-            
-        返回:
-            无直接返回值，但会更新self.boxes列表
-        """
-        start = timer()
-        bxs = self.ocr.detect(np.array(img))
-        logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
-
-        start = timer()
-        if not bxs:
-            self.boxes.append([])
-            return
-        bxs = [(line[0], line[1][0]) for line in bxs]
-        bxs = Recognizer.sort_Y_firstly(
-            [{"x0": b[0][0] / ZM, "x1": b[1][0] / ZM,
-              "top": b[0][1] / ZM, "text": "", "txt": t,
-              "bottom": b[-1][1] / ZM,
-              "page_number": pagenum} for b, t in bxs if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]],
-            self.mean_height[-1] / 3
-        )
-        
-        # merge chars in the same rect
-        for c in Recognizer.sort_Y_firstly(
-                chars, self.mean_height[pagenum - 1] // 4):
-            ii = Recognizer.find_overlapped(c, bxs)
-            if ii is None:
-                self.lefted_chars.append(c)
-                continue
-            ch = c["bottom"] - c["top"]
-            bh = bxs[ii]["bottom"] - bxs[ii]["top"]
-            if abs(ch - bh) / max(ch, bh) >= 0.7 and c["text"] != ' ':
-                self.lefted_chars.append(c)
-                continue
-            if c["text"] == " " and bxs[ii]["text"]:
-                if re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", bxs[ii]["text"][-1]):
-                    bxs[ii]["text"] += " "
-            else:
-                bxs[ii]["text"] += c["text"]
-
-        logging.info(f"__ocr sorting {len(chars)} chars cost {timer() - start}s")
-        start = timer()
-        boxes_to_reg = []
-        img_np = np.array(img)
-        for b in bxs:
-            if not b["text"]:
-                left, right, top, bott = b["x0"] * ZM, b["x1"] * \
-                                         ZM, b["top"] * ZM, b["bottom"] * ZM
-                b["box_image"] = self.ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
-                boxes_to_reg.append(b)
-            del b["txt"]
-        texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg])
-        for i in range(len(boxes_to_reg)):
-            boxes_to_reg[i]["text"] = texts[i]
-            del boxes_to_reg[i]["box_image"]
-        logging.info(f"__ocr recognize {len(bxs)} boxes cost {timer() - start}s")
-        bxs = [b for b in bxs if b["text"]]
-        if self.mean_height[-1] == 0:
-            self.mean_height[-1] = np.median([b["bottom"] - b["top"]
-                                              for b in bxs])
-        self.boxes.append(bxs)
-
     def _layouts_rec(self, ZM, drop=True):
         assert len(self.page_images) == len(self.boxes)
         self.boxes, self.page_layout = self.layouter(
@@ -1013,11 +1125,15 @@ class RAGFlowPdfParser:
         self.page_from = page_from
         start = timer()
         try:
+            if PDF_STREAMING_WINDOW > 0:
+                # 流式模式：页面在下面的 OCR 循环中逐页渲染，锁只在渲染单页时持有
+                self.page_images = PdfPageImages(fnm, zoomin, page_from, page_to, PDF_STREAMING_WINDOW)
             with sys.modules[LOCK_KEY_pdfplumber]:
                 self.pdf = pdfplumber.open(fnm) if isinstance(
                     fnm, str) else pdfplumber.open(BytesIO(fnm))
-                self.page_images = [p.to_image(resolution=72 * zoomin).annotated for i, p in
-                                    enumerate(self.pdf.pages[page_from:page_to])]
+                if PDF_STREAMING_WINDOW <= 0:
+                    self.page_images = [p.to_image(resolution=72 * zoomin).annotated for i, p in
+                                        enumerate(self.pdf.pages[page_from:page_to])]
                 try:
                     self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
                 except Exception as e:
@@ -1025,6 +1141,7 @@ class RAGFlowPdfParser:
                     self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
                     
                 self.total_page = len(self.pdf.pages)
+                self.pdf.close()
         except Exception:
             logging.exception("RAGFlowPdfParser __images__")
         logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
@@ -1061,28 +1178,67 @@ class RAGFlowPdfParser:
             self.is_english = False
 
         start = timer()
-        for i, img in enumerate(self.page_images):
-            chars = self.page_chars[i] if not self.is_english else []
-            self.mean_height.append(
-                np.median(sorted([c["height"] for c in chars])) if chars else 0
-            )
-            self.mean_width.append(
-                np.median(sorted([c["width"] for c in chars])) if chars else 8
-            )
-            self.page_cum_height.append(img.size[1] / zoomin)
-            j = 0
-            while j + 1 < len(chars):
-                if chars[j]["text"] and chars[j + 1]["text"] \
-                        and re.match(r"[0-9a-zA-Z,.:;!%]+", chars[j]["text"] + chars[j + 1]["text"]) \
-                        and chars[j + 1]["x0"] - chars[j]["x1"] >= min(chars[j + 1]["width"],
-                                                                       chars[j]["width"]) / 2:
-                    chars[j]["text"] += " "
-                j += 1
 
-            self.__ocr(i + 1, img, chars, zoomin)
+        def prepare_pages():
+            for i, img in enumerate(self.page_images):
+                chars = self.page_chars[i] if not self.is_english else []
+                self.mean_height.append(
+                    np.median(sorted([c["height"] for c in chars])) if chars else 0
+                )
+                self.mean_width.append(
+                    np.median(sorted([c["width"] for c in chars])) if chars else 8
+                )
+                self.page_cum_height.append(img.size[1] / zoomin)
+                j = 0
+                while j + 1 < len(chars):
+                    if chars[j]["text"] and chars[j + 1]["text"] \
+                            and re.match(r"[0-9a-zA-Z,.:;!%]+", chars[j]["text"] + chars[j + 1]["text"]) \
+                            and chars[j + 1]["x0"] - chars[j]["x1"] >= min(chars[j + 1]["width"],
+                                                                           chars[j]["width"]) / 2:
+                        chars[j]["text"] += " "
+                    j += 1
+                yield i, img, chars
+
+        pool = OCRPool.instance() if len(self.page_images) > 1 else None
+        if pool:
+            # 多进程按页并行检测，结果按页序返回
+            detected = pool.imap(_ocr_detect_page, ((i + 1, np.array(img), chars, zoomin, self.mean_height[-1])
+                                                    for i, img, chars in prepare_pages()))
+            recognize = pool.recognize_batch
+        else:
+            detected = (_ocr_detect_page(self.ocr, i + 1, img, chars, zoomin, self.mean_height[-1])
+                        for i, img, chars in prepare_pages())
+            recognize = self.ocr.recognize_batch
+
+        # 跨页累积待识别的裁剪图，凑满 OCR_RECOGNIZE_BATCH 再统一识别，按宽高比分批以减少填充
+        pending, pending_crops = [], 0
+
+        def flush_recognition():
+            nonlocal pending, pending_crops
+            st = timer()
+            crops = [b["box_image"] for _, bxs in pending for b in bxs or [] if "box_image" in b]
+            texts = recognize(crops) if crops else []
+            logging.info(f"__ocr recognize {len(crops)} boxes of {len(pending)} pages cost {timer() - st}s")
+            k = 0
+            for pn, bxs in pending:
+                n = len([b for b in bxs or [] if "box_image" in b])
+                bxs, self.mean_height[pn] = _ocr_finish_page(bxs, texts[k:k + n], self.mean_height[pn])
+                k += n
+                self.boxes.append(bxs)
+            pending, pending_crops = [], 0
+
+        for i, (bxs, lefted_chars) in enumerate(detected):
+            self.lefted_chars.extend(lefted_chars)
+            pending.append((i, bxs))
+            pending_crops += len([b for b in bxs or [] if "box_image" in b])
+            if pending_crops >= OCR_RECOGNIZE_BATCH:
+                flush_recognition()
             if callback and i % 6 == 5:
                 callback(prog=(i + 1) * 0.6 / len(self.page_images), msg="")
+        flush_recognition()
         logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s")
+        if isinstance(self.page_images, PdfPageImages):
+            self.page_images.release()
 
         if not self.is_english and not any(
                 [c for c in self.page_chars]) and self.boxes:
@@ -1095,6 +1251,8 @@ class RAGFlowPdfParser:
         self.page_cum_height = np.cumsum(self.page_cum_height)
         assert len(self.page_cum_height) == len(self.page_images) + 1
         if len(self.boxes) == 0 and zoomin < 9:
+            if isinstance(self.page_images, PdfPageImages):
+                self.page_images.close()
             self.__images__(fnm, zoomin * 3, page_from, page_to, callback)
 
     def __call__(self, fnm, need_image=True, zoomin=3, return_html=False):
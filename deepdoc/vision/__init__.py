@@ -19,7 +19,9 @@ import threading
 import pdfplumber
 
 from .ocr import OCR
+from .ocr_pool import OCRPool
 from .recognizer import Recognizer
+from .box_index import BoxIndex
 from .layout_recognizer import LayoutRecognizer4YOLOv10 as LayoutRecognizer
 from .table_structure_recognizer import TableStructureRecognizer
 
@@ -79,7 +81,9 @@ def init_in_out(args):
 
 __all__ = [
     "OCR",
+    "OCRPool",
     "Recognizer",
+    "BoxIndex",
     "LayoutRecognizer",
     "TableStructureRecognizer",
     "init_in_out",
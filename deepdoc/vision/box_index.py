@@ -0,0 +1,304 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+# below this many candidates a plain Python scan beats the NumPy call overhead
+SCALAR_SCAN_MAX = 16
+
+
+def _overlapped_ratio(a, b):
+    """Recognizer.overlapped_area(a, b) for boxes known to intersect vertically."""
+    if b["x0"] > a["x1"] or b["x1"] < a["x0"] or b["bottom"] < a["top"] or b["top"] > a["bottom"]:
+        return 0
+    w, h = a["x1"] - a["x0"], a["bottom"] - a["top"]
+    if w == 0 or h == 0:
+        return 0
+    ov = (min(b["bottom"], a["bottom"]) - max(b["top"], a["top"])) * (min(b["x1"], a["x1"]) - max(b["x0"], a["x0"]))
+    return ov / (w * h) if ov > 0 else ov
+
+
+def line_order(major, minor, threashold):
+    """
+    Reading order of boxes by line clustering, as a list of indices.
+
+    Boxes are ordered by `major` (top for rows, x0 for columns); every box whose `major` is
+    less than `threashold` past the first box of the current line joins that line, and a line
+    is ordered by `minor`. Ties keep the input order. Within a line all pairs are closer than
+    the threshold, so this is the order the pairwise "same line if closer than threashold"
+    comparator of the old cmp_to_key sorts aimed for, computed with two stable sorts.
+    """
+    n = len(major)
+    major = np.asarray(major, dtype=np.float64)
+    pos = np.arange(n)
+    order = np.lexsort((pos, major))
+    if n < 2 or not threashold > 0:
+        return order.tolist()
+    sorted_major = major[order]
+    line = np.empty(n, dtype=np.int64)
+    i, ln = 0, 0
+    while i < n:
+        j = max(i + 1, int(np.searchsorted(sorted_major, sorted_major[i] + threashold, side="left")))
+        line[i:j] = ln
+        ln += 1
+        i = j
+    minor = np.asarray(minor, dtype=np.float64)[order]
+    return order[np.lexsort((order, minor, line))].tolist()
+
+
+class BoxIndex:
+    """
+    Spatial index over a fixed list of boxes (dicts with x0/x1/top/bottom).
+
+    The coordinates are kept in NumPy arrays together with the box order sorted by top, so a
+    query only looks at the boxes whose vertical interval can intersect it and computes the
+    overlaps of all of them at once. Every find_* method returns exactly what the Recognizer
+    helper of the same name returns for the same list; build the index once and query it
+    for every char/box instead of rescanning the list.
+
+    The boxes' geometry must not change while the index is in use; other keys may.
+    """
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.x0 = np.array([b["x0"] for b in boxes], dtype=np.float64)
+        self.x1 = np.array([b["x1"] for b in boxes], dtype=np.float64)
+        self.top = np.array([b["top"] for b in boxes], dtype=np.float64)
+        self.bottom = np.array([b["bottom"] for b in boxes], dtype=np.float64)
+        self.width = self.x1 - self.x0
+        self.height = self.bottom - self.top
+        self.order = np.argsort(self.top, kind="stable")
+        self.sorted_top = self.top[self.order]
+        self._sorted_top = self.sorted_top.tolist()
+        # padded so rounding in height never drops a box from candidates()
+        self.max_height = (max(0., float(self.height.max())) if len(boxes) else 0.) + 1e-6
+        self._layoutno = None
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def candidates(self, box, s=0, e=None):
+        """Sorted indices in [s, e) of the boxes whose vertical interval may intersect box."""
+        lo = bisect_left(self._sorted_top, box["top"] - self.max_height)
+        hi = bisect_right(self._sorted_top, box["bottom"])
+        idx = np.sort(self.order[lo:hi])
+        if s > 0 or e is not None:
+            idx = idx[(idx >= s) & (idx < (len(self) if e is None else e))]
+        return idx
+
+    def _intersections(self, box, idx):
+        x0, x1, top, bottom = self.x0[idx], self.x1[idx], self.top[idx], self.bottom[idx]
+        hit = ~((box["x0"] > x1) | (box["x1"] < x0) | (box["bottom"] < top) | (box["top"] > bottom))
+        inter = (np.minimum(bottom, box["bottom"]) - np.maximum(top, box["top"])) \
+            * (np.minimum(x1, box["x1"]) - np.maximum(x0, box["x0"]))
+        return hit, inter
+
+    def areas(self, box, idx):
+        """Recognizer.overlapped_area(boxes[i], box, False) for i in idx."""
+        hit, inter = self._intersections(box, idx)
+        return np.where(hit & (self.width[idx] != 0) & (self.height[idx] != 0), inter, 0.)
+
+    def ratios(self, box, idx):
+        """Recognizer.overlapped_area(boxes[i], box) for i in idx."""
+        ov = self.areas(box, idx)
+        pos = ov > 0
+        ov[pos] /= self.width[idx][pos] * self.height[idx][pos]
+        return ov
+
+    def ratios_of(self, box, idx):
+        """Recognizer.overlapped_area(box, boxes[i]) for i in idx."""
+        hit, inter = self._intersections(box, idx)
+        w, h = box["x1"] - box["x0"], box["bottom"] - box["top"]
+        if w == 0 or h == 0:
+            return np.zeros(len(idx))
+        ov = np.where(hit, inter, 0.)
+        pos = ov > 0
+        ov[pos] /= w * h
+        return ov
+
+    def find_overlapped(self, box, naive=False):
+        if not len(self):
+            return
+        s, e, ii = 0, len(self), 0
+        while s < e and not naive:
+            ii = (e + s) // 2
+            if box["bottom"] < self.top[ii]:
+                e = ii
+                continue
+            if box["top"] > self.bottom[ii]:
+                s = ii + 1
+                continue
+            break
+        if s < ii and box["top"] > self.bottom[s]:
+            s += 1
+        if e - 1 > ii and box["bottom"] < self.top[e - 1]:
+            e -= 1
+
+        idx = self.candidates(box, s, e)
+        if not len(idx):
+            return
+        if len(idx) <= SCALAR_SCAN_MAX:
+            max_overlaped_i, max_overlaped = None, 0
+            for i in idx.tolist():
+                ov = _overlapped_ratio(self.boxes[i], box)
+                if ov > max_overlaped:
+                    max_overlaped_i, max_overlaped = i, ov
+            return max_overlaped_i
+        ov = self.ratios(box, idx)
+        i = int(np.argmax(ov))
+        if ov[i] <= 0:
+            return
+        return int(idx[i])
+
+    def find_overlapped_with_threashold(self, box, thr=0.3):
+        if not len(self):
+            return
+        # boxes that don't intersect box score (0, 0), they only compete when thr <= 0
+        idx = self.candidates(box) if thr > 0 else np.arange(len(self))
+        if not len(idx):
+            return
+        ov = self.ratios_of(box, idx)
+        mask = ov >= thr
+        if not mask.any():
+            return
+        mask &= ov == ov[mask].max()
+        _ov = self.ratios(box, idx)
+        mask &= _ov == _ov[mask].max()
+        return int(idx[np.flatnonzero(mask)[-1]])
+
+    def find_horizontally_tightest_fit(self, box):
+        if not len(self):
+            return
+        if self._layoutno is None:
+            self._layoutno = np.empty(len(self), dtype=object)
+            self._layoutno[:] = [b.get("layoutno", "0") for b in self.boxes]
+        dis = np.minimum(np.minimum(np.abs(box["x0"] - self.x0), np.abs(box["x1"] - self.x1)),
+                         np.abs(box["x0"] + box["x1"] - self.x1 - self.x0) / 2)
+        dis = np.where(self._layoutno == box.get("layoutno", "0"), dis, np.inf)
+        i = int(np.argmin(dis))
+        if not dis[i] < 1000000:
+            return
+        return i
+
+    def overlapped_area_sum(self, box):
+        """sum(Recognizer.overlapped_area(b, box, False)) over the indexed boxes overlapping box."""
+        idx = self.candidates(box)
+        hit, _ = self._intersections(box, idx)
+        area = 0
+        for v in self.areas(box, idx[hit]).tolist():
+            area += v
+        return area
+
+
+if __name__ == "__main__":
+    # Benchmark against the list based Recognizer helpers on a synthetic dense table page.
+    import random
+    from timeit import default_timer as timer
+
+    from deepdoc.vision.recognizer import Recognizer
+
+    random.seed(0)
+    rows, cols = 60, 12
+    cells = []
+    for r in range(rows):
+        for c in range(cols):
+            x0, top = 40 + c * 45 + random.random() * 3, 40 + r * 12 + random.random() * 2
+            cells.append({"x0": x0, "x1": x0 + 30 + random.random() * 12, "top": top,
+                          "bottom": top + 8 + random.random() * 3, "layoutno": f"table-{c // 6}"})
+    cells = Recognizer.sort_Y_firstly(cells, 2)
+    chars = []
+    for b in cells:
+        for k in range(6):
+            x0 = b["x0"] + k * 5
+            chars.append({"x0": x0, "x1": x0 + 4.5, "top": b["top"] + 0.5, "bottom": b["bottom"] - 0.5})
+    layouts = [{"x0": 30 + c * 45, "x1": 80 + c * 45, "top": 30 + r * 12, "bottom": 52 + r * 12,
+                "layoutno": f"table-{c // 6}"} for r in range(0, rows, 2) for c in range(cols)]
+
+    def bench(name, naive_fn, index_fn, queries):
+        st = timer()
+        expect = [naive_fn(q) for q in queries]
+        t_naive = timer() - st
+        st = timer()
+        got = [index_fn(q) for q in queries]
+        t_index = timer() - st
+        assert expect == got, name
+        print(f"{name:36s} {len(queries):6d} queries  list {t_naive:.3f}s  index {t_index:.3f}s"
+              f"  x{t_naive / max(t_index, 1e-9):.1f}")
+
+    st = timer()
+    cell_idx, layout_idx = BoxIndex(cells), BoxIndex(layouts)
+    print(f"build {len(cells)} + {len(layouts)} boxes {timer() - st:.4f}s")
+    bench("find_overlapped", lambda q: Recognizer.find_overlapped(q, cells), cell_idx.find_overlapped, chars)
+    bench("find_overlapped_with_threashold",
+          lambda q: Recognizer.find_overlapped_with_threashold(q, layouts, thr=0.3),
+          lambda q: layout_idx.find_overlapped_with_threashold(q, thr=0.3), cells)
+    bench("find_horizontally_tightest_fit", lambda q: Recognizer.find_horizontally_tightest_fit(q, layouts),
+          layout_idx.find_horizontally_tightest_fit, cells)
+
+    def area_sum(q):
+        area = 0
+        for b in cells:
+            if Recognizer.overlapped_area(b, q, False):
+                area += Recognizer.overlapped_area(b, q, False)
+        return area
+
+    bench("layouts_cleanup areas", area_sum, cell_idx.overlapped_area_sum, layouts)
+
+    # Reading order: line_order against the former cmp_to_key / bubble sorts.
+    from functools import cmp_to_key
+
+    def cmp_sort_y(arr, threashold):
+        def cmp(c1, c2):
+            diff = c1["top"] - c2["top"]
+            if abs(diff) < threashold:
+                diff = c1["x0"] - c2["x0"]
+            return diff
+        return sorted(arr, key=cmp_to_key(cmp))
+
+    def bubble_sorted_boxes(boxes):
+        _boxes = sorted(boxes, key=lambda x: (x["top"], x["x0"]))
+        for i in range(len(_boxes) - 1):
+            for j in range(i, -1, -1):
+                if abs(_boxes[j + 1]["top"] - _boxes[j]["top"]) < 10 and _boxes[j + 1]["x0"] < _boxes[j]["x0"]:
+                    _boxes[j], _boxes[j + 1] = _boxes[j + 1], _boxes[j]
+                else:
+                    break
+        return _boxes
+
+    def line_sorted_boxes(boxes):
+        _boxes = sorted(boxes, key=lambda x: (x["top"], x["x0"]))
+        return [_boxes[i] for i in line_order([b["top"] for b in _boxes], [b["x0"] for b in _boxes], 10)]
+
+    for name, old_fn, new_fn in [
+        ("sort_Y_firstly", lambda a: cmp_sort_y(a, 4), lambda a: Recognizer.sort_Y_firstly(a, 4)),
+        ("OCR.sorted_boxes", bubble_sorted_boxes, line_sorted_boxes),
+    ]:
+        same, t_old, t_new = 0, 0., 0.
+        for seed in range(20):
+            random.seed(seed)
+            page = [{"x0": 40 + c * 9 + random.random() * 2, "top": 40 + r * 14 + random.random() * 3}
+                    for r in range(80) for c in range(60)]
+            random.shuffle(page)
+            st = timer()
+            expect = old_fn(page)
+            t_old += timer() - st
+            st = timer()
+            got = new_fn(page)
+            t_new += timer() - st
+            same += [id(b) for b in expect] == [id(b) for b in got]
+        print(f"{name:36s} 20 pages x {len(page)} chars  old {t_old:.3f}s  new {t_new:.3f}s"
+              f"  x{t_old / max(t_new, 1e-9):.1f}  identical order on {same}/20 pages")
@@ -25,6 +25,7 @@ from huggingface_hub import snapshot_download
 
 from api.utils.file_utils import get_project_base_directory
 from deepdoc.vision import Recognizer
+from deepdoc.vision.box_index import BoxIndex
 from deepdoc.vision.operators import nms
 
 
@@ -92,6 +93,7 @@ class LayoutRecognizer(Recognizer):
             def findLayout(ty):
                 nonlocal bxs, lts, self
                 lts_ = [lt for lt in lts if lt["type"] == ty]
+                lts_index = BoxIndex(lts_)
                 i = 0
                 while i < len(bxs):
                     if bxs[i].get("layout_type"):
@@ -101,8 +103,7 @@ class LayoutRecognizer(Recognizer):
                         bxs.pop(i)
                         continue
 
-                    ii = self.find_overlapped_with_threashold(bxs[i], lts_,
-                                                              thr=0.4)
+                    ii = lts_index.find_overlapped_with_threashold(bxs[i], thr=0.4)
                     if ii is None:  # belong to nothing
                         bxs[i]["layout_type"] = ""
                         i += 1
@@ -18,6 +18,7 @@ import logging
 import copy
 import time
 import os
+import threading
 
 from huggingface_hub import snapshot_download
 
@@ -30,9 +31,14 @@ import cv2
 import onnxruntime as ort
 
 from .postprocess import build_post_process
+from .box_index import line_order
 
 loaded_models = {}
 
+OCR_REC_BATCH_SIZE = int(os.environ.get("OCR_REC_BATCH_SIZE", 16))
+# >0: recognize_batch calls of concurrent documents in this process are merged for up to this long
+OCR_REC_BATCH_WAIT = float(os.environ.get("OCR_REC_BATCH_WAIT_MS", 0)) / 1000
+
 def transform(data, ops=None):
     """ transform """
     if ops is None:
@@ -90,8 +96,10 @@ def load_model(model_dir, nm):
     options = ort.SessionOptions()
     options.enable_cpu_mem_arena = False
     options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-    options.intra_op_num_threads = 2
-    options.inter_op_num_threads = 2
+    # OCRPool workers get their share of the cores through OCR_INTRA_OP_THREADS
+    threads = int(os.environ.get("OCR_INTRA_OP_THREADS", 0)) or 2
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = threads
 
     # https://github.com/microsoft/onnxruntime/issues/9509#issuecomment-951546580
     # Shrink GPU memory after execution
@@ -137,7 +145,7 @@ class TextRecognizer:
             model_dir: 模型文件所在目录
         """
         self.rec_image_shape = [int(v) for v in "3, 48, 320".split(",")]
-        self.rec_batch_num = 16
+        self.rec_batch_num = OCR_REC_BATCH_SIZE
         postprocess_params = {
             'name': 'CTCLabelDecode',
             "character_dict_path": os.path.join(model_dir, "ocr.res"),
@@ -415,6 +423,86 @@ class TextRecognizer:
         return rec_res, time.time() - st
 
 
+class _RecognitionRequest:
+    def __init__(self, img_list):
+        self.img_list = img_list
+        self.done = threading.Event()
+        self.rec_res = None
+        self.error = None
+
+
+class RecognitionBatcher:
+    """
+    Merges the recognize calls of concurrent threads that share one recognition model.
+
+    The first caller of an empty queue becomes the leader: it waits until a full batch is queued
+    or OCR_REC_BATCH_WAIT has passed, then recognizes all queued crops in one TextRecognizer call,
+    which sorts them by aspect ratio so every ONNX batch is filled with similarly wide crops,
+    and hands every caller back its own results.
+    """
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.lock = threading.Lock()
+        self._pending = []
+        self._pending_imgs = 0
+        self._full = threading.Event()
+
+    def recognize(self, img_list):
+        if not img_list:
+            return []
+        req = _RecognitionRequest(img_list)
+        with self.lock:
+            leader = not self._pending
+            self._pending.append(req)
+            self._pending_imgs += len(img_list)
+            if self._pending_imgs >= self.recognizer.rec_batch_num:
+                self._full.set()
+            full = self._full
+
+        if not leader:
+            req.done.wait()
+        else:
+            full.wait(OCR_REC_BATCH_WAIT)
+            with self.lock:
+                batch = self._pending
+                self._pending, self._pending_imgs = [], 0
+                self._full = threading.Event()
+            self._run(batch)
+
+        if req.error:
+            raise req.error
+        return req.rec_res
+
+    def _run(self, batch):
+        imgs = [img for req in batch for img in req.img_list]
+        try:
+            rec_res, _ = self.recognizer(imgs)
+        except Exception as e:
+            rec_res = None
+            for req in batch:
+                req.error = e
+        i = 0
+        for req in batch:
+            if rec_res is not None:
+                req.rec_res = rec_res[i: i + len(req.img_list)]
+            i += len(req.img_list)
+            req.done.set()
+
+
+_RECOGNITION_BATCHERS = {}
+_RECOGNITION_BATCHERS_LOCK = threading.Lock()
+
+
+def get_recognition_batcher(recognizer) -> RecognitionBatcher:
+    """Process-wide batcher for the (shared) ONNX session of the recognizer."""
+    key = id(recognizer.predictor)
+    with _RECOGNITION_BATCHERS_LOCK:
+        if key not in _RECOGNITION_BATCHERS:
+            _RECOGNITION_BATCHERS[key] = RecognitionBatcher(recognizer)
+        return _RECOGNITION_BATCHERS[key]
+
+
 class TextDetector:
     """
     文本检测器类，用于检测图像中的文本区域
@@ -606,20 +694,10 @@ class OCR:
         return:
             sorted boxes(array) with shape [4, 2]
         """
-        num_boxes = dt_boxes.shape[0]
-        sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
-        _boxes = list(sorted_boxes)
-
-        for i in range(num_boxes - 1):
-            for j in range(i, -1, -1):
-                if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and \
-                        (_boxes[j + 1][0][0] < _boxes[j][0][0]):
-                    tmp = _boxes[j]
-                    _boxes[j] = _boxes[j + 1]
-                    _boxes[j + 1] = tmp
-                else:
-                    break
-        return _boxes
+        _boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
+        # boxes whose top-left y is within 10px of a line's first box form that line, ordered by x
+        order = line_order([b[0][1] for b in _boxes], [b[0][0] for b in _boxes], 10)
+        return [_boxes[i] for i in order]
 
     def detect(self, img):
         time_dict = {'det': 0, 'rec': 0, 'cls': 0, 'all': 0}
@@ -649,7 +727,10 @@ class OCR:
         return text
 
     def recognize_batch(self, img_list):
-        rec_res, elapse = self.text_recognizer(img_list)
+        if OCR_REC_BATCH_WAIT > 0:
+            rec_res = get_recognition_batcher(self.text_recognizer).recognize(img_list)
+        else:
+            rec_res, elapse = self.text_recognizer(img_list)
         texts = []
         for i in range(len(rec_res)):
             text, score = rec_res[i]
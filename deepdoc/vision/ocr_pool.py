@@ -0,0 +1,133 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Page-parallel OCR.
+
+With OCR_PAGE_WORKERS > 0 a process-wide pool of spawn-context workers is started lazily,
+each worker loading its own TextDetector/TextRecognizer ONNX sessions. Every task executor of
+the host has such a pool, so the available cores are first divided by TASK_EXECUTOR_COUNT (set
+by the launch scripts), then split evenly between the workers of this pool
+(OCR_INTRA_OP_THREADS overrides the split).
+Results always come back in submission order.
+"""
+import logging
+import math
+import multiprocessing as mp
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+OCR_PAGE_WORKERS = int(os.environ.get("OCR_PAGE_WORKERS", 0))
+OCR_RECOGNIZE_CHUNK = int(os.environ.get("OCR_RECOGNIZE_CHUNK", 64))
+TASK_EXECUTOR_COUNT = max(1, int(os.environ.get("TASK_EXECUTOR_COUNT", 1)))
+
+_WORKER_OCR = None
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _init_worker(threads):
+    global _WORKER_OCR
+    # must be set before the sessions are created by load_model
+    os.environ["OCR_INTRA_OP_THREADS"] = str(threads)
+    from deepdoc.vision.ocr import OCR
+    _WORKER_OCR = OCR()
+
+
+def _run(fn, args):
+    return fn(_WORKER_OCR, *args)
+
+
+def _recognize(img_list):
+    return _WORKER_OCR.recognize_batch(img_list)
+
+
+class OCRPool:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.threads = int(os.environ.get("OCR_INTRA_OP_THREADS", 0)) or \
+            max(1, available_cores() // (TASK_EXECUTOR_COUNT * workers))
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=mp.get_context("spawn"),
+                                            initializer=_init_worker,
+                                            initargs=(self.threads,))
+        logging.info(f"OCRPool started {workers} workers with {self.threads} ONNX threads each "
+                     f"({TASK_EXECUTOR_COUNT} task executors on this host)")
+
+    @classmethod
+    def instance(cls):
+        """The shared pool, or None if page-parallel OCR is disabled."""
+        if OCR_PAGE_WORKERS <= 0:
+            return None
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls(OCR_PAGE_WORKERS)
+            return cls._instance
+
+    @classmethod
+    def _reset(cls, pool):
+        with cls._lock:
+            if cls._instance is pool:
+                cls._instance = None
+        pool.executor.shutdown(wait=False, cancel_futures=True)
+
+    def imap(self, fn, args_iter, window=None):
+        """
+        Run fn(ocr, *args) in the workers for every args of args_iter and yield the results
+        in input order. At most `window` calls are in flight, so args_iter is consumed lazily.
+        """
+        window = window or self.workers * 2
+        pending = deque()
+        try:
+            for args in args_iter:
+                pending.append(self.executor.submit(_run, fn, args))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        except BrokenProcessPool:
+            logging.exception("OCRPool worker died, the pool will be restarted")
+            self._reset(self)
+            raise
+        finally:
+            for f in pending:
+                f.cancel()
+
+    def recognize_batch(self, img_list):
+        """OCR.recognize_batch spread over the workers in chunks."""
+        if not img_list:
+            return []
+        n = max(1, min(OCR_RECOGNIZE_CHUNK, math.ceil(len(img_list) / self.workers)))
+        try:
+            futures = [self.executor.submit(_recognize, img_list[i:i + n]) for i in range(0, len(img_list), n)]
+            texts = []
+            for f in futures:
+                texts.extend(f.result())
+            return texts
+        except BrokenProcessPool:
+            logging.exception("OCRPool worker died, the pool will be restarted")
+            self._reset(self)
+            raise
@@ -19,7 +19,6 @@ import os
 import math
 import numpy as np
 import cv2
-from functools import cmp_to_key
 
 
 from api.utils.file_utils import get_project_base_directory
@@ -27,6 +26,7 @@ from .operators import *  # noqa: F403
 from .operators import preprocess
 from . import operators
 from .ocr import load_model
+from .box_index import BoxIndex, line_order
 
 class Recognizer:
     def __init__(self, label_list, task_name, model_dir=None):
@@ -53,22 +53,27 @@ class Recognizer:
 
     @staticmethod
     def sort_Y_firstly(arr, threashold):
-        def cmp(c1, c2):
-            diff = c1["top"] - c2["top"]
-            if abs(diff) < threashold:
-                diff = c1["x0"] - c2["x0"]
-            return diff
-        arr = sorted(arr, key=cmp_to_key(cmp))
-        return arr
+        # top first, boxes less than threashold apart in top are one line ordered by x0
+        return [arr[i] for i in line_order([b["top"] for b in arr], [b["x0"] for b in arr], threashold)]
 
     @staticmethod
     def sort_X_firstly(arr, threashold):
-        def cmp(c1, c2):
-            diff = c1["x0"] - c2["x0"]
-            if abs(diff) < threashold:
-                diff = c1["top"] - c2["top"]
-            return diff
-        arr = sorted(arr, key=cmp_to_key(cmp))
+        # x0 first, boxes less than threashold apart in x0 are one column ordered by top
+        return [arr[i] for i in line_order([b["x0"] for b in arr], [b["top"] for b in arr], threashold)]
+
+    @staticmethod
+    def _sort_runs(arr, tag, key):
+        # stable sort of every maximal run of boxes carrying `tag`, boxes without it stay in place
+        i = 0
+        while i < len(arr):
+            if tag not in arr[i]:
+                i += 1
+                continue
+            j = i
+            while j < len(arr) and tag in arr[j]:
+                j += 1
+            arr[i:j] = sorted(arr[i:j], key=key)
+            i = j
         return arr
 
     @staticmethod
@@ -76,39 +81,15 @@ class Recognizer:
         # sort using y1 first and then x1
         # sorted(arr, key=lambda r: (r["x0"], r["top"]))
         arr = Recognizer.sort_X_firstly(arr, thr)
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if "C" not in arr[j] or "C" not in arr[j + 1]:
-                    continue
-                if arr[j + 1]["C"] < arr[j]["C"] \
-                        or (
-                        arr[j + 1]["C"] == arr[j]["C"]
-                        and arr[j + 1]["top"] < arr[j]["top"]
-                ):
-                    tmp = arr[j]
-                    arr[j] = arr[j + 1]
-                    arr[j + 1] = tmp
-        return arr
+        # restore the order using th
+        return Recognizer._sort_runs(arr, "C", lambda r: (r["C"], r["top"]))
 
     @staticmethod
     def sort_R_firstly(arr, thr=0):
         # sort using y1 first and then x1
         # sorted(arr, key=lambda r: (r["top"], r["x0"]))
         arr = Recognizer.sort_Y_firstly(arr, thr)
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                if "R" not in arr[j] or "R" not in arr[j + 1]:
-                    continue
-                if arr[j + 1]["R"] < arr[j]["R"] \
-                        or (
-                        arr[j + 1]["R"] == arr[j]["R"]
-                        and arr[j + 1]["x0"] < arr[j]["x0"]
-                ):
-                    tmp = arr[j]
-                    arr[j] = arr[j + 1]
-                    arr[j + 1] = tmp
-        return arr
+        return Recognizer._sort_runs(arr, "R", lambda r: (r["R"], r["x0"]))
 
     @staticmethod
     def overlapped_area(a, b, ratio=True):
@@ -161,12 +142,10 @@ class Recognizer:
                     layouts.pop(i)
                 continue
 
-            area_i, area_i_1 = 0, 0
-            for b in boxes:
-                if not notOverlapped(b, layouts[i]):
-                    area_i += Recognizer.overlapped_area(b, layouts[i], False)
-                if not notOverlapped(b, layouts[j]):
-                    area_i_1 += Recognizer.overlapped_area(b, layouts[j], False)
+            if not isinstance(boxes, BoxIndex):
+                boxes = BoxIndex(boxes)
+            area_i = boxes.overlapped_area_sum(layouts[i])
+            area_i_1 = boxes.overlapped_area_sum(layouts[j])
 
             if area_i > area_i_1:
                 layouts.pop(j)
@@ -409,18 +388,13 @@ class Recognizer:
 
     def __call__(self, image_list, thr=0.7, batch_size=16):
         res = []
-        imgs = []
-        for i in range(len(image_list)):
-            if not isinstance(image_list[i], np.ndarray):
-                imgs.append(np.array(image_list[i]))
-            else:
-                imgs.append(image_list[i])
-
-        batch_loop_cnt = math.ceil(float(len(imgs)) / batch_size)
+        # convert batch by batch, so lazily rendered pages are only held for one batch
+        batch_loop_cnt = math.ceil(float(len(image_list)) / batch_size)
         for i in range(batch_loop_cnt):
             start_index = i * batch_size
-            end_index = min((i + 1) * batch_size, len(imgs))
-            batch_image_list = imgs[start_index:end_index]
+            end_index = min((i + 1) * batch_size, len(image_list))
+            batch_image_list = [image_list[j] if isinstance(image_list[j], np.ndarray) else np.array(image_list[j])
+                                for j in range(start_index, end_index)]
             inputs = self.preprocess(batch_image_list)
             logging.debug("preprocess")
             for ins in inputs:
@@ -15,6 +15,8 @@ PY=python3
 if [[ -z "$WS" || $WS -lt 1 ]]; then
   WS=1
 fi
+# the task executors of this host share its cores, e.g. for the OCR thread split
+export TASK_EXECUTOR_COUNT=$WS
 
 function task_exe(){
     JEMALLOC_PATH=$(pkg-config --variable=libdir jemalloc)/libjemalloc.so
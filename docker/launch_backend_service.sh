@@ -16,6 +16,8 @@ PY=python3
 if [[ -z "$WS" || $WS -lt 1 ]]; then
   WS=1
 fi
+# the task executors of this host share its cores, e.g. for the OCR thread split
+export TASK_EXECUTOR_COUNT=$WS
 
 # Maximum number of retries for each task executor and server
 MAX_RETRIES=5
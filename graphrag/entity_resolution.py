@@ -15,8 +15,10 @@
 #
 import logging
 import itertools
+import os
 import re
 import time
+from collections import defaultdict
 from dataclasses import dataclass
 from typing import Any, Callable
 
@@ -34,6 +36,15 @@ DEFAULT_RECORD_DELIMITER = "##"
 DEFAULT_ENTITY_INDEX_DELIMITER = "<|>"
 DEFAULT_RESOLUTION_RESULT_DELIMITER = "&&"
 
+# Types with more pairs than this go through n-gram blocking instead of comparing every pair.
+ENTITY_RESOLUTION_EXHAUSTIVE_PAIRS = int(os.environ.get("ENTITY_RESOLUTION_EXHAUSTIVE_PAIRS", 1000))
+ENTITY_RESOLUTION_TOPK = int(os.environ.get("ENTITY_RESOLUTION_TOPK", 5))
+ENTITY_RESOLUTION_MIN_SIM = float(os.environ.get("ENTITY_RESOLUTION_MIN_SIM", 0.3))
+# n-grams shared by more entities than this carry no signal ("公司", "the") and are not indexed
+ENTITY_RESOLUTION_MAX_DF = int(os.environ.get("ENTITY_RESOLUTION_MAX_DF", 100))
+ENTITY_RESOLUTION_MAX_CANDIDATES = int(os.environ.get("ENTITY_RESOLUTION_MAX_CANDIDATES", 10000))
+ENTITY_RESOLUTION_BATCH_SIZE = int(os.environ.get("ENTITY_RESOLUTION_BATCH_SIZE", 100))
+
 
 @dataclass
 class EntityResolutionResult:
@@ -93,16 +104,18 @@ class EntityResolution(Extractor):
 
         candidate_resolution = {entity_type: [] for entity_type in entity_types}
         for k, v in node_clusters.items():
-            candidate_resolution[k] = [(a, b) for a, b in itertools.combinations(v, 2) if self.is_similarity(a, b)]
+            if len(v) * (len(v) - 1) // 2 <= ENTITY_RESOLUTION_EXHAUSTIVE_PAIRS:
+                candidate_resolution[k] = [(a, b) for a, b in itertools.combinations(v, 2) if self.is_similarity(a, b)]
+            else:
+                candidate_resolution[k] = self._block_candidates(v)
         num_candidates = sum([len(candidates) for _, candidates in candidate_resolution.items()])
         callback(msg=f"Identified {num_candidates} candidate pairs")
 
         resolution_result = set()
         async with trio.open_nursery() as nursery:
-            for candidate_resolution_i in candidate_resolution.items():
-                if not candidate_resolution_i[1]:
-                    continue
-                nursery.start_soon(lambda: self._resolve_candidate(candidate_resolution_i, resolution_result))
+            for entity_type, candidates in candidate_resolution.items():
+                for i in range(0, len(candidates), ENTITY_RESOLUTION_BATCH_SIZE):
+                    nursery.start_soon(self._resolve_candidate, (entity_type, candidates[i: i + ENTITY_RESOLUTION_BATCH_SIZE]), resolution_result)
         callback(msg=f"Resolved {num_candidates} candidate pairs, {len(resolution_result)} of them are selected to merge.")
 
         connect_graph = nx.Graph()
@@ -155,6 +168,51 @@ class EntityResolution(Extractor):
             removed_entities=removed_entities
         )
 
+    @staticmethod
+    def _ngrams(name: str) -> set:
+        name = re.sub(r"\s+", " ", name.lower()).strip()
+        n = 3 if is_english(name) else 2
+        if len(name) <= n:
+            return {name}
+        return {name[i: i + n] for i in range(len(name) - n + 1)}
+
+    def _block_candidates(self, names: list) -> list:
+        """
+        Candidate pairs from a character n-gram inverted index: every entity is paired with its
+        ENTITY_RESOLUTION_TOPK most similar names (Jaccard over n-grams >= ENTITY_RESOLUTION_MIN_SIM),
+        best ENTITY_RESOLUTION_MAX_CANDIDATES pairs overall.
+        """
+        grams = [self._ngrams(n) for n in names]
+        index = defaultdict(list)
+        for i, g in enumerate(grams):
+            for t in g:
+                index[t].append(i)
+        index = {t: ids for t, ids in index.items() if len(ids) <= ENTITY_RESOLUTION_MAX_DF}
+
+        scores = {}
+        for i, g in enumerate(grams):
+            # the filtered index only proposes candidates, Jaccard is computed on the full n-gram sets
+            shared = set(j for t in g for j in index.get(t, []) if j != i)
+            sims = []
+            for j in shared:
+                c = len(g & grams[j])
+                sim = c / (len(g) + len(grams[j]) - c)
+                if sim >= ENTITY_RESOLUTION_MIN_SIM:
+                    sims.append((sim, j))
+            for sim, j in sorted(sims, reverse=True)[:ENTITY_RESOLUTION_TOPK]:
+                pair = (min(i, j), max(i, j))
+                scores[pair] = max(sim, scores.get(pair, 0))
+
+        pairs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        candidates = []
+        for (i, j), _ in pairs:
+            if len(candidates) >= ENTITY_RESOLUTION_MAX_CANDIDATES:
+                break
+            if self.is_similarity(names[i], names[j]):
+                candidates.append((names[i], names[j]))
+        logging.info(f"Blocking reduced {len(names)} entities to {len(candidates)} candidate pairs")
+        return candidates
+
     async def _resolve_candidate(self, candidate_resolution_i, resolution_result):
         gen_conf = {"temperature": 0.5}
         pair_txt = [
@@ -26,7 +26,9 @@ from graphrag.general.community_reports_extractor import CommunityReportsExtract
 from graphrag.entity_resolution import EntityResolution
 from graphrag.general.extractor import Extractor
 from graphrag.utils import (
+    GRAPHRAG_INCREMENTAL,
     graph_merge,
+    graph_merge_delta,
     set_entity,
     get_relation,
     set_relation,
@@ -158,7 +160,7 @@ async def update_graph(
     # TODO: infinity doesn't support array search
     chunk = {
         "content_with_weight": json.dumps(
-            nx.node_link_data(subgraph, edges="edges"), ensure_ascii=False, indent=2
+            nx.node_link_data(subgraph, edges="edges"), ensure_ascii=False, separators=(",", ":")
         ),
         "knowledge_graph_kwd": "subgraph",
         "kb_id": kb_id,
@@ -182,7 +184,12 @@ async def update_graph(
         old_graph, old_doc_ids = await get_graph(tenant_id, kb_id)
         if old_graph is not None:
             logging.info("Merge with an exiting graph...................")
-            new_graph = graph_merge(old_graph, subgraph)
+            if GRAPHRAG_INCREMENTAL:
+                new_graph = old_graph
+                changed = graph_merge_delta(new_graph, subgraph)
+                logging.info(f"Merged subgraph of doc {doc_id}: {len(changed)} nodes changed")
+            else:
+                new_graph = graph_merge(old_graph, subgraph)
         await update_nodes_pagerank_nhop_neighbour(tenant_id, kb_id, new_graph, 2)
         if old_doc_ids:
             for old_doc_id in old_doc_ids:
@@ -25,6 +25,7 @@ from graphrag.query_analyze_prompt import PROMPTS
 from graphrag.utils import get_entity_type2sampels, get_llm_cache, set_llm_cache, get_relation
 from rag.utils import num_tokens_from_string
 from rag.utils.doc_store_conn import OrderByExpr
+from rag.utils.retrieval_fanout import executor
 
 from rag.nlp.search import Dealer, index_name
 
@@ -154,6 +155,10 @@ class KGSearch(Dealer):
             tenant_ids = tenant_ids.split(",")
         idxnms = [index_name(tid) for tid in tenant_ids]
         ty_kwds = []
+        # the relation search only needs the question, run it while the LLM rewrites the query
+        pool = executor("kg")
+        rels_future = pool.submit(self.get_relevant_relations_by_txt, qst, filters, idxnms, kb_ids, emb_mdl,
+                                  rel_sim_threshold)
         try:
             ty_kwds, ents = self.query_rewrite(llm, qst, [index_name(tid) for tid in tenant_ids], kb_ids)
             logging.info(f"Q: {qst}, Types: {ty_kwds}, Entities: {ents}")
@@ -162,9 +167,10 @@ class KGSearch(Dealer):
             ents = [qst]
             pass
 
+        types_future = pool.submit(self.get_relevant_ents_by_types, ty_kwds, filters, idxnms, kb_ids, 10000)
         ents_from_query = self.get_relevant_ents_by_keywords(ents, filters, idxnms, kb_ids, emb_mdl, ent_sim_threshold)
-        ents_from_types = self.get_relevant_ents_by_types(ty_kwds, filters, idxnms, kb_ids, 10000)
-        rels_from_txt = self.get_relevant_relations_by_txt(qst, filters, idxnms, kb_ids, emb_mdl, rel_sim_threshold)
+        ents_from_types = types_future.result()
+        rels_from_txt = rels_future.result()
         nhop_pathes = defaultdict(dict)
         for _, ent in ents_from_query.items():
             nhops = ent.get("n_hop_ents", [])
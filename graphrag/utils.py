@@ -19,19 +19,25 @@ import os
 import trio
 
 import networkx as nx
-import numpy as np
 import xxhash
 from networkx.readwrite import json_graph
 
 from api import settings
 from rag.nlp import search, rag_tokenizer
 from rag.utils.doc_store_conn import OrderByExpr
+from rag.utils.embed_cache import EMBED_CACHE
 from rag.utils.redis_conn import REDIS_CONN
 
 ErrorHandlerFn = Callable[[BaseException | None, str | None, dict | None], None]
 
 chat_limiter = trio.CapacityLimiter(int(os.environ.get('MAX_CONCURRENT_CHATS', 10)))
 
+# Incremental graph maintenance: merge the subgraph of a document into the stored graph in place,
+# warm-start pagerank from the stored values and only write back nodes whose pagerank moved.
+GRAPHRAG_INCREMENTAL = int(os.environ.get('GRAPHRAG_INCREMENTAL', 0))
+GRAPHRAG_PAGERANK_TOL = float(os.environ.get('GRAPHRAG_PAGERANK_TOL', 1e-3))
+graph_update_limiter = trio.CapacityLimiter(int(os.environ.get('MAX_CONCURRENT_GRAPH_UPDATES', 16)))
+
 def perform_variable_replacements(
     input: str, history: list[dict] | None = None, variables: dict | None = None
 ) -> str:
@@ -107,25 +113,11 @@ def set_llm_cache(llmnm, txt, v, history, genconf):
 
 
 def get_embed_cache(llmnm, txt):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
-
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
-    if not bin:
-        return
-    return np.array(json.loads(bin))
+    return EMBED_CACHE.get(llmnm, txt)
 
 
 def set_embed_cache(llmnm, txt, arr):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
-
-    k = hasher.hexdigest()
-    arr = json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr)
-    REDIS_CONN.set(k, arr.encode("utf-8"), 24*3600)
+    EMBED_CACHE.set(llmnm, txt, arr)
 
 
 def get_tags_from_cache(kb_ids):
@@ -165,6 +157,37 @@ def graph_merge(g1, g2):
     return g
 
 
+def graph_merge_delta(g, subgraph) -> set:
+    """
+    In-place counterpart of graph_merge(g, subgraph) that only touches the delta:
+    nodes of the subgraph take its attributes, edges already in g get weight + 1,
+    new edges are added with the subgraph's attributes. Unlike graph_merge, edges of g
+    outside the subgraph keep their attributes. Returns the nodes whose degree may have changed.
+    """
+    changed = set()
+    for n, attr in subgraph.nodes(data=True):
+        if n in g:
+            old = g.nodes[n]
+            kept = {k: old[k] for k in ("pagerank",) if k in old}
+            old.clear()
+            old.update(kept)
+            old.update(attr)
+        else:
+            g.add_node(n, **attr)
+        changed.add(n)
+
+    for source, target, attr in subgraph.edges(data=True):
+        if g.has_edge(source, target):
+            g[source][target].update({"weight": g[source][target].get("weight", 0) + 1})
+            continue
+        g.add_edge(source, target, **attr)
+        changed.update([source, target])
+
+    for n in changed:
+        g.nodes[n]["rank"] = int(g.degree[n])
+    return changed
+
+
 def compute_args_hash(*args):
     return md5(str(args).encode()).hexdigest()
 
@@ -432,7 +455,7 @@ async def get_graph(tenant_id, kb_id):
 async def set_graph(tenant_id, kb_id, graph, docids):
     chunk = {
         "content_with_weight": json.dumps(nx.node_link_data(graph, edges="edges"), ensure_ascii=False,
-                                          indent=2),
+                                          separators=(",", ":")),
         "knowledge_graph_kwd": "graph",
         "kb_id": kb_id,
         "source_id": list(docids),
@@ -515,15 +538,31 @@ async def update_nodes_pagerank_nhop_neighbour(tenant_id, kb_id, graph, n_hop):
             nbrs.append(n)
         return nbrs
 
-    pr = nx.pagerank(graph)
+    async def update_node(n, p):
+        async with graph_update_limiter:
+            await trio.to_thread.run_sync(lambda: settings.docStoreConn.update({"entity_kwd": n, "kb_id": kb_id},
+                                                                               {"rank_flt": p,
+                                                                                "n_hop_with_weight": json.dumps((n), ensure_ascii=False)},
+                                                                               search.index_name(tenant_id), kb_id))
+
+    old_pr = {n: d["pagerank"] for n, d in graph.nodes(data=True) if "pagerank" in d}
+    if GRAPHRAG_INCREMENTAL and old_pr:
+        # warm start from the stored ranks, new nodes start from the uniform value
+        nstart = {n: old_pr.get(n, 1. / graph.number_of_nodes()) for n in graph.nodes}
+        pr = nx.pagerank(graph, nstart=nstart)
+    else:
+        pr = nx.pagerank(graph)
+    updates = []
+    for n, p in pr.items():
+        graph.nodes[n]["pagerank"] = p
+        if GRAPHRAG_INCREMENTAL and n in old_pr and abs(p - old_pr[n]) <= GRAPHRAG_PAGERANK_TOL * max(p, old_pr[n]):
+            continue
+        updates.append((n, p))
+    logging.info(f"update_nodes_pagerank_nhop_neighbour: {len(updates)}/{len(pr)} nodes to update")
     try:
         async with trio.open_nursery() as nursery:
-            for n, p in pr.items():
-                graph.nodes[n]["pagerank"] = p
-                nursery.start_soon(lambda: trio.to_thread.run_sync(lambda: settings.docStoreConn.update({"entity_kwd": n, "kb_id": kb_id},
-                                                {"rank_flt": p,
-                                                "n_hop_with_weight": json.dumps((n), ensure_ascii=False)},
-                                                search.index_name(tenant_id), kb_id)))
+            for n, p in updates:
+                nursery.start_soon(update_node, n, p)
     except Exception as e:
         logging.exception(e)
 
@@ -1,5 +1,8 @@
-import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
 import os
+import threading
+import time
 from utils import generate_uuid, encrypt_password
 from datetime import datetime
 from minio import Minio
@@ -63,31 +66,94 @@ ES_CONFIG = {
     "use_ssl": os.getenv("ES_USE_SSL", "false").lower() == "true"
 }
 
+# 连接池配置
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "16"))  # mysql.connector 单个连接池上限为 32
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))  # 连接池耗尽时等待空闲连接的秒数
+
+_mysql_pool = None
+_minio_client = None
+_es_client = None
+_client_lock = threading.Lock()
+_mysql_pool_stats = {"acquired": 0, "waits": 0, "timeouts": 0, "errors": 0}
+
+class _PooledConnection(pooling.PooledMySQLConnection):
+    """异常路径上调用方没有 close() 的连接在被回收时归还连接池，避免连接池被耗尽"""
+
+    def __del__(self):
+        try:
+            if self._cnx is not None:
+                self.close()
+        except Exception:
+            pass
+
+def _get_mysql_pool():
+    global _mysql_pool
+    if _mysql_pool is None:
+        with _client_lock:
+            if _mysql_pool is None:
+                _mysql_pool = pooling.MySQLConnectionPool(
+                    pool_name=f"management_{os.getpid()}",
+                    pool_size=MYSQL_POOL_SIZE,
+                    pool_reset_session=True,
+                    **DB_CONFIG
+                )
+    return _mysql_pool
+
 def get_db_connection():
-    """创建MySQL数据库连接"""
+    """
+    从连接池获取MySQL数据库连接
+
+    调用方用完后照常 close()，连接会归还到连接池。取出时连接池会检查连接是否存活，断开的连接自动重连；
+    连接池耗尽时最多等待 MYSQL_POOL_TIMEOUT 秒。
+    """
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+        pool = _get_mysql_pool()
+        deadline = time.time() + MYSQL_POOL_TIMEOUT
+        waited = False
+        while True:
+            try:
+                conn = pool.get_connection()
+                break
+            except PoolError:
+                if time.time() >= deadline:
+                    _mysql_pool_stats["timeouts"] += 1
+                    raise
+                if not waited:
+                    _mysql_pool_stats["waits"] += 1
+                    waited = True
+                time.sleep(0.05)
+        conn.__class__ = _PooledConnection
+        _mysql_pool_stats["acquired"] += 1
         return conn
     except Exception as e:
+        _mysql_pool_stats["errors"] += 1
         print(f"MySQL连接失败: {str(e)}")
         raise e
 
 def get_minio_client():
-    """创建MinIO客户端连接"""
+    """获取进程内共享的MinIO客户端（线程安全，内部复用 HTTP 连接池）"""
+    global _minio_client
+    if _minio_client is not None:
+        return _minio_client
     try:
-        minio_client = Minio(
-            endpoint=MINIO_CONFIG["endpoint"],
-            access_key=MINIO_CONFIG["access_key"],
-            secret_key=MINIO_CONFIG["secret_key"],
-            secure=MINIO_CONFIG["secure"]
-        )
-        return minio_client
+        with _client_lock:
+            if _minio_client is None:
+                _minio_client = Minio(
+                    endpoint=MINIO_CONFIG["endpoint"],
+                    access_key=MINIO_CONFIG["access_key"],
+                    secret_key=MINIO_CONFIG["secret_key"],
+                    secure=MINIO_CONFIG["secure"]
+                )
+        return _minio_client
     except Exception as e:
         print(f"MinIO连接失败: {str(e)}")
         raise e
 
 def get_es_client():
-    """创建Elasticsearch客户端连接"""
+    """获取进程内共享的Elasticsearch客户端（线程安全，内部复用连接池）"""
+    global _es_client
+    if _es_client is not None:
+        return _es_client
     try:
         # 构建连接参数
         es_params = {
@@ -103,12 +169,27 @@ def get_es_client():
             es_params["use_ssl"] = True
             es_params["verify_certs"] = False  # 在开发环境中可以设置为False，生产环境应该设置为True
         
-        es_client = Elasticsearch(**es_params)
-        return es_client
+        with _client_lock:
+            if _es_client is None:
+                _es_client = Elasticsearch(**es_params)
+        return _es_client
     except Exception as e:
         print(f"Elasticsearch连接失败: {str(e)}")
         raise e
 
+def get_pool_status():
+    """返回MySQL连接池和共享客户端的状态"""
+    mysql_status = {"initialized": _mysql_pool is not None, "pool_size": MYSQL_POOL_SIZE, **_mysql_pool_stats}
+    if _mysql_pool is not None:
+        idle = _mysql_pool._cnx_queue.qsize()
+        mysql_status.update(idle=idle, in_use=_mysql_pool.pool_size - idle)
+    return {
+        "pid": os.getpid(),
+        "mysql": mysql_status,
+        "minio": {"initialized": _minio_client is not None},
+        "elasticsearch": {"initialized": _es_client is not None}
+    }
+
 def test_connections():
     """测试数据库和MinIO连接"""
     try:
@@ -9,6 +9,7 @@ files_bp = Blueprint('files', __name__, url_prefix='/api/v1/files')
 knowledgebase_bp = Blueprint('knowledgebases', __name__, url_prefix='/api/v1/knowledgebases')
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/v1/auth')
 knowledgebase_user_bp = Blueprint('knowledgebase_user', __name__, url_prefix='/api/v1/knowledgebase-user')
+system_bp = Blueprint('system', __name__, url_prefix='/api/v1/system')
 # 导入路由
 from .users.routes import *
 from .teams.routes import *
@@ -17,6 +18,7 @@ from .files.routes import *
 from .knowledgebases.routes import *
 from .auth.routes import *
 from .knowledgebase_user.routes import *
+from .system.routes import *
 
 
 def register_routes(app):
@@ -28,3 +30,4 @@ def register_routes(app):
     app.register_blueprint(knowledgebase_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(knowledgebase_user_bp)
+    app.register_blueprint(system_bp)
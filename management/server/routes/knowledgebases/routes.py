@@ -343,6 +343,24 @@ def start_sequential_batch_parse_route(kb_id):
         traceback.print_exc()
         return error_response(f"启动顺序批量解析失败: {str(e)}", code=500)
 
+# 取消批量解析路由
+@knowledgebase_bp.route('/<string:kb_id>/batch_parse_sequential/cancel', methods=['POST'])
+def cancel_sequential_batch_parse_route(kb_id):
+    """取消知识库排队中的批量解析文档"""
+    if request.method == 'OPTIONS':
+        response = success_response({})
+        response.headers.add('Access-Control-Allow-Methods', 'POST')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        return response
+
+    try:
+        result = KnowledgebaseService.cancel_sequential_batch_parse(kb_id)
+        return success_response(data={"message": result.get("message"), "cancelled": result.get("cancelled")})
+    except Exception as e:
+        print(f"取消批量解析路由处理失败 (KB ID: {kb_id}): {str(e)}")
+        traceback.print_exc()
+        return error_response(f"取消批量解析失败: {str(e)}", code=500)
+
 # 获取顺序批量解析进度路由
 @knowledgebase_bp.route('/<string:kb_id>/batch_parse_sequential/progress', methods=['GET'])
 def get_sequential_batch_parse_progress_route(kb_id):
@@ -0,0 +1,11 @@
+from database import get_pool_status
+from utils import success_response, error_response
+from .. import system_bp
+
+@system_bp.route('/pool_status', methods=['GET'])
+def get_pool_status_route():
+    """获取MySQL连接池和MinIO/ES共享客户端的状态"""
+    try:
+        return success_response(get_pool_status())
+    except Exception as e:
+        return error_response(f"获取连接池状态失败: {str(e)}", code=500)
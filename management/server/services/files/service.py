@@ -1,9 +1,7 @@
 import os
-import mysql.connector
 import re
 import tempfile
 from io import BytesIO
-from minio import Minio
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 from datetime import datetime 
@@ -11,7 +9,7 @@ from .utils import FileType, FileSource, StatusEnum, get_uuid
 from .document_service import DocumentService
 from .file_service import FileService 
 from .file2document_service import File2DocumentService
-from database import DB_CONFIG, MINIO_CONFIG
+from database import get_db_connection, get_minio_client
 
 # 加载环境变量
 load_dotenv("../../docker/.env")
@@ -44,19 +42,6 @@ def filename_type(filename):
     
     return FileType.OTHER.value
 
-def get_minio_client():
-    """创建MinIO客户端"""
-    return Minio(
-        endpoint=MINIO_CONFIG["endpoint"],
-        access_key=MINIO_CONFIG["access_key"],
-        secret_key=MINIO_CONFIG["secret_key"],
-        secure=MINIO_CONFIG["secure"]
-    )
-
-def get_db_connection():
-    """创建数据库连接"""
-    return mysql.connector.connect(**DB_CONFIG)
-
 def get_files_list(current_page, page_size, parent_id=None, name_filter=""):
     """
     获取文件列表
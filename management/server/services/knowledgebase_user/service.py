@@ -1,6 +1,5 @@
 import traceback
-import mysql.connector
-from database import DB_CONFIG
+from database import get_db_connection
 from utils import generate_uuid
 from datetime import datetime
 import json
@@ -11,7 +10,7 @@ class KnowledgebaseUserService:
     @classmethod
     def _get_db_connection(cls):
         """创建数据库连接"""
-        return mysql.connector.connect(**DB_CONFIG)
+        return get_db_connection()
     
     @classmethod
     def get_user_knowledgebases(cls, user_id):
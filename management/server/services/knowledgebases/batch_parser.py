@@ -0,0 +1,419 @@
+import os
+import threading
+import time
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from database import get_db_connection
+from utils import generate_uuid
+
+# 批量解析调度配置
+BATCH_PARSE_WORKERS = int(os.getenv("BATCH_PARSE_WORKERS", str(min(2, os.cpu_count() or 1))))  # 本进程的解析进程数，按 CPU/MinerU 能力设置
+BATCH_PARSE_GLOBAL_LIMIT = int(os.getenv("BATCH_PARSE_GLOBAL_LIMIT", str(BATCH_PARSE_WORKERS)))  # 所有管理端进程合计同时解析的文档数
+BATCH_PARSE_PER_KB_LIMIT = int(os.getenv("BATCH_PARSE_PER_KB_LIMIT", "2"))  # 单个知识库同时解析的文档数
+BATCH_PARSE_QUEUE = os.getenv("BATCH_PARSE_QUEUE", "mysql").lower()  # mysql: 持久化队列; memory: 进程内队列（测试/单机调试用）
+BATCH_PARSE_POLL_INTERVAL = float(os.getenv("BATCH_PARSE_POLL_INTERVAL", "2"))  # 调度轮询间隔（秒）
+BATCH_PARSE_STALE_SECONDS = int(os.getenv("BATCH_PARSE_STALE_SECONDS", "600"))  # 超过该时间没有心跳的解析任务视为中断，重新排队
+BATCH_PARSE_CLAIM_LOCK = "ragflow_batch_parse_claim"  # 领取文档时使用的 MySQL 命名锁
+
+# 队列中单个文档的状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _parse_document_worker(doc_id):
+    """在解析进程中执行单个文档的解析"""
+    from .service import KnowledgebaseService
+    return KnowledgebaseService.parse_document(doc_id)
+
+
+class MySQLParseQueue:
+    """基于 MySQL 表的持久化解析队列，管理端重启或多进程部署时进度不会丢失"""
+
+    def __init__(self):
+        self._table_ready = False
+
+    def _get_db_connection(self):
+        conn = get_db_connection()
+        if not self._table_ready:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS batch_parse_queue (
+                    id VARCHAR(32) NOT NULL PRIMARY KEY,
+                    batch_id VARCHAR(32) NOT NULL,
+                    kb_id VARCHAR(32) NOT NULL,
+                    doc_id VARCHAR(32) NOT NULL,
+                    doc_name VARCHAR(255) NULL,
+                    status VARCHAR(16) NOT NULL,
+                    owner VARCHAR(64) NULL,
+                    message VARCHAR(255) NULL,
+                    create_time BIGINT NOT NULL,
+                    begin_time BIGINT NULL,
+                    update_time BIGINT NOT NULL,
+                    INDEX idx_kb_batch (kb_id, batch_id),
+                    INDEX idx_status (status)
+                )
+            """)
+            conn.commit()
+            cursor.close()
+            self._table_ready = True
+        return conn
+
+    def _execute(self, query, params=(), fetch=False, many=False):
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            if many:
+                cursor.executemany(query, params)
+            else:
+                cursor.execute(query, params)
+            if fetch:
+                return cursor.fetchall()
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def enqueue(self, batch_id, kb_id, docs):
+        now = _now_ms()
+        rows = [(generate_uuid(), batch_id, kb_id, doc["id"], doc["name"][:255], QUEUED, now, now) for doc in docs]
+        if rows:
+            self._execute("""
+                INSERT INTO batch_parse_queue (id, batch_id, kb_id, doc_id, doc_name, status, create_time, update_time)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, rows, many=True)
+
+    def claim(self, owner, limit):
+        """按全局和单知识库并发上限领取待解析的文档，返回领取成功的记录"""
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            # 多个管理端进程用命名锁串行领取，统计运行数和领取在同一个锁内完成，合计不会超过全局和单知识库上限
+            cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (BATCH_PARSE_CLAIM_LOCK, 10))
+            if not cursor.fetchone()["locked"]:
+                return []
+            try:
+                claimed = self._claim(cursor, owner, limit)
+                conn.commit()
+                return claimed
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (BATCH_PARSE_CLAIM_LOCK,))
+                cursor.fetchall()
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def _claim(self, cursor, owner, limit):
+        cursor.execute("SELECT kb_id, COUNT(*) AS cnt FROM batch_parse_queue WHERE status = %s GROUP BY kb_id", (RUNNING,))
+        running_per_kb = {r["kb_id"]: r["cnt"] for r in cursor.fetchall()}
+        limit = min(limit, BATCH_PARSE_GLOBAL_LIMIT - sum(running_per_kb.values()))
+        if limit <= 0:
+            return []
+
+        # 已达上限的知识库不参与领取，其余知识库每个最多取前 BATCH_PARSE_PER_KB_LIMIT 个，
+        # 避免一个大知识库占满候选窗口导致其他知识库的文档一直排不上
+        full_kbs = [kb_id for kb_id, cnt in running_per_kb.items() if cnt >= BATCH_PARSE_PER_KB_LIMIT]
+        exclude = f"AND kb_id NOT IN ({', '.join(['%s'] * len(full_kbs))})" if full_kbs else ""
+        cursor.execute(f"""
+            SELECT id, batch_id, kb_id, doc_id, doc_name FROM (
+                SELECT id, batch_id, kb_id, doc_id, doc_name, create_time,
+                       ROW_NUMBER() OVER (PARTITION BY kb_id ORDER BY create_time, id) AS kb_rank
+                FROM batch_parse_queue WHERE status = %s {exclude}
+            ) q WHERE kb_rank <= %s ORDER BY create_time, id LIMIT %s
+        """, (QUEUED, *full_kbs, BATCH_PARSE_PER_KB_LIMIT, limit * BATCH_PARSE_PER_KB_LIMIT))
+        candidates = cursor.fetchall()
+        claimed = []
+        for item in candidates:
+            if len(claimed) >= limit:
+                break
+            if running_per_kb.get(item["kb_id"], 0) >= BATCH_PARSE_PER_KB_LIMIT:
+                continue
+            now = _now_ms()
+            # 条件更新兜底，避免重复领取同一个文档
+            cursor.execute("""
+                UPDATE batch_parse_queue SET status = %s, owner = %s, begin_time = %s, update_time = %s
+                WHERE id = %s AND status = %s
+            """, (RUNNING, owner, now, now, item["id"], QUEUED))
+            if cursor.rowcount:
+                running_per_kb[item["kb_id"]] = running_per_kb.get(item["kb_id"], 0) + 1
+                claimed.append(item)
+        return claimed
+
+    def finish(self, item_id, status, message=""):
+        self._execute("UPDATE batch_parse_queue SET status = %s, message = %s, update_time = %s WHERE id = %s AND status = %s",
+                      (status, (message or "")[:255], _now_ms(), item_id, RUNNING))
+
+    def heartbeat(self, item_ids):
+        if item_ids:
+            placeholders = ", ".join(["%s"] * len(item_ids))
+            self._execute(f"UPDATE batch_parse_queue SET update_time = %s WHERE status = %s AND id IN ({placeholders})",
+                          (_now_ms(), RUNNING, *item_ids))
+
+    def requeue_stale(self, stale_seconds):
+        """进程退出后遗留的 running 记录没有心跳，重新放回队列"""
+        return self._execute("UPDATE batch_parse_queue SET status = %s, owner = NULL, update_time = %s WHERE status = %s AND update_time < %s",
+                             (QUEUED, _now_ms(), RUNNING, _now_ms() - stale_seconds * 1000))
+
+    def cancel(self, kb_id):
+        return self._execute("UPDATE batch_parse_queue SET status = %s, message = %s, update_time = %s WHERE kb_id = %s AND status = %s",
+                             (CANCELLED, "已取消", _now_ms(), kb_id, QUEUED))
+
+    def latest_batch(self, kb_id):
+        """返回知识库最近一次批量任务的所有记录"""
+        rows = self._execute("SELECT batch_id FROM batch_parse_queue WHERE kb_id = %s ORDER BY create_time DESC LIMIT 1",
+                             (kb_id,), fetch=True)
+        if not rows:
+            return []
+        return self._execute("""
+            SELECT id, doc_id, doc_name, status, create_time, begin_time, update_time FROM batch_parse_queue
+            WHERE kb_id = %s AND batch_id = %s
+        """, (kb_id, rows[0]["batch_id"]), fetch=True)
+
+
+class MemoryParseQueue:
+    """进程内的解析队列，接口与 MySQLParseQueue 一致，用于测试或没有数据库写权限的单机环境"""
+
+    def __init__(self):
+        self._items = []
+        self._lock = threading.Lock()
+
+    def enqueue(self, batch_id, kb_id, docs):
+        now = _now_ms()
+        with self._lock:
+            for doc in docs:
+                self._items.append({"id": generate_uuid(), "batch_id": batch_id, "kb_id": kb_id, "doc_id": doc["id"],
+                                    "doc_name": doc["name"], "status": QUEUED, "owner": None, "message": "",
+                                    "create_time": now, "begin_time": None, "update_time": now})
+
+    def claim(self, owner, limit):
+        with self._lock:
+            running_per_kb = {}
+            for item in self._items:
+                if item["status"] == RUNNING:
+                    running_per_kb[item["kb_id"]] = running_per_kb.get(item["kb_id"], 0) + 1
+            limit = min(limit, BATCH_PARSE_GLOBAL_LIMIT - sum(running_per_kb.values()))
+            claimed = []
+            for item in self._items:
+                if len(claimed) >= limit:
+                    break
+                if item["status"] != QUEUED or running_per_kb.get(item["kb_id"], 0) >= BATCH_PARSE_PER_KB_LIMIT:
+                    continue
+                now = _now_ms()
+                item.update(status=RUNNING, owner=owner, begin_time=now, update_time=now)
+                running_per_kb[item["kb_id"]] = running_per_kb.get(item["kb_id"], 0) + 1
+                claimed.append(dict(item))
+            return claimed
+
+    def finish(self, item_id, status, message=""):
+        with self._lock:
+            for item in self._items:
+                if item["id"] == item_id and item["status"] == RUNNING:
+                    item.update(status=status, message=message, update_time=_now_ms())
+
+    def heartbeat(self, item_ids):
+        with self._lock:
+            for item in self._items:
+                if item["id"] in item_ids and item["status"] == RUNNING:
+                    item["update_time"] = _now_ms()
+
+    def requeue_stale(self, stale_seconds):
+        count = 0
+        with self._lock:
+            for item in self._items:
+                if item["status"] == RUNNING and item["update_time"] < _now_ms() - stale_seconds * 1000:
+                    item.update(status=QUEUED, owner=None, update_time=_now_ms())
+                    count += 1
+        return count
+
+    def cancel(self, kb_id):
+        count = 0
+        with self._lock:
+            for item in self._items:
+                if item["kb_id"] == kb_id and item["status"] == QUEUED:
+                    item.update(status=CANCELLED, message="已取消", update_time=_now_ms())
+                    count += 1
+        return count
+
+    def latest_batch(self, kb_id):
+        with self._lock:
+            items = [item for item in self._items if item["kb_id"] == kb_id]
+            if not items:
+                return []
+            batch_id = max(items, key=lambda item: item["create_time"])["batch_id"]
+            return [dict(item) for item in items if item["batch_id"] == batch_id]
+
+
+class BatchParseScheduler:
+    """
+    批量解析调度器
+
+    文档进入持久化队列后，由调度线程按全局/单知识库并发上限领取，并提交到解析进程池执行。
+    运行中的文档定期写入心跳；管理端重启后，没有心跳的文档会被重新排队，排队中的文档在调度器启动后继续解析。
+    取消只作用于尚未开始的文档，正在解析的文档会执行完毕。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, queue=None):
+        self.queue = queue or (MemoryParseQueue() if BATCH_PARSE_QUEUE == "memory" else MySQLParseQueue())
+        self.owner = f"{os.uname().nodename if hasattr(os, 'uname') else 'local'}-{os.getpid()}"
+        self._pool = None
+        self._running = {}  # item_id -> future
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            cls._instance.start()
+            return cls._instance
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name="batch-parse-scheduler", daemon=True)
+        self._thread.start()
+        print(f"[Batch Parse] 调度器已启动，解析进程数: {BATCH_PARSE_WORKERS}，全局并发: {BATCH_PARSE_GLOBAL_LIMIT}，单知识库并发: {BATCH_PARSE_PER_KB_LIMIT}")
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def _get_pool(self):
+        if self._pool is None:
+            # 使用 spawn 启动解析进程，避免 fork 继承调度线程和数据库连接
+            self._pool = ProcessPoolExecutor(max_workers=BATCH_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _loop(self):
+        last_heartbeat = 0
+        while True:
+            try:
+                with self._lock:
+                    running_ids = list(self._running.keys())
+                if time.time() - last_heartbeat > BATCH_PARSE_STALE_SECONDS / 4:
+                    self.queue.heartbeat(running_ids)
+                    requeued = self.queue.requeue_stale(BATCH_PARSE_STALE_SECONDS)
+                    if requeued:
+                        print(f"[Batch Parse] {requeued} 个中断的解析任务已重新排队")
+                    last_heartbeat = time.time()
+
+                free = BATCH_PARSE_WORKERS - len(running_ids)
+                if free > 0:
+                    for item in self.queue.claim(self.owner, free):
+                        self._submit(item)
+            except Exception as e:
+                print(f"[Batch Parse ERROR] 调度失败: {e}")
+                traceback.print_exc()
+            self._wakeup.wait(BATCH_PARSE_POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def _submit(self, item):
+        print(f"[Batch Parse] KB {item['kb_id']}: 开始解析 {item['doc_name']} (ID: {item['doc_id']})")
+        try:
+            future = self._get_pool().submit(_parse_document_worker, item["doc_id"])
+        except BrokenProcessPool:
+            # 解析进程异常退出后进程池不可用，重建后重试
+            self._pool = None
+            future = self._get_pool().submit(_parse_document_worker, item["doc_id"])
+        with self._lock:
+            self._running[item["id"]] = future
+        future.add_done_callback(lambda f: self._on_done(item, f))
+
+    def _on_done(self, item, future):
+        try:
+            result = future.result()
+            if result and result.get("success"):
+                self.queue.finish(item["id"], DONE)
+                print(f"[Batch Parse] KB {item['kb_id']}: Document {item['doc_id']} parsed successfully.")
+            else:
+                error_msg = (result.get("error") or result.get("message")) if result else None
+                self.queue.finish(item["id"], FAILED, error_msg or "未知错误")
+                print(f"[Batch Parse] KB {item['kb_id']}: Document {item['doc_id']} parsing failed: {error_msg}")
+        except Exception as e:
+            print(f"[Batch Parse ERROR] KB {item['kb_id']}: 解析文档 {item['doc_id']} 失败: {e}")
+            try:
+                self.queue.finish(item["id"], FAILED, str(e))
+                from .document_parser import _update_document_progress
+                _update_document_progress(item["doc_id"], status='1', run='0', progress=0.0, message=f"批量任务中解析失败: {str(e)[:255]}")
+            except Exception as update_err:
+                print(f"[Batch Parse ERROR] 更新文档 {item['doc_id']} 失败状态时出错: {update_err}")
+        finally:
+            with self._lock:
+                self._running.pop(item["id"], None)
+            self.wakeup()
+
+    def submit_batch(self, kb_id, docs):
+        batch_id = generate_uuid()
+        self.queue.enqueue(batch_id, kb_id, docs)
+        self.wakeup()
+        return batch_id
+
+    def cancel(self, kb_id):
+        return self.queue.cancel(kb_id)
+
+    def progress(self, kb_id):
+        """汇总知识库最近一次批量任务的进度、吞吐量和预计剩余时间"""
+        items = self.queue.latest_batch(kb_id)
+        if not items:
+            return None
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0, CANCELLED: 0}
+        for item in items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        total = len(items)
+        finished = counts[DONE] + counts[FAILED]
+        start_time = min(item["create_time"] for item in items) / 1000
+        begin_times = [item["begin_time"] for item in items if item["begin_time"]]
+        active = counts[QUEUED] + counts[RUNNING]
+        end_time = time.time() if active else max(item["update_time"] for item in items) / 1000
+
+        # 吞吐量按第一个文档开始解析的时间计算，排队等待的时间不计入
+        elapsed = end_time - (min(begin_times) / 1000 if begin_times else end_time)
+        docs_per_min = round(finished / (elapsed / 60), 2) if finished and elapsed > 0 else 0.0
+        eta_seconds = round(active / docs_per_min * 60) if active and docs_per_min else None
+
+        if active:
+            status = "cancelling" if counts[CANCELLED] else "running"
+            parsing = [item["doc_name"] for item in items if item["status"] == RUNNING]
+            message = f"正在解析: {', '.join(parsing)} ({finished}/{total})" if parsing else f"排队中 ({finished}/{total})"
+        elif counts[CANCELLED]:
+            status = "cancelled"
+            message = f"批量解析已取消。总计 {total} 个，成功 {counts[DONE]} 个，失败 {counts[FAILED]} 个，取消 {counts[CANCELLED]} 个。"
+        else:
+            status = "completed"
+            message = f"批量解析完成。总计 {total} 个，成功 {counts[DONE]} 个，失败 {counts[FAILED]} 个。耗时 {round(end_time - start_time, 2)} 秒。"
+
+        return {
+            "status": status,
+            "total": total,
+            "current": finished,
+            "message": message,
+            "start_time": start_time,
+            "queued": counts[QUEUED],
+            "running": counts[RUNNING],
+            "succeeded": counts[DONE],
+            "failed": counts[FAILED],
+            "cancelled": counts[CANCELLED],
+            "docs_per_min": docs_per_min,
+            "eta_seconds": eta_seconds
+        }
@@ -2,15 +2,19 @@ import os
 import tempfile
 import shutil
 import json
-import mysql.connector
 import time 
 import traceback
 import re
+import threading
 import requests
+import numpy as np
 from io import BytesIO
 from datetime import datetime
-from elasticsearch import Elasticsearch
-from database import MINIO_CONFIG, ES_CONFIG, DB_CONFIG, get_minio_client, get_es_client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from elasticsearch import Elasticsearch, helpers
+from database import MINIO_CONFIG, ES_CONFIG, get_db_connection, get_minio_client, get_es_client
 from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
 from magic_pdf.data.dataset import PymuDocDataset
 from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
@@ -18,6 +22,17 @@ from magic_pdf.config.enums import SupportedPdfParseMethod
 from magic_pdf.data.read_api import read_local_office
 from utils import generate_uuid
 
+# 批量写入配置
+PARSE_EMBEDDING_BATCH_SIZE = int(os.getenv("PARSE_EMBEDDING_BATCH_SIZE", "32"))  # 每次 embedding 请求的最大文本数
+PARSE_EMBEDDING_BATCH_TOKENS = int(os.getenv("PARSE_EMBEDDING_BATCH_TOKENS", "8192"))  # 每次 embedding 请求的估算 token 上限
+PARSE_MINIO_WORKERS = int(os.getenv("PARSE_MINIO_WORKERS", "8"))  # 上传 MinIO 的并发线程数
+PARSE_ES_BULK_SIZE = int(os.getenv("PARSE_ES_BULK_SIZE", "200"))  # 每次 ES bulk 写入的文档数
+PROGRESS_FLUSH_INTERVAL = int(os.getenv("PROGRESS_FLUSH_INTERVAL_MS", "1000")) / 1000  # 同一文档两次写入进度的最小间隔
+IMAGE_CHUNK_DISTANCE = 10  # 文本块与图片的距离间隔小于该值时认为两者相关
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
 
 # 自定义tokenizer和文本处理函数，替代rag.nlp中的功能
 def tokenize_text(text):
@@ -54,10 +69,106 @@ def merge_chunks(sections, chunk_token_num=128, delimiter="\n。；！？"):
 
 def _get_db_connection():
     """创建数据库连接"""
-    return mysql.connector.connect(**DB_CONFIG)
+    return get_db_connection()
+
+class _ProgressReporter:
+    """
+    合并文档解析过程中的进度更新
+
+    同一文档的进度在内存中合并，最多每 PROGRESS_FLUSH_INTERVAL 秒写一次数据库（进度为 1 时立即写入），
+    同时到期的多个文档用一条 UPDATE 写入，剩余的进度由后台线程定期写入。
+    """
+
+    def __init__(self):
+        self.pending = {}  # doc_id -> (progress, message)
+        self.last_flush = {}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # 保证直接写入的最终状态不会被旧进度覆盖
+        self._thread = None
+
+    def report(self, doc_id, progress=None, message=None):
+        if self._thread is None:
+            with self.lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._flush_loop, name="progress-flusher", daemon=True)
+                    self._thread.start()
+        now = time.time()
+        with self.lock:
+            old_progress, old_message = self.pending.get(doc_id, (None, None))
+            self.pending[doc_id] = (progress if progress is not None else old_progress,
+                                    message if message is not None else old_message)
+            if (progress is None or progress < 1) and now - self.last_flush.get(doc_id, 0) < PROGRESS_FLUSH_INTERVAL:
+                return
+            due = [d for d in self.pending if d == doc_id or now - self.last_flush.get(d, 0) >= PROGRESS_FLUSH_INTERVAL]
+        self.flush(due)
+
+    def discard(self, doc_id):
+        with self.lock:
+            self.pending.pop(doc_id, None)
+            self.last_flush.pop(doc_id, None)
+
+    def flush(self, doc_ids=None):
+        with self.write_lock:
+            now = time.time()
+            with self.lock:
+                doc_ids = list(self.pending) if doc_ids is None else [d for d in doc_ids if d in self.pending]
+                updates = {d: self.pending.pop(d) for d in doc_ids}
+                for d in doc_ids:
+                    if updates[d][0] is not None and updates[d][0] >= 1:
+                        self.last_flush.pop(d, None)
+                    else:
+                        self.last_flush[d] = now
+            if updates:
+                _update_documents_progress(updates)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(PROGRESS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Parser-ERROR] 写入解析进度失败: {e}")
+
+_PROGRESS_REPORTER = _ProgressReporter()
+
+def _update_documents_progress(updates):
+    """用一条 UPDATE 写入多个文档的进度，updates 为 {doc_id: (progress, message)}"""
+    conn = None
+    cursor = None
+    try:
+        conn = _get_db_connection()
+        cursor = conn.cursor()
+        progress_cases = [(doc_id, float(p)) for doc_id, (p, _) in updates.items() if p is not None]
+        message_cases = [(doc_id, m) for doc_id, (_, m) in updates.items() if m is not None]
+        updates_sql = []
+        params = []
+        if progress_cases:
+            updates_sql.append("progress = CASE id " + " ".join(["WHEN %s THEN %s"] * len(progress_cases)) + " ELSE progress END")
+            params.extend(v for case in progress_cases for v in case)
+        if message_cases:
+            updates_sql.append("progress_msg = CASE id " + " ".join(["WHEN %s THEN %s"] * len(message_cases)) + " ELSE progress_msg END")
+            params.extend(v for case in message_cases for v in case)
+        if not updates_sql:
+            return
+        doc_ids = list(updates)
+        query = f"UPDATE document SET {', '.join(updates_sql)} WHERE id IN ({', '.join(['%s'] * len(doc_ids))})"
+        cursor.execute(query, params + doc_ids)
+        conn.commit()
+    except Exception as e:
+        print(f"[Parser-ERROR] 批量更新文档 {list(updates)} 进度失败: {e}")
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
 
 def _update_document_progress(doc_id, progress=None, message=None, status=None, run=None, chunk_count=None, process_duration=None):
-    """更新数据库中文档的进度和状态"""
+    """更新数据库中文档的进度和状态（直接写入，并丢弃该文档尚未写入的合并进度）"""
+    with _PROGRESS_REPORTER.write_lock:
+        _PROGRESS_REPORTER.discard(doc_id)
+        _write_document_progress(doc_id, progress, message, status, run, chunk_count, process_duration)
+
+def _write_document_progress(doc_id, progress=None, message=None, status=None, run=None, chunk_count=None, process_duration=None):
     conn = None
     cursor = None
     try:
@@ -164,6 +275,151 @@ def _create_task_record(doc_id, chunk_ids_list):
             conn.close()
 
 
+def _get_http_session():
+    """获取复用连接池的 HTTP 会话，避免每次请求 embedding 都重新建立连接"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=["POST"])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+        return _http_session
+
+def _split_embedding_batches(texts):
+    """按条数和估算的 token 数（按字符数保守估算）把文本切分成批次，返回每批的下标列表"""
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = len(text)
+        if batch and (len(batch) >= PARSE_EMBEDDING_BATCH_SIZE or batch_tokens + tokens > PARSE_EMBEDDING_BATCH_TOKENS):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _request_embeddings(embedding_url, headers, model_name, texts):
+    """请求一批文本的 embedding，按返回的 index 对齐输入顺序"""
+    resp = _get_http_session().post(
+        embedding_url,
+        headers=headers,
+        json={"model": model_name, "input": texts},
+        timeout=15 + len(texts)
+    )
+    resp.raise_for_status()
+    data = sorted(resp.json()["data"], key=lambda d: d.get("index", 0))
+    if len(data) != len(texts):
+        raise ValueError(f"embedding 返回数量 {len(data)} 与请求数量 {len(texts)} 不一致")
+    return [d["embedding"] for d in data]
+
+def _embed_texts(texts, embedding_url, headers, model_name, progress_callback=None):
+    """
+    分批获取文本的 embedding
+
+    单批请求失败时改为逐条请求，仍然失败的文本返回空向量（与逐条处理时的行为一致）。
+    progress_callback(done, total) 在每批完成后调用。
+    """
+    vectors = [[] for _ in texts]
+    if not embedding_url:
+        print("[Parser-ERROR] 未配置 Embedding URL，无法获取embedding")
+        return vectors
+
+    batches = _split_embedding_batches(texts)
+    for batch_idx, idxs in enumerate(batches):
+        batch = [texts[i] for i in idxs]
+        try:
+            batch_vectors = _request_embeddings(embedding_url, headers, model_name, batch)
+        except Exception as e:
+            print(f"[Parser-WARNING] 批量获取embedding失败（{len(batch)} 条）: {e}，改为逐条请求")
+            batch_vectors = []
+            for text in batch:
+                try:
+                    batch_vectors.append(_request_embeddings(embedding_url, headers, model_name, [text])[0])
+                except Exception as e:
+                    print(f"[Parser-ERROR] 获取embedding失败: {e}")
+                    batch_vectors.append([])
+        for i, vec in zip(idxs, batch_vectors):
+            vectors[i] = vec
+        print(f"[Parser-INFO] 获取embedding成功，批次 {batch_idx + 1}/{len(batches)}，{len(batch)} 条")
+        if progress_callback:
+            progress_callback(batch_idx + 1, len(batches))
+    return vectors
+
+def _upload_text_chunks(minio_client, bucket_name, text_chunks):
+    """使用有界线程池并发上传文本块到 MinIO，返回上传成功的 chunk_id 集合"""
+    def upload(chunk):
+        data = chunk["content"].encode('utf-8')
+        minio_client.put_object(
+            bucket_name=bucket_name,
+            object_name=chunk["id"],
+            data=BytesIO(data),
+            length=len(data) # 使用字节长度
+        )
+        return chunk["id"]
+
+    uploaded = set()
+    with ThreadPoolExecutor(max_workers=PARSE_MINIO_WORKERS) as pool:
+        futures = {pool.submit(upload, chunk): chunk for chunk in text_chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                uploaded.add(future.result())
+            except Exception as e:
+                print(f"[Parser-ERROR] 上传文本块 {chunk['id']} (page: {chunk['page_idx']}, bbox: {chunk['bbox']}) 失败: {e}")
+    return uploaded
+
+def _bulk_index_chunks(es_client, index_name, es_docs, progress_callback=None):
+    """
+    通过 helpers.bulk 分批写入 ES，返回写入成功的 chunk_id 集合
+
+    es_docs 为 (chunk_id, es_doc) 列表，progress_callback(done, total) 在每批完成后调用。
+    """
+    indexed = set()
+    total_batches = (len(es_docs) + PARSE_ES_BULK_SIZE - 1) // PARSE_ES_BULK_SIZE
+    for batch_idx, start in enumerate(range(0, len(es_docs), PARSE_ES_BULK_SIZE)):
+        batch = es_docs[start:start + PARSE_ES_BULK_SIZE]
+        actions = [{"_index": index_name, "_id": chunk_id, "_source": es_doc} for chunk_id, es_doc in batch]
+        try:
+            _, errors = helpers.bulk(es_client, actions, raise_on_error=False, raise_on_exception=False)
+        except Exception as e:
+            print(f"[Parser-ERROR] 批量写入ES失败: {e}")
+            traceback.print_exc()
+            continue
+        failed = set()
+        for error in errors:
+            item = next(iter(error.values()))
+            failed.add(item.get("_id"))
+            print(f"[Parser-ERROR] 写入文本块 {item.get('_id')} 失败: {item.get('error')}")
+        indexed.update(chunk_id for chunk_id, _ in batch if chunk_id not in failed)
+        if progress_callback:
+            progress_callback(batch_idx + 1, total_batches)
+    return indexed
+
+def _assign_images(chunk_count, image_info_list):
+    """
+    为每个文本块找到关联的图片，返回与文本块一一对应的图片 URL 列表（无关联时为空字符串）
+
+    与逐个比较的规则一致：在距离小于 IMAGE_CHUNK_DISTANCE 的图片中取最后一张。
+    图片按出现顺序记录，位置单调不减，因此可以用 searchsorted 一次算出所有文本块的结果。
+    """
+    if not chunk_count or not image_info_list:
+        return [""] * chunk_count
+    positions = np.array([img_info["position"] for img_info in image_info_list])
+    urls = [img_info["url"] for img_info in image_info_list]
+    chunk_idx = np.arange(chunk_count)
+    # 位置小于 i + IMAGE_CHUNK_DISTANCE 的最后一张图片
+    nearest = np.searchsorted(positions, chunk_idx + IMAGE_CHUNK_DISTANCE, side="left") - 1
+    valid = nearest >= 0
+    valid[valid] = positions[nearest[valid]] > chunk_idx[valid] - IMAGE_CHUNK_DISTANCE
+    return [urls[k] if ok else "" for k, ok in zip(nearest, valid)]
+
 def get_text_from_block(block):
     """从 preproc_blocks 中的一个块提取所有文本内容"""
     block_text = ""
@@ -225,7 +481,7 @@ def perform_parse(doc_id, doc_info, file_info, embedding_config):
 
         # 进度更新回调 (直接调用内部更新函数)
         def update_progress(prog=None, msg=None):
-            _update_document_progress(doc_id, progress=prog, message=msg)
+            _PROGRESS_REPORTER.report(doc_id, prog, msg)
             print(f"[Parser-PROGRESS] Doc: {doc_id}, Progress: {prog}, Message: {msg}")
 
         # 1. 从 MinIO 获取文件内容
@@ -371,6 +627,8 @@ def perform_parse(doc_id, doc_info, file_info, embedding_config):
 
         chunk_count = 0
         chunk_ids_list = []
+        text_chunks = [] # 待批量写入的文本块
+        bucket_policy_set = False
         middle_block_idx = 0 # 用于按顺序匹配 block_info_list
         processed_text_chunks = 0 # 记录处理的文本块数量
 
@@ -383,40 +641,7 @@ def perform_parse(doc_id, doc_info, file_info, embedding_config):
                 
                 # 过滤 markdown 特殊符号
                 content = re.sub(r"[!#\\$/]", "", content)
-                q_1024_vec = [] # 初始化为空列表
-                
-                # 获取embedding向量
-                try:
-                    # embedding_resp = requests.post(
-                    #     "http://localhost:8000/v1/embeddings",
-                    #     json={
-                    #         "model": "bge-m3",  # 你的embedding模型名
-                    #         "input": content
-                    #     },
-                    #     timeout=10
-                    # )
-                    headers = {"Content-Type": "application/json"}
-                    if embedding_api_key:
-                        headers["Authorization"] = f"Bearer {embedding_api_key}"
-
-                    embedding_resp = requests.post(
-                        embedding_url, # 使用动态构建的 URL
-                        headers=headers, # 添加 headers (包含可能的 API Key)
-                        json={
-                            "model": embedding_model_name,  # 使用动态获取或默认的模型名
-                            "input": content
-                        },
-                        timeout=15 # 稍微增加超时时间
-                    )
-                    
-                    embedding_resp.raise_for_status()
-                    embedding_data = embedding_resp.json()
-                    q_1024_vec = embedding_data["data"][0]["embedding"]
-                    print(f"[Parser-INFO] 获取embedding成功，长度: {len(q_1024_vec)}")
-                except Exception as e:
-                    print(f"[Parser-ERROR] 获取embedding失败: {e}")
-                    q_1024_vec = []
-                    
+
                 chunk_id = generate_uuid()
                 page_idx = 0  # 默认页面索引
                 bbox = [0, 0, 0, 0] # 默认 bbox
@@ -431,53 +656,13 @@ def perform_parse(doc_id, doc_info, file_info, embedding_config):
                     # 如果 block_info_list 耗尽，打印警告
                     if processed_text_chunks == len(block_info_list) + 1: # 只在第一次耗尽时警告一次
                          print(f"[Parser-WARNING] middle_data 提供的块信息少于 content_list 中的文本块数量。后续文本块将使用默认 page/bbox。")
-                        
-                try:
-                    # 上传文本块到 MinIO
-                    minio_client.put_object(
-                        bucket_name=output_bucket,
-                        object_name=chunk_id,
-                        data=BytesIO(content.encode('utf-8')),
-                        length=len(content.encode('utf-8')) # 使用字节长度
-                    )
-                    
-                    # 准备ES文档
-                    content_tokens = tokenize_text(content) # 分词
-                    current_time_es = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    current_timestamp_es = datetime.now().timestamp()
-
-                    # 转换坐标格式
-                    x1, y1, x2, y2 = bbox
-                    bbox_reordered = [x1, x2, y1, y2]
-
-                    es_doc = {
-                        "doc_id": doc_id,
-                        "kb_id": kb_id,
-                        "docnm_kwd": doc_info['name'],
-                        "title_tks": doc_info['name'],
-                        "title_sm_tks": doc_info['name'],
-                        "content_with_weight": content,
-                        "content_ltks": " ".join(content_tokens), # 字符串类型
-                        "content_sm_ltks": " ".join(content_tokens),  # 字符串类型
-                        "page_num_int": [page_idx + 1],
-                        "position_int": [[page_idx + 1] + bbox_reordered], # 格式: [[page, x1, x2, y1, y2]]
-                        "top_int": [1],
-                        "create_time": current_time_es,
-                        "create_timestamp_flt": current_timestamp_es,
-                        "img_id": "",
-                        "q_1024_vec": q_1024_vec
-                    }
 
-                    # 存储到Elasticsearch
-                    es_client.index(index=index_name, id=chunk_id, document=es_doc) # 使用 document 参数
-
-                    chunk_count += 1
-                    chunk_ids_list.append(chunk_id)
-                    # print(f"成功处理文本块 {chunk_count}/{len(content_list)}") # 可以取消注释用于详细调试
-
-                except Exception as e:
-                    print(f"[Parser-ERROR] 处理文本块 {chunk_idx} (page: {page_idx}, bbox: {bbox}) 失败: {e}")
-                    traceback.print_exc() # 打印更详细的错误
+                text_chunks.append({
+                    "id": chunk_id,
+                    "content": content,
+                    "page_idx": page_idx,
+                    "bbox": bbox
+                })
 
             elif chunk_data["type"] == "image":
                 img_path_relative = chunk_data.get('img_path')
@@ -504,19 +689,21 @@ def perform_parse(doc_id, doc_info, file_info, embedding_config):
                         content_type=content_type
                     )
 
-                    # 设置图片的公共访问权限
-                    policy = {
-                        "Version": "2012-10-17",
-                        "Statement": [
-                            {
-                                "Effect": "Allow",
-                                "Principal": {"AWS": "*"},
-                                "Action": ["s3:GetObject"],
-                                "Resource": [f"arn:aws:s3:::{kb_id}/{img_key}"]
-                            }
-                        ]
-                    }
-                    minio_client.set_bucket_policy(kb_id, json.dumps(policy))
+                    # 设置图片的公共访问权限，每个桶只需设置一次
+                    if not bucket_policy_set:
+                        policy = {
+                            "Version": "2012-10-17",
+                            "Statement": [
+                                {
+                                    "Effect": "Allow",
+                                    "Principal": {"AWS": "*"},
+                                    "Action": ["s3:GetObject"],
+                                    "Resource": [f"arn:aws:s3:::{output_bucket}/images/*"]
+                                }
+                            ]
+                        }
+                        minio_client.set_bucket_policy(output_bucket, json.dumps(policy))
+                        bucket_policy_set = True
 
                     print(f"成功上传图片: {img_key}")
                     minio_endpoint = MINIO_CONFIG["endpoint"]
@@ -536,53 +723,67 @@ def perform_parse(doc_id, doc_info, file_info, embedding_config):
                 except Exception as e:
                     print(f"[Parser-ERROR] 上传图片 {img_path_abs} 失败: {e}")
         
+        # 批量获取 embedding
+        headers = {"Content-Type": "application/json"}
+        if embedding_api_key:
+            headers["Authorization"] = f"Bearer {embedding_api_key}"
+        vectors = _embed_texts(
+            [chunk["content"] for chunk in text_chunks], embedding_url, headers, embedding_model_name,
+            lambda done, total: update_progress(0.95 + 0.02 * done / total, f"生成向量 {done}/{total} 批")
+        )
+
+        # 并发上传文本块到 MinIO
+        uploaded_ids = _upload_text_chunks(minio_client, output_bucket, text_chunks)
+        update_progress(0.97, f"已上传 {len(uploaded_ids)}/{len(text_chunks)} 个文本块")
+
+        # 4. 计算文本块的图像关联，随文档一起写入ES
+        uploaded_chunks = [(chunk, vec) for chunk, vec in zip(text_chunks, vectors) if chunk["id"] in uploaded_ids]
+        img_urls = _assign_images(len(uploaded_chunks), image_info_list)
+        print(f"[Parser-INFO] {sum(1 for url in img_urls if url)} 个文本块关联了图片。")
+
+        # 准备ES文档并批量写入
+        es_docs = []
+        for (chunk, q_1024_vec), img_url in zip(uploaded_chunks, img_urls):
+            content = chunk["content"]
+            page_idx = chunk["page_idx"]
+            content_tokens = tokenize_text(content) # 分词
+            current_time_es = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            current_timestamp_es = datetime.now().timestamp()
+
+            # 转换坐标格式
+            x1, y1, x2, y2 = chunk["bbox"]
+            bbox_reordered = [x1, x2, y1, y2]
+
+            es_docs.append((chunk["id"], {
+                "doc_id": doc_id,
+                "kb_id": kb_id,
+                "docnm_kwd": doc_info['name'],
+                "title_tks": doc_info['name'],
+                "title_sm_tks": doc_info['name'],
+                "content_with_weight": content,
+                "content_ltks": " ".join(content_tokens), # 字符串类型
+                "content_sm_ltks": " ".join(content_tokens),  # 字符串类型
+                "page_num_int": [page_idx + 1],
+                "position_int": [[page_idx + 1] + bbox_reordered], # 格式: [[page, x1, x2, y1, y2]]
+                "top_int": [1],
+                "create_time": current_time_es,
+                "create_timestamp_flt": current_timestamp_es,
+                "img_id": img_url,
+                "q_1024_vec": q_1024_vec
+            }))
+
+        indexed_ids = _bulk_index_chunks(
+            es_client, index_name, es_docs,
+            lambda done, total: update_progress(0.97 + 0.02 * done / total, f"写入索引 {done}/{total} 批")
+        )
+        chunk_ids_list = [chunk_id for chunk_id, _ in es_docs if chunk_id in indexed_ids]
+        chunk_count = len(chunk_ids_list)
+
         # 打印匹配总结信息
         print(f"[Parser-INFO] 共处理 {processed_text_chunks} 个文本块。")
         if middle_block_idx < len(block_info_list):
              print(f"[Parser-WARNING] middle_data 中还有 {len(block_info_list) - middle_block_idx} 个提取的块信息未被使用。")
         
-        # 4. 更新文本块的图像信息 
-        if image_info_list and chunk_ids_list:
-            conn = None
-            cursor = None
-            try:
-                conn = _get_db_connection()
-                cursor = conn.cursor()
-                
-                # 为每个文本块找到最近的图片
-                for i, chunk_id in enumerate(chunk_ids_list):
-                    # 找到与当前文本块最近的图片
-                    nearest_image = None
-                    
-                    for img_info in image_info_list:
-                        # 计算文本块与图片的"距离"
-                        distance = abs(i - img_info["position"])  # 使用位置差作为距离度量
-                        # 如果文本块与图片的距离间隔小于10个块,则认为块与图片是相关的
-                        if distance < 10:
-                            nearest_image = img_info
-                    
-                    # 如果找到了最近的图片，则更新文本块的img_id
-                    if nearest_image:
-                        # 更新ES中的文档
-                        direct_update = {
-                            "doc": {
-                                "img_id": nearest_image["url"]
-                            }
-                        }
-                        es_client.update(index=index_name, id=chunk_id, body=direct_update, refresh=True)
-                        
-                        index_name = f"ragflow_{tenant_id}"
-                        
-                        print(f"[Parser-INFO] 更新文本块 {chunk_id} 的图片关联: {nearest_image['url']}")
-                
-            except Exception as e:
-                print(f"[Parser-ERROR] 更新文本块图片关联失败: {e}")
-            finally:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-
         # 5. 更新最终状态
         process_duration = time.time() - start_time
         _update_document_progress(doc_id, progress=1.0, message="解析完成", status='1', run='3', chunk_count=chunk_count, process_duration=process_duration)
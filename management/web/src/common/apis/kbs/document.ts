@@ -168,6 +168,13 @@ export interface SequentialBatchTaskProgress {
   current: number
   message: string
   start_time?: number
+  queued?: number
+  running?: number
+  succeeded?: number
+  failed?: number
+  cancelled?: number
+  docs_per_min?: number // 吞吐量（文档/分钟）
+  eta_seconds?: number | null // 预计剩余时间（秒）
 }
 
 export interface BatchProgressResponse {
@@ -182,3 +189,19 @@ export function getSequentialBatchParseProgressApi(kbId: string) {
     method: "get"
   })
 }
+
+/** 取消知识库批量解析（仅取消排队中的文档） */
+export function cancelSequentialBatchParseApi(kbId: string) {
+  interface CancelBatchResponse {
+    code: number
+    message?: string
+    data?: {
+      message: string
+      cancelled: number
+    }
+  }
+  return request<CancelBatchResponse>({
+    url: `/api/v1/knowledgebases/${kbId}/batch_parse_sequential/cancel`,
+    method: "post"
+  })
+}
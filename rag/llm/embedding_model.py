@@ -94,7 +94,7 @@ class DefaultEmbedding(Base):
         self._model_name = DefaultEmbedding._model_name
 
     def encode(self, texts: list):
-        batch_size = 16
+        batch_size = int(os.environ.get("EMBEDDING_BATCH_SIZE", 16))
         texts = [truncate(t, 2048) for t in texts]
         token_count = 0
         for t in texts:
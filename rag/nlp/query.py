@@ -17,6 +17,7 @@
 import logging
 import json
 import re
+import numpy as np
 from rag.utils.doc_store_conn import MatchTextExpr
 
 from rag.nlp import rag_tokenizer, term_weight, synonym
@@ -235,15 +236,28 @@ class FulltextQueryer:
 
     def hybrid_similarity(self, avec, bvecs, atks, btkss, tkweight=0.3, vtweight=0.7):
         from sklearn.metrics.pairwise import cosine_similarity as CosineSimilarity
-        import numpy as np
 
-        sims = CosineSimilarity([avec], bvecs)
+        sims = CosineSimilarity([avec], np.asarray(bvecs, dtype=np.float64))
         tksim = self.token_similarity(atks, btkss)
         if np.sum(sims[0]) == 0:
             return np.array(tksim), tksim, sims[0]
         return np.array(sims[0]) * vtweight + np.array(tksim) * tkweight, tksim, sims[0]
 
-    def token_similarity(self, atks, btkss):
+    def hybrid_similarity_matrix(self, avecs, bvecs, atkss, btkss, tkweight=0.3, vtweight=0.7):
+        """hybrid_similarity of every row of avecs/atkss against all of bvecs/btkss, as (len(avecs), len(bvecs)) matrices."""
+        from sklearn.metrics.pairwise import cosine_similarity as CosineSimilarity
+
+        sims = CosineSimilarity(np.asarray(avecs, dtype=np.float64), np.asarray(bvecs, dtype=np.float64))
+        # the candidates' token sets are shared by every row
+        btk_sets = [set(tks.split() if isinstance(tks, str) else tks) for tks in btkss]
+        tksims = np.array([self.token_similarity(atks, btkss, btk_sets) for atks in atkss]).reshape(sims.shape)
+        hsims = sims * vtweight + tksims * tkweight
+        for i in range(len(sims)):
+            if np.sum(sims[i]) == 0:
+                hsims[i] = tksims[i]
+        return hsims, tksims, sims
+
+    def token_similarity(self, atks, btkss, btk_sets=None):
         def toDict(tks):
             d = {}
             if isinstance(tks, str):
@@ -254,9 +268,31 @@ class FulltextQueryer:
                 d[t] += c
             return d
 
-        atks = toDict(atks)
-        btkss = [toDict(tks) for tks in btkss]
-        return [self.similarity(atks, btks) for btks in btkss]
+        # similarity() only checks whether the query terms occur in a candidate, so instead of
+        # weighting every candidate token, build a (candidates x query terms) membership matrix
+        # and accumulate the query weights column by column, in the same order as similarity().
+        qtwt = toDict(atks)
+        terms = list(qtwt.keys())
+        hits = np.zeros((len(btkss), len(terms)), dtype=bool)
+        if btk_sets is not None:
+            for j, t in enumerate(terms):
+                hits[:, j] = [t in tks for tks in btk_sets]
+        else:
+            col = {t: j for j, t in enumerate(terms)}
+            for i, tks in enumerate(btkss):
+                if isinstance(tks, str):
+                    tks = tks.split()
+                for t in tks:
+                    j = col.get(t)
+                    if j is not None:
+                        hits[i, j] = True
+        s = np.full(len(btkss), 1e-9)
+        for j, t in enumerate(terms):
+            s = s + hits[:, j] * qtwt[t]
+        q = 1e-9
+        for v in qtwt.values():
+            q += v
+        return list(s / q)
 
     def similarity(self, qtwt, dtwt):
         if isinstance(dtwt, type("")):
@@ -15,7 +15,6 @@
 #
 
 import logging
-import copy
 import datrie
 import math
 import os
@@ -26,6 +25,7 @@ from hanziconv import HanziConv
 from nltk import word_tokenize
 from nltk.stem import PorterStemmer, WordNetLemmatizer
 from api.utils.file_utils import get_project_base_directory
+from rag.utils import Memoized
 
 
 class RagTokenizer:
@@ -145,7 +145,8 @@ class RagTokenizer:
                 break
 
             if k in self.trie_:
-                pretks = copy.deepcopy(preTks)
+                # entries are immutable tuples, a shallow copy is enough
+                pretks = preTks[:]
                 if k in self.trie_:
                     pretks.append((t, self.trie_[k]))
                 else:
@@ -398,6 +399,14 @@ class RagTokenizer:
 
         return " ".join(self.english_normalize_(res))
 
+    def tokenize_many(self, lines):
+        """Tokenize a batch of lines, segmenting each distinct line only once."""
+        done = {}
+        for line in lines:
+            if line not in done:
+                done[line] = self.tokenize(line)
+        return [done[line] for line in lines]
+
 
 def is_chinese(s):
     if s >= u'\u4e00' and s <= u'\u9fa5':
@@ -431,16 +440,45 @@ def naiveQie(txt):
     return tks
 
 
+# Per-process memo sizes (entries); texts longer than TOKENIZER_CACHE_MAX_LEN chars, i.e. chunk bodies, are not memoized
+TOKENIZER_CACHE_SIZE = int(os.environ.get("TOKENIZER_CACHE_SIZE", 8192))
+TOKENIZER_CACHE_MAX_LEN = int(os.environ.get("TOKENIZER_CACHE_MAX_LEN", 512))
+TOKEN_TAG_CACHE_SIZE = int(os.environ.get("TOKEN_TAG_CACHE_SIZE", 65536))
+
 tokenizer = RagTokenizer()
-tokenize = tokenizer.tokenize
-fine_grained_tokenize = tokenizer.fine_grained_tokenize
-tag = tokenizer.tag
-freq = tokenizer.freq
-loadUserDict = tokenizer.loadUserDict
-addUserDict = tokenizer.addUserDict
+tokenize = Memoized(tokenizer.tokenize, TOKENIZER_CACHE_SIZE, TOKENIZER_CACHE_MAX_LEN)
+tokenize_many = tokenizer.tokenize_many
+fine_grained_tokenize = Memoized(tokenizer.fine_grained_tokenize, TOKENIZER_CACHE_SIZE, TOKENIZER_CACHE_MAX_LEN)
+tag = Memoized(tokenizer.tag, TOKEN_TAG_CACHE_SIZE)
+freq = Memoized(tokenizer.freq, TOKEN_TAG_CACHE_SIZE)
 tradi2simp = tokenizer._tradi2simp
 strQ2B = tokenizer._strQ2B
 
+
+def set_cache_size(tokenize_size=None, tag_size=None):
+    """Resize the memo caches of this process; resizing drops their content."""
+    if tokenize_size is not None:
+        tokenize.resize(tokenize_size)
+        fine_grained_tokenize.resize(tokenize_size)
+    if tag_size is not None:
+        tag.resize(tag_size)
+        freq.resize(tag_size)
+
+
+def loadUserDict(fnm):
+    tokenizer.loadUserDict(fnm)
+    set_cache_size(tokenize.maxsize, tag.maxsize)
+
+
+def addUserDict(fnm):
+    tokenizer.addUserDict(fnm)
+    set_cache_size(tokenize.maxsize, tag.maxsize)
+
+
+def cache_stats():
+    return {"tokenize": tokenize.stats(), "fine_grained_tokenize": fine_grained_tokenize.stats(),
+            "tag": tag.stats(), "freq": freq.stats()}
+
 if __name__ == '__main__':
     tknzr = RagTokenizer(debug=True)
     # huqie.addUserDict("/tmp/tmp.new.tks.dict")
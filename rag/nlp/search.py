@@ -13,20 +13,41 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import ast
 import logging
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 
 from rag.settings import TAG_FLD, PAGERANK_FLD
 from rag.utils import rmSpace
 from rag.nlp import rag_tokenizer, query
 import numpy as np
 from rag.utils.doc_store_conn import DocStoreConnection, MatchDenseExpr, FusionExpr, OrderByExpr
+from rag.utils.embed_cache import EMBED_CACHE
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
 
+# a piece is cited when its best similarity reaches the threshold; if no piece of the
+# answer does, the threshold decays until one does or it falls below the minimum
+CITATION_THRESHOLD = 0.63
+CITATION_THRESHOLD_DECAY = 0.8
+CITATION_THRESHOLD_MIN = 0.3
 
 def index_name(uid): return f"ragflow_{uid}"
 
 
+@lru_cache(maxsize=4096)
+def _literal_tag_feas(txt: str) -> dict:
+    return ast.literal_eval(txt)
+
+
+def parse_tag_feas(v) -> dict:
+    """TAG_FLD comes back from the doc store as the repr of a {tag: score} dict."""
+    if isinstance(v, dict):
+        return v
+    return _literal_tag_feas(v)
+
+
 class Dealer:
     def __init__(self, dataStore: DocStoreConnection):
         self.qryr = query.FulltextQueryer()
@@ -44,7 +65,11 @@ class Dealer:
         group_docs: list[list] | None = None
 
     def get_vector(self, txt, emb_mdl, topk=10, similarity=0.1):
-        qv, _ = emb_mdl.encode_queries(txt)
+        qv = EMBED_CACHE.get(emb_mdl.llm_name, txt, "query")
+        if qv is None:
+            qv, _ = emb_mdl.encode_queries(txt)
+            if len(np.array(qv).shape) == 1:
+                EMBED_CACHE.set(emb_mdl.llm_name, txt, qv, "query")
         shape = np.array(qv).shape
         if len(shape) > 1:
             raise Exception(
@@ -194,11 +219,9 @@ class Dealer:
     def trans2floats(txt):
         return [float(t) for t in txt.split("\t")]
 
-    def insert_citations(self, answer, chunks, chunk_v,
-                         embd_mdl, tkweight=0.1, vtweight=0.9):
-        assert len(chunks) == len(chunk_v)
-        if not chunks:
-            return answer, set([])
+    @staticmethod
+    def split_citation_pieces(answer):
+        """Split an answer into sentences, code blocks kept whole; "".join(pieces) == answer."""
         pieces = re.split(r"(```)", answer)
         if len(pieces) >= 3:
             i = 0
@@ -225,6 +248,44 @@ class Dealer:
             if re.match(r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])", pieces[i]):
                 pieces[i - 1] += pieces[i][0]
                 pieces[i] = pieces[i][1:]
+        return pieces
+
+    def citation_similarities(self, pieces, chunks, chunk_v, embd_mdl,
+                              tkweight=0.1, vtweight=0.9, chunks_tks=None):
+        """
+        (pieces x chunks) hybrid similarity matrix and the per-piece citation score
+        (row max * 0.99). chunks_tks can be passed in when scoring the same chunks repeatedly.
+        """
+        ans_v, _ = embd_mdl.encode(pieces)
+        for i in range(len(chunk_v)):
+            if len(ans_v[0]) != len(chunk_v[i]):
+                chunk_v[i] = [0.0]*len(ans_v[0])
+                logging.warning("The dimension of query and chunk do not match: {} vs. {}".format(len(ans_v[0]), len(chunk_v[i])))
+
+        assert len(ans_v[0]) == len(chunk_v[0]), "The dimension of query and chunk do not match: {} vs. {}".format(
+            len(ans_v[0]), len(chunk_v[0]))
+
+        if chunks_tks is None:
+            chunks_tks = self.citation_tokens(chunks)
+        # similarities don't depend on the threshold, compute the (pieces x chunks) matrix once
+        pieces_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(a)).split() for a in pieces]
+        sims, _, _ = self.qryr.hybrid_similarity_matrix(ans_v, chunk_v, pieces_tks, chunks_tks,
+                                                        tkweight, vtweight)
+        return sims, np.max(sims, axis=1) * 0.99
+
+    def citation_tokens(self, chunks):
+        return [rag_tokenizer.tokenize(self.qryr.rmWWW(ck)).split() for ck in chunks]
+
+    @staticmethod
+    def cite_piece(sim, mx):
+        return list(set([str(ii) for ii in range(len(sim)) if sim[ii] > mx]))[:4]
+
+    def insert_citations(self, answer, chunks, chunk_v,
+                         embd_mdl, tkweight=0.1, vtweight=0.9):
+        assert len(chunks) == len(chunk_v)
+        if not chunks:
+            return answer, set([])
+        pieces = self.split_citation_pieces(answer)
         idx = []
         pieces_ = []
         for i, t in enumerate(pieces):
@@ -236,45 +297,28 @@ class Dealer:
         if not pieces_:
             return answer, set([])
 
-        ans_v, _ = embd_mdl.encode(pieces_)
-        for i in range(len(chunk_v)):
-            if len(ans_v[0]) != len(chunk_v[i]):
-                chunk_v[i] = [0.0]*len(ans_v[0])
-                logging.warning("The dimension of query and chunk do not match: {} vs. {}".format(len(ans_v[0]), len(chunk_v[i])))
-
-        assert len(ans_v[0]) == len(chunk_v[0]), "The dimension of query and chunk do not match: {} vs. {}".format(
-            len(ans_v[0]), len(chunk_v[0]))
-
-        chunks_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(ck)).split()
-                      for ck in chunks]
+        sims, mxs = self.citation_similarities(pieces_, chunks, chunk_v, embd_mdl, tkweight, vtweight)
         cites = {}
-        thr = 0.63
-        while thr > 0.3 and len(cites.keys()) == 0 and pieces_ and chunks_tks:
+        thr = CITATION_THRESHOLD
+        while thr > CITATION_THRESHOLD_MIN and len(cites.keys()) == 0:
             for i, a in enumerate(pieces_):
-                sim, tksim, vtsim = self.qryr.hybrid_similarity(ans_v[i],
-                                                                chunk_v,
-                                                                rag_tokenizer.tokenize(
-                                                                    self.qryr.rmWWW(pieces_[i])).split(),
-                                                                chunks_tks,
-                                                                tkweight, vtweight)
-                mx = np.max(sim) * 0.99
-                logging.debug("{} SIM: {}".format(pieces_[i], mx))
-                if mx < thr:
+                logging.debug("{} SIM: {}".format(pieces_[i], mxs[i]))
+                if mxs[i] < thr:
                     continue
-                cites[idx[i]] = list(
-                    set([str(ii) for ii in range(len(chunk_v)) if sim[ii] > mx]))[:4]
-            thr *= 0.8
+                cites[idx[i]] = self.cite_piece(sims[i], mxs[i])
+            thr *= CITATION_THRESHOLD_DECAY
+
+        return self.render_citations(pieces, cites)
 
+    @staticmethod
+    def render_citations(pieces, cites, seted=None):
+        """Join the pieces with ##i$$ markers after the cited ones, each chunk cited once."""
         res = ""
-        seted = set([])
+        seted = set([]) if seted is None else seted
         for i, p in enumerate(pieces):
             res += p
-            if i not in idx:
-                continue
             if i not in cites:
                 continue
-            for c in cites[i]:
-                assert int(c) < len(chunk_v)
             for c in cites[i]:
                 if c in seted:
                     continue
@@ -297,7 +341,7 @@ class Dealer:
         q_denor = np.sqrt(np.sum([s*s for t,s in query_rfea.items() if t != PAGERANK_FLD]))
         for i in search_res.ids:
             nor, denor = 0, 0
-            for t, sc in eval(search_res.field[i].get(TAG_FLD, "{}")).items():
+            for t, sc in parse_tag_feas(search_res.field[i].get(TAG_FLD, "{}")).items():
                 if t in query_rfea:
                     nor += query_rfea[t] * sc
                 denor += sc * sc
@@ -314,26 +358,28 @@ class Dealer:
         _, keywords = self.qryr.question(query)
         vector_size = len(sres.query_vector)
         vector_column = f"q_{vector_size}_vec"
-        zero_vector = [0.0] * vector_size
-        ins_embd = []
-        for chunk_id in sres.ids:
-            vector = sres.field[chunk_id].get(vector_column, zero_vector)
-            if isinstance(vector, str):
-                vector = [float(v) for v in vector.split("\t")]
-            ins_embd.append(vector)
-        if not ins_embd:
+        if not sres.ids:
             return [], [], []
+        ins_embd = np.zeros((len(sres.ids), vector_size), dtype=np.float64)
+        for j, chunk_id in enumerate(sres.ids):
+            vector = sres.field[chunk_id].get(vector_column)
+            if vector is None:
+                continue
+            if isinstance(vector, str):
+                vector = vector.split("\t")
+            ins_embd[j] = np.asarray(vector, dtype=np.float64)
 
         for i in sres.ids:
             if isinstance(sres.field[i].get("important_kwd", []), str):
                 sres.field[i]["important_kwd"] = [sres.field[i]["important_kwd"]]
+        # token similarity only depends on which terms a chunk contains, so the title/keyword/question
+        # repetition weights of the full-text query need not be materialized here
         ins_tw = []
         for i in sres.ids:
-            content_ltks = sres.field[i][cfield].split()
-            title_tks = [t for t in sres.field[i].get("title_tks", "").split() if t]
-            question_tks = [t for t in sres.field[i].get("question_tks", "").split() if t]
-            important_kwd = sres.field[i].get("important_kwd", [])
-            tks = content_ltks + title_tks * 2 + important_kwd * 5 + question_tks * 6
+            tks = set(sres.field[i][cfield].split())
+            tks.update(sres.field[i].get("title_tks", "").split())
+            tks.update(sres.field[i].get("question_tks", "").split())
+            tks.update(sres.field[i].get("important_kwd", []))
             ins_tw.append(tks)
 
         ## For rank feature(tag_fea) scores.
@@ -405,6 +451,13 @@ class Dealer:
         ranks = {"total": 0, "chunks": [], "doc_aggs": {}}
         if not question:
             return ranks
+        # 命中检索缓存则直接返回（知识库版本变化时自动失效）
+        cache_key = RETRIEVAL_CACHE.key(kb_ids, question, tenant_ids, page, page_size, similarity_threshold,
+                                        vector_similarity_weight, top, doc_ids, aggs, highlight, rank_feature,
+                                        getattr(embd_mdl, "llm_name", None), getattr(rerank_mdl, "llm_name", None))
+        cached = RETRIEVAL_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
         # 设置重排序页面限制
         RERANK_PAGE_LIMIT = 3
         # 构建检索请求参数
@@ -502,6 +555,7 @@ class Dealer:
                                                        v in sorted(ranks["doc_aggs"].items(),
                                                                    key=lambda x: x[1]["count"] * -1)]
         ranks["chunks"] = ranks["chunks"][:page_size]
+        RETRIEVAL_CACHE.set(cache_key, ranks)
 
         return ranks
 
@@ -567,3 +621,111 @@ class Dealer:
         tag_fea = sorted([(a, round(0.1*(c + 1) / (cnt + S) / max(1e-6, all_tags.get(a, 0.0001)))) for a, c in aggs],
                          key=lambda x: x[1] * -1)[:topn_tags]
         return {a: max(1, c) for a, c in tag_fea}
+
+
+if __name__ == "__main__":
+    # Benchmark Dealer.rerank / token_similarity against the former list based path on
+    # 1024 synthetic candidates (the retrieval topk); ranks must be identical.
+    import copy
+    import random
+    from timeit import default_timer as timer
+
+    from sklearn.metrics.pairwise import cosine_similarity as CosineSimilarity
+
+    topk, dim, rounds = 1024, 1024, 5
+    # rerank only needs the queryer, not a doc store
+    dealer = Dealer.__new__(Dealer)
+    dealer.qryr = query.FulltextQueryer()
+    question = "How does the retrieval cache handle knowledge base updates and chunk vectors?"
+    _, keywords = dealer.qryr.question(question)
+
+    random.seed(0)
+    qterms = " ".join(keywords).split()
+    vocab = [f"w{i}" for i in range(5000)]
+    tags = [f"tag{i}" for i in range(20)]
+    query_vector = [random.gauss(0, 1) for _ in range(dim)]
+    field, ids = {}, []
+    for i in range(topk):
+        tks = random.choices(vocab, k=random.randint(40, 200)) + random.sample(qterms, random.randint(0, len(qterms)))
+        random.shuffle(tks)
+        vector = [random.gauss(0, 1) for _ in range(dim)]
+        chunk = {"content_ltks": " ".join(tks),
+                 "title_tks": " ".join(random.sample(qterms + vocab[:50], 3)),
+                 "important_kwd": random.sample(qterms + vocab[:50], 2) if i % 3 else "w1",
+                 TAG_FLD: repr({t: random.randint(1, 9) for t in random.sample(tags, 3)}),
+                 PAGERANK_FLD: random.randint(0, 3)}
+        if i % 7 == 1:
+            chunk[f"q_{dim}_vec"] = "\t".join(str(v) for v in vector)
+        elif i % 13 != 2:
+            chunk[f"q_{dim}_vec"] = vector
+        field[f"c{i}"] = chunk
+        ids.append(f"c{i}")
+    sres = Dealer.SearchResult(total=topk, ids=ids, query_vector=query_vector, field=field)
+    rank_feature = {tags[0]: 3, tags[5]: 1, PAGERANK_FLD: 10}
+
+    def old_token_similarity(atks, btkss):
+        def toDict(tks):
+            d = {}
+            if isinstance(tks, str):
+                tks = tks.split()
+            for t, c in dealer.qryr.tw.weights(tks, preprocess=False):
+                if t not in d:
+                    d[t] = 0
+                d[t] += c
+            return d
+
+        atks = toDict(atks)
+        btkss = [toDict(tks) for tks in btkss]
+        return [dealer.qryr.similarity(atks, btks) for btks in btkss]
+
+    def old_rerank(sres, query, tkweight=0.3, vtweight=0.7, cfield="content_ltks", rank_feature=None):
+        _, keywords = dealer.qryr.question(query)
+        vector_size = len(sres.query_vector)
+        vector_column = f"q_{vector_size}_vec"
+        zero_vector = [0.0] * vector_size
+        ins_embd = []
+        for chunk_id in sres.ids:
+            vector = sres.field[chunk_id].get(vector_column, zero_vector)
+            if isinstance(vector, str):
+                vector = [float(v) for v in vector.split("\t")]
+            ins_embd.append(vector)
+        for i in sres.ids:
+            if isinstance(sres.field[i].get("important_kwd", []), str):
+                sres.field[i]["important_kwd"] = [sres.field[i]["important_kwd"]]
+        ins_tw = []
+        for i in sres.ids:
+            content_ltks = sres.field[i][cfield].split()
+            title_tks = [t for t in sres.field[i].get("title_tks", "").split() if t]
+            question_tks = [t for t in sres.field[i].get("question_tks", "").split() if t]
+            important_kwd = sres.field[i].get("important_kwd", [])
+            tks = content_ltks + title_tks * 2 + important_kwd * 5 + question_tks * 6
+            ins_tw.append(tks)
+        rank_fea = dealer._rank_feature_scores(rank_feature, sres)
+        sims = CosineSimilarity([sres.query_vector], ins_embd)
+        tksim = old_token_similarity(keywords, ins_tw)
+        if np.sum(sims[0]) == 0:
+            return np.array(tksim) + rank_fea, tksim, sims[0]
+        return np.array(sims[0]) * vtweight + np.array(tksim) * tkweight + rank_fea, tksim, sims[0]
+
+    def bench(name, old_fn, new_fn):
+        t_old, t_new = 0., 0.
+        for _ in range(rounds):
+            # rerank normalizes important_kwd in place, so each run gets its own copy
+            old_sres, new_sres = copy.deepcopy(sres), copy.deepcopy(sres)
+            st = timer()
+            expect = old_fn(old_sres)
+            t_old += timer() - st
+            st = timer()
+            got = new_fn(new_sres)
+            t_new += timer() - st
+        assert np.array_equal(np.argsort(np.array(expect) * -1, kind="stable"),
+                              np.argsort(np.array(got) * -1, kind="stable")), name
+        print(f"{name:20s} {topk} candidates x {rounds}  old {t_old:.3f}s  new {t_new:.3f}s"
+              f"  x{t_old / max(t_new, 1e-9):.1f}  identical ranks")
+
+    bench("token_similarity",
+          lambda s: old_token_similarity(keywords, [s.field[i]["content_ltks"] for i in s.ids]),
+          lambda s: dealer.qryr.token_similarity(keywords, [s.field[i]["content_ltks"] for i in s.ids]))
+    bench("rerank",
+          lambda s: old_rerank(s, question, rank_feature=rank_feature)[0],
+          lambda s: dealer.rerank(s, question, rank_feature=rank_feature)[0])
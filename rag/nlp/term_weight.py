@@ -21,8 +21,13 @@ import re
 import os
 import numpy as np
 from rag.nlp import rag_tokenizer
+from rag.utils import Memoized
 from api.utils.file_utils import get_project_base_directory
 
+# Per-process memo of Dealer.weights, keyed by the token tuple; longer token lists are not memoized
+TERM_WEIGHT_CACHE_SIZE = int(os.environ.get("TERM_WEIGHT_CACHE_SIZE", 8192))
+TERM_WEIGHT_CACHE_MAX_LEN = int(os.environ.get("TERM_WEIGHT_CACHE_MAX_LEN", 64))
+
 
 class Dealer:
     def __init__(self):
@@ -88,6 +93,8 @@ class Dealer:
             self.df = load_dict(os.path.join(fnm, "term.freq"))
         except Exception:
             logging.warning("Load term.freq FAIL!")
+        self._weights = Memoized(lambda tks, preprocess: self.weights_(list(tks), preprocess),
+                                 TERM_WEIGHT_CACHE_SIZE, TERM_WEIGHT_CACHE_MAX_LEN)
 
     def pretoken(self, txt, num=False, stpwd=True):
         patt = [
@@ -168,6 +175,12 @@ class Dealer:
         return tks
 
     def weights(self, tks, preprocess=True):
+        return list(self._weights(tuple(tks), preprocess))
+
+    def cache_stats(self):
+        return self._weights.stats()
+
+    def weights_(self, tks, preprocess=True):
         def skill(t):
             if t not in self.sk:
                 return 1
@@ -36,6 +36,9 @@ from rag.nlp import search, rag_tokenizer
 from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
 from rag.settings import DOC_MAXIMUM_SIZE, SVR_QUEUE_NAME, print_rag_settings, TAG_FLD, PAGERANK_FLD
 from rag.utils import num_tokens_from_string
+from rag.utils.embed_cache import EMBED_CACHE
+from rag.utils.embedding_batcher import get_embedding_batcher, EMBEDDING_BATCH_SIZE
+from rag.utils.progress_reporter import PROGRESS_REPORTER
 from rag.utils.redis_conn import REDIS_CONN
 from rag.utils.storage_factory import STORAGE_IMPL
 from graphrag.utils import chat_limiter
@@ -79,6 +82,21 @@ MAX_CONCURRENT_CHUNK_BUILDERS = int(os.environ.get('MAX_CONCURRENT_CHUNK_BUILDER
 task_limiter = trio.CapacityLimiter(MAX_CONCURRENT_TASKS)
 chunk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
 
+# Doc store bulk indexing
+DOC_BULK_SIZE_BYTES = int(os.environ.get('DOC_BULK_SIZE_BYTES', str(8 * 1024 * 1024)))
+DOC_BULK_MAX_CHUNKS = int(os.environ.get('DOC_BULK_MAX_CHUNKS', "256"))
+MAX_CONCURRENT_BULKS = int(os.environ.get('MAX_CONCURRENT_BULKS', "4"))
+CHUNK_IDS_CHECKPOINT = int(os.environ.get('CHUNK_IDS_CHECKPOINT', "1024"))
+bulk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_BULKS)
+
+# Staged pipeline: chunks stream through upload/enrich -> embed -> index with bounded channels
+PIPELINE_ENABLED = int(os.environ.get('TASK_PIPELINE_ENABLED', "0"))
+PIPELINE_BATCH_SIZE = int(os.environ.get('TASK_PIPELINE_BATCH_SIZE', "32"))
+PIPELINE_CHANNEL_SIZE = int(os.environ.get('TASK_PIPELINE_CHANNEL_SIZE', "4"))
+PIPELINE_ENRICH_WORKERS = int(os.environ.get('TASK_PIPELINE_ENRICH_WORKERS', "2"))
+PIPELINE_EMBEDDING_WORKERS = int(os.environ.get('TASK_PIPELINE_EMBEDDING_WORKERS', "2"))
+PIPELINE_INDEX_WORKERS = int(os.environ.get('TASK_PIPELINE_INDEX_WORKERS', "2"))
+
 # SIGUSR1 handler: start tracemalloc and take snapshot
 def start_tracemalloc_and_snapshot(signum, frame):
     if not tracemalloc.is_tracing():
@@ -120,7 +138,7 @@ def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing...
     try:
         if prog is not None and prog < 0:
             msg = "[ERROR]" + msg
-        cancel = TaskService.do_cancel(task_id)
+        cancel = PROGRESS_REPORTER.is_canceled(task_id)
 
         if cancel:
             msg += " [Canceled]"
@@ -132,11 +150,7 @@ def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing...
                     msg = f"Page({from_page + 1}~{to_page + 1}): " + msg
         if msg:
             msg = datetime.now().strftime("%H:%M:%S") + " " + msg
-        d = {"progress_msg": msg}
-        if prog is not None:
-            d["progress"] = prog
-
-        TaskService.update_progress(task_id, d)
+        PROGRESS_REPORTER.report(task_id, prog, msg)
 
         close_connection()
         if cancel:
@@ -189,11 +203,11 @@ async def get_storage_binary(bucket, name):
     return await trio.to_thread.run_sync(lambda: STORAGE_IMPL.get(bucket, name))
 
 
-async def build_chunks(task, progress_callback):
+async def parse_chunks(task, progress_callback):
     if task["size"] > DOC_MAXIMUM_SIZE:
         set_progress(task["id"], prog=-1, msg="File size exceeds( <= %dMb )" %
                                               (int(DOC_MAXIMUM_SIZE / 1024 / 1024)))
-        return []
+        return None
 
     chunker = FACTORY[task["parser_id"].lower()]
     try:
@@ -226,7 +240,21 @@ async def build_chunks(task, progress_callback):
         progress_callback(-1, "Internal server error while chunking: %s" % str(e).replace("'", ""))
         logging.exception("Chunking {}/{} got exception".format(task["location"], task["name"]))
         raise
+    return cks
+
+
+async def build_chunks(task, progress_callback):
+    cks = await parse_chunks(task, progress_callback)
+    if cks is None:
+        return None
+    if not cks:
+        return []
+    docs = await upload_chunks(task, cks)
+    await enrich_chunks(task, docs, progress_callback)
+    return docs
 
+
+async def upload_chunks(task, cks):
     docs = []
     doc = {
         "doc_id": task["doc_id"],
@@ -266,7 +294,10 @@ async def build_chunks(task, progress_callback):
         del d["image"]
         docs.append(d)
     logging.info("MINIO PUT({}):{}".format(task["name"], el))
+    return docs
+
 
+async def enrich_chunks(task, docs, progress_callback, examples=None):
     if task["parser_config"].get("auto_keywords", 0):
         st = timer()
         progress_callback(msg="Start to generate keywords for every chunk ...")
@@ -313,7 +344,8 @@ async def build_chunks(task, progress_callback):
         topn_tags = task["kb_parser_config"].get("topn_tags", 3)
         S = 1000
         st = timer()
-        examples = []
+        if examples is None:
+            examples = []
         all_tags = get_tags_from_cache(kb_ids)
         if not all_tags:
             all_tags = settings.retrievaler.all_tags_in_portion(tenant_id, kb_ids, S)
@@ -346,8 +378,6 @@ async def build_chunks(task, progress_callback):
                 nursery.start_soon(lambda: doc_content_tagging(chat_mdl, d, topn_tags))
         progress_callback(msg="Tagging {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
-    return docs
-
 
 def init_kb(row, vector_size: int):
     idxnm = search.index_name(row["tenant_id"])
@@ -357,7 +387,10 @@ def init_kb(row, vector_size: int):
 async def embedding(docs, mdl, parser_config=None, callback=None):
     if parser_config is None:
         parser_config = {}
-    batch_size = 16
+    if not docs:
+        return 0, 0
+    batcher = get_embedding_batcher(mdl)
+    batch_size = EMBEDDING_BATCH_SIZE
     tts, cnts = [], []
     for d in docs:
         tts.append(d.get("docnm_kwd", "Title"))
@@ -369,22 +402,28 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
             c = "None"
         cnts.append(c)
 
+    # only texts missing from the embedding cache are encoded; the title takes a slot of the first batch,
+    # so no request exceeds batch_size. Batches of concurrent tasks are merged (and re-split) by the batcher
     tk_count = 0
-    if len(tts) == len(cnts):
-        vts, c = await trio.to_thread.run_sync(lambda: mdl.encode(tts[0: 1]))
-        tts = np.concatenate([vts for _ in range(len(tts))], axis=0)
-        tk_count += c
-
-    cnts_ = np.array([])
-    for i in range(0, len(cnts), batch_size):
-        vts, c = await trio.to_thread.run_sync(lambda: mdl.encode(cnts[i: i + batch_size]))
-        if len(cnts_) == 0:
-            cnts_ = vts
-        else:
-            cnts_ = np.concatenate((cnts_, vts), axis=0)
+    texts = tts[0: 1] + cnts
+    vects = EMBED_CACHE.get_many(mdl.llm_name, texts)
+    missing = [i for i, v in enumerate(vects) if v is None]
+    for j in range(0, len(missing), batch_size):
+        idx = missing[j: j + batch_size]
+        vts, c = await batcher.encode([texts[i] for i in idx])
+        EMBED_CACHE.set_many(mdl.llm_name, [texts[i] for i in idx], vts)
+        for i, v in zip(idx, vts):
+            vects[i] = v
         tk_count += c
-        callback(prog=0.7 + 0.2 * (i + 1) / len(cnts), msg="")
-    cnts = cnts_
+        callback(prog=0.7 + 0.2 * (j + len(idx)) / len(missing), msg="")
+    if len(missing) < len(texts):
+        # cache hits still count toward the document's token_num, the encoder only reports what it encoded
+        missed = set(missing)
+        tk_count += sum(num_tokens_from_string(texts[i]) for i in range(len(texts)) if i not in missed)
+        logging.info("Embedding cache hit {}/{} texts".format(len(texts) - len(missing), len(texts)))
+    vects = np.array(vects)
+    tts = np.concatenate([vects[0: 1] for _ in range(len(tts))], axis=0)
+    cnts = vects[1:]
 
     title_w = float(parser_config.get("filename_embd_weight", 0.1))
     vects = (title_w * tts + (1 - title_w) *
@@ -440,6 +479,191 @@ async def run_raptor(row, chat_mdl, embd_mdl, vector_size, callback=None):
     return res, tk_count
 
 
+def estimate_payload_size(chunk: dict) -> int:
+    """Rough byte size of a chunk in a bulk request; vectors dominate, ~20 bytes per serialized float."""
+    size = 0
+    for k, v in chunk.items():
+        if isinstance(v, str):
+            size += len(v.encode("utf-8"))
+        elif k.endswith("_vec") and isinstance(v, list):
+            size += len(v) * 20
+        elif isinstance(v, list):
+            size += sum(len(str(x)) for x in v)
+        else:
+            size += len(str(v))
+    return size
+
+
+def split_bulk_batches(chunks: list[dict]) -> list[list[dict]]:
+    """Group chunks into bulk requests bounded by DOC_BULK_SIZE_BYTES and DOC_BULK_MAX_CHUNKS."""
+    batches, batch, batch_size = [], [], 0
+    for ck in chunks:
+        sz = estimate_payload_size(ck)
+        if batch and (batch_size + sz > DOC_BULK_SIZE_BYTES or len(batch) >= DOC_BULK_MAX_CHUNKS):
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(ck)
+        batch_size += sz
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def save_chunk_ids(task, indexed_ids):
+    try:
+        TaskService.update_chunk_ids(task["id"], " ".join(indexed_ids))
+    except DoesNotExist:
+        logging.warning(f"do_handle_task update_chunk_ids failed since task {task['id']} is unknown.")
+        return False
+    return True
+
+
+async def rollback_chunks(task, chunk_ids):
+    chunk_ids = list(set(chunk_ids))
+    await trio.to_thread.run_sync(lambda: DocumentService.delete_chunks({"id": chunk_ids}, task["tenant_id"], task["kb_id"]))
+
+
+async def insert_chunks(task, chunks, progress_callback, indexed_ids=None, save=True):
+    """
+    Write chunks into the doc store and record their ids on the task row.
+    Bulk requests are sized by payload bytes and sent concurrently (bounded by bulk_limiter);
+    chunk ids are written to the task row every CHUNK_IDS_CHECKPOINT chunks and once at the end.
+    `indexed_ids` carries the ids already written for this task by earlier calls; with save=False
+    the caller records them on the task row itself.
+    Returns False if the task vanished meanwhile and the chunks were rolled back.
+    """
+    if indexed_ids is None:
+        indexed_ids = []
+    task_tenant_id = task["tenant_id"]
+    task_dataset_id = task["kb_id"]
+    idxnm = search.index_name(task_tenant_id)
+    batches = split_bulk_batches(chunks)
+    done = 0
+    checkpoint = 0
+
+    async def bulk(batch):
+        nonlocal done
+        async with bulk_limiter:
+            st = timer()
+            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(batch, idxnm, task_dataset_id))
+            logging.info("Bulk insert {} chunks of doc({}): {:.3f}s".format(len(batch), task["name"], timer() - st))
+        if doc_store_result:
+            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
+            progress_callback(-1, msg=error_message)
+            raise Exception(error_message)
+        indexed_ids.extend([chunk["id"] for chunk in batch])
+        done += len(batch)
+        progress_callback(prog=0.8 + 0.1 * done / len(chunks), msg="")
+
+    st = timer()
+    for i in range(0, len(batches), MAX_CONCURRENT_BULKS):
+        async with trio.open_nursery() as nursery:
+            for batch in batches[i: i + MAX_CONCURRENT_BULKS]:
+                nursery.start_soon(bulk, batch)
+        if save and done - checkpoint >= CHUNK_IDS_CHECKPOINT and done < len(chunks):
+            checkpoint = done
+            if not save_chunk_ids(task, indexed_ids):
+                await rollback_chunks(task, indexed_ids + [chunk["id"] for chunk in chunks])
+                return False
+    if save and not save_chunk_ids(task, indexed_ids):
+        await rollback_chunks(task, indexed_ids + [chunk["id"] for chunk in chunks])
+        return False
+    logging.info("Bulk insert doc({}): {} chunks in {} requests, elapsed: {:.2f}s".format(task["name"], len(chunks),
+                                                                                       len(batches), timer() - st))
+    return True
+
+
+async def run_pipeline(task, embedding_model, progress_callback):
+    """
+    Staged variant of build_chunks -> embedding -> insert_chunks.
+    Once the document is parsed, its chunks flow in batches of PIPELINE_BATCH_SIZE through
+    bounded channels: upload/enrich -> embed -> index, each stage with its own workers,
+    so the first batches are indexed while later ones are still being enriched or embedded.
+    Returns (chunk_ids, token_count); chunk_ids is [] if the document has no chunk and None if
+    parsing or indexing failed (the failure is already reported).
+    """
+    cks = await parse_chunks(task, progress_callback)
+    if cks is None:
+        return None, 0
+    if not cks:
+        return [], 0
+    progress_callback(msg="Generate {} chunks".format(len(cks)))
+    total = len(cks)
+    token_count = 0
+    chunk_ids = []
+    examples = []
+    aborted = False
+    checkpoint = 0
+
+    def stage_callback(prog=None, msg=""):
+        # per-batch chatter of the stages is dropped, only failures are reported
+        if prog is not None and prog < 0:
+            progress_callback(prog, msg)
+
+    async def feed(send_channel):
+        async with send_channel:
+            for i in range(0, total, PIPELINE_BATCH_SIZE):
+                await send_channel.send(cks[i: i + PIPELINE_BATCH_SIZE])
+
+    async def enrich(receive_channel, send_channel):
+        async with receive_channel, send_channel:
+            async for batch in receive_channel:
+                docs = await upload_chunks(task, batch)
+                await enrich_chunks(task, docs, stage_callback, examples)
+                await send_channel.send(docs)
+
+    async def embed(receive_channel, send_channel):
+        nonlocal token_count
+        async with receive_channel, send_channel:
+            async for docs in receive_channel:
+                try:
+                    tk_count, _ = await embedding(docs, embedding_model, task["parser_config"], stage_callback)
+                except Exception as e:
+                    error_message = "Generate embedding error:{}".format(str(e))
+                    progress_callback(-1, error_message)
+                    logging.exception(error_message)
+                    raise
+                token_count += tk_count
+                await send_channel.send(docs)
+
+    async def index(receive_channel):
+        nonlocal aborted, checkpoint
+        async with receive_channel:
+            async for docs in receive_channel:
+                if aborted:
+                    continue
+                # ids are recorded on the task row every CHUNK_IDS_CHECKPOINT chunks and once at the end
+                await insert_chunks(task, docs, stage_callback, chunk_ids, save=False)
+                if len(chunk_ids) - checkpoint >= CHUNK_IDS_CHECKPOINT and len(chunk_ids) < total:
+                    checkpoint = len(chunk_ids)
+                    if not save_chunk_ids(task, chunk_ids):
+                        aborted = True
+                        continue
+                progress_callback(prog=0.1 + 0.8 * len(chunk_ids) / total, msg="")
+
+    st = timer()
+    async with trio.open_nursery() as nursery:
+        send_raw, receive_raw = trio.open_memory_channel(PIPELINE_CHANNEL_SIZE)
+        send_enriched, receive_enriched = trio.open_memory_channel(PIPELINE_CHANNEL_SIZE)
+        send_embedded, receive_embedded = trio.open_memory_channel(PIPELINE_CHANNEL_SIZE)
+        nursery.start_soon(feed, send_raw)
+        for _ in range(PIPELINE_ENRICH_WORKERS):
+            nursery.start_soon(enrich, receive_raw.clone(), send_enriched.clone())
+        for _ in range(PIPELINE_EMBEDDING_WORKERS):
+            nursery.start_soon(embed, receive_enriched.clone(), send_embedded.clone())
+        for _ in range(PIPELINE_INDEX_WORKERS):
+            nursery.start_soon(index, receive_embedded.clone())
+        # the stages own clones; close the originals so channels end once the workers finish
+        for ch in (receive_raw, send_enriched, receive_enriched, send_embedded, receive_embedded):
+            await ch.aclose()
+    if aborted or not save_chunk_ids(task, chunk_ids):
+        await rollback_chunks(task, chunk_ids)
+        return None, 0
+    logging.info("Pipeline doc({}), page({}-{}), chunks({}), elapsed: {:.2f}".format(task["name"], task["from_page"],
+                                                                                    task["to_page"], total, timer() - st))
+    return chunk_ids, token_count
+
+
 async def do_handle_task(task):
     task_id = task["id"]
     task_from_page = task["from_page"]
@@ -500,6 +724,23 @@ async def do_handle_task(task):
         await run_graphrag(task, task_language, with_resolution, with_community, chat_model, embedding_model, progress_callback)
         progress_callback(prog=1.0, msg="Knowledge Graph done ({:.2f}s)".format(timer() - start_ts))
         return
+    elif PIPELINE_ENABLED:
+        # Standard chunking methods, staged
+        start_ts = timer()
+        chunk_ids, token_count = await run_pipeline(task, embedding_model, progress_callback)
+        if chunk_ids is None:
+            return
+        if not chunk_ids:
+            progress_callback(1., msg=f"No chunk built from {task_document_name}")
+            return
+        DocumentService.increment_chunk_num(task_doc_id, task_dataset_id, token_count, len(set(chunk_ids)), 0)
+        task_time_cost = timer() - task_start_ts
+        progress_callback(prog=1.0, msg="Pipeline done ({:.2f}s). Task done ({:.2f}s)".format(timer() - start_ts, task_time_cost))
+        logging.info(
+            "Chunk doc({}), page({}-{}), chunks({}), token({}), elapsed:{:.2f}".format(task_document_name, task_from_page,
+                                                                                       task_to_page, len(chunk_ids),
+                                                                                       token_count, task_time_cost))
+        return
     else:
         # Standard chunking methods
         start_ts = timer()
@@ -528,24 +769,8 @@ async def do_handle_task(task):
 
     chunk_count = len(set([chunk["id"] for chunk in chunks]))
     start_ts = timer()
-    doc_store_result = ""
-    es_bulk_size = 4
-    for b in range(0, len(chunks), es_bulk_size):
-        doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + es_bulk_size], search.index_name(task_tenant_id), task_dataset_id))
-        if b % 128 == 0:
-            progress_callback(prog=0.8 + 0.1 * (b + 1) / len(chunks), msg="")
-        if doc_store_result:
-            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
-            progress_callback(-1, msg=error_message)
-            raise Exception(error_message)
-        chunk_ids = [chunk["id"] for chunk in chunks[:b + es_bulk_size]]
-        chunk_ids_str = " ".join(chunk_ids)
-        try:
-            TaskService.update_chunk_ids(task["id"], chunk_ids_str)
-        except DoesNotExist:
-            logging.warning(f"do_handle_task update_chunk_ids failed since task {task['id']} is unknown.")
-            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, search.index_name(task_tenant_id), task_dataset_id))
-            return
+    if not await insert_chunks(task, chunks, progress_callback):
+        return
     logging.info("Indexing doc({}), page({}-{}), chunks({}), elapsed: {:.2f}".format(task_document_name, task_from_page,
                                                                                      task_to_page, len(chunks),
                                                                                      timer() - start_ts))
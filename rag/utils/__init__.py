@@ -16,6 +16,7 @@
 
 import os
 import re
+from functools import lru_cache
 import tiktoken
 from api.utils.file_utils import get_project_base_directory
 
@@ -31,6 +32,37 @@ def singleton(cls, *args, **kw):
     return _singleton
 
 
+class Memoized:
+    """
+    Resizable LRU memoization of a function of hashable arguments.
+    Calls whose first argument is longer than `max_len` bypass the cache (0: no limit).
+    """
+
+    def __init__(self, fn, maxsize=4096, max_len=0):
+        self.fn = fn
+        self.max_len = max_len
+        self.resize(maxsize)
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self.bypassed = 0
+        self._cached = lru_cache(maxsize=maxsize)(self.fn) if maxsize > 0 else None
+
+    def __call__(self, *args):
+        if self._cached is None or (self.max_len and len(args[0]) > self.max_len):
+            self.bypassed += 1
+            return self.fn(*args)
+        return self._cached(*args)
+
+    def stats(self):
+        if self._cached is None:
+            return {"hits": 0, "misses": 0, "hit_rate": 0., "size": 0, "maxsize": 0, "bypassed": self.bypassed}
+        info = self._cached.cache_info()
+        total = info.hits + info.misses
+        return {"hits": info.hits, "misses": info.misses, "hit_rate": info.hits / total if total else 0.,
+                "size": info.currsize, "maxsize": info.maxsize, "bypassed": self.bypassed}
+
+
 def rmSpace(txt):
     txt = re.sub(r"([^a-z0-9.,\)>]) +([^ ])", r"\1\2", txt, flags=re.IGNORECASE)
     return re.sub(r"([^ ]) +([^a-z0-9.,\(<])", r"\1\2", txt, flags=re.IGNORECASE)
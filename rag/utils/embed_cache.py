@@ -0,0 +1,222 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Content-addressed embedding cache shared by chunk embedding, RAPTOR, graphrag and query encoding.
+
+Vectors are keyed by xxhash64 of (embedding model, kind, normalized text) and looked up in
+an in-process LRU first, then in the second tier selected by EMBED_CACHE_BACKEND:
+  - "redis": binary float16/float32 blobs (base64, the shared connection decodes responses)
+  - "disk":  binary blobs under EMBED_CACHE_DIR, oldest files evicted past EMBED_CACHE_DISK_BYTES
+  - "none":  in-process LRU only
+"""
+import base64
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import xxhash
+
+from api.utils.file_utils import get_project_base_directory
+from rag.utils.redis_conn import REDIS_CONN
+
+EMBED_CACHE_BACKEND = os.environ.get("EMBED_CACHE_BACKEND", "redis").lower()
+EMBED_CACHE_DTYPE = os.environ.get("EMBED_CACHE_DTYPE", "float32").lower()
+EMBED_CACHE_MEMORY_BYTES = int(os.environ.get("EMBED_CACHE_MEMORY_BYTES", 256 * 1024 * 1024))
+EMBED_CACHE_TTL = int(os.environ.get("EMBED_CACHE_TTL", 7 * 24 * 3600))
+EMBED_CACHE_DIR = os.environ.get("EMBED_CACHE_DIR", os.path.join(get_project_base_directory(), "embed_cache"))
+EMBED_CACHE_DISK_BYTES = int(os.environ.get("EMBED_CACHE_DISK_BYTES", 4 * 1024 * 1024 * 1024))
+
+_DTYPES = {b"2": np.float16, b"4": np.float32}
+_DTYPE_CODES = {"float16": b"2", "float32": b"4"}
+
+
+def normalize(txt: str) -> str:
+    return unicodedata.normalize("NFC", str(txt)).strip()
+
+
+def cache_key(llmnm, txt, kind="doc") -> str:
+    hasher = xxhash.xxh64()
+    hasher.update(str(llmnm).encode("utf-8"))
+    hasher.update(b"\0" + kind.encode("utf-8") + b"\0")
+    hasher.update(normalize(txt).encode("utf-8"))
+    return "embd:" + hasher.hexdigest()
+
+
+def dumps(vec) -> bytes:
+    code = _DTYPE_CODES.get(EMBED_CACHE_DTYPE, b"4")
+    return code + np.asarray(vec, dtype=_DTYPES[code]).tobytes()
+
+
+def loads(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob[1:], dtype=_DTYPES[blob[:1]]).astype(np.float32)
+
+
+class _LRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, k):
+        with self.lock:
+            v = self.data.get(k)
+            if v is not None:
+                self.data.move_to_end(k)
+            return v
+
+    def set(self, k, v):
+        with self.lock:
+            old = self.data.pop(k, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self.data[k] = v
+            self.bytes += v.nbytes
+            while self.bytes > self.max_bytes and self.data:
+                _, ev = self.data.popitem(last=False)
+                self.bytes -= ev.nbytes
+
+
+class _DiskStore:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.bytes = None
+        self.lock = threading.Lock()
+
+    def _path(self, k):
+        k = k.split(":")[-1]
+        return os.path.join(self.root, k[:2], k)
+
+    def _files(self):
+        for d, _, fnms in os.walk(self.root):
+            for f in fnms:
+                p = os.path.join(d, f)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                yield p, st.st_size, st.st_mtime
+
+    def get_many(self, keys):
+        res = []
+        for k in keys:
+            try:
+                with open(self._path(k), "rb") as f:
+                    res.append(f.read())
+            except OSError:
+                res.append(None)
+        return res
+
+    def set_many(self, kvs):
+        with self.lock:
+            if self.bytes is None:
+                os.makedirs(self.root, exist_ok=True)
+                self.bytes = sum(sz for _, sz, _ in self._files())
+            for k, blob in kvs.items():
+                p = self._path(k)
+                os.makedirs(os.path.dirname(p), exist_ok=True)
+                with open(p, "wb") as f:
+                    f.write(blob)
+                self.bytes += len(blob)
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = sorted(self._files(), key=lambda x: x[2])
+        target = self.max_bytes * 0.9
+        total = sum(sz for _, sz, _ in files)
+        for p, sz, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(p)
+                total -= sz
+            except OSError:
+                pass
+        self.bytes = total
+
+
+class EmbeddingCache:
+    def __init__(self):
+        self.lru = _LRU(EMBED_CACHE_MEMORY_BYTES)
+        self.disk = _DiskStore(EMBED_CACHE_DIR, EMBED_CACHE_DISK_BYTES) if EMBED_CACHE_BACKEND == "disk" else None
+        self.hits = 0
+        self.misses = 0
+
+    def _remote_get(self, keys):
+        if self.disk:
+            return self.disk.get_many(keys)
+        if EMBED_CACHE_BACKEND == "redis":
+            return [base64.b64decode(v) if v else None for v in REDIS_CONN.mget(keys)]
+        return [None] * len(keys)
+
+    def _remote_set(self, kvs):
+        if self.disk:
+            self.disk.set_many(kvs)
+        elif EMBED_CACHE_BACKEND == "redis":
+            REDIS_CONN.set_many({k: base64.b64encode(v).decode("ascii") for k, v in kvs.items()}, EMBED_CACHE_TTL)
+
+    def get_many(self, llmnm, texts, kind="doc") -> list:
+        """Cached vectors for texts, None where missing."""
+        keys = [cache_key(llmnm, t, kind) for t in texts]
+        res = [self.lru.get(k) for k in keys]
+        missing = [i for i, v in enumerate(res) if v is None]
+        if missing:
+            try:
+                blobs = self._remote_get([keys[i] for i in missing])
+            except Exception:
+                logging.exception("EmbeddingCache remote get got exception")
+                blobs = [None] * len(missing)
+            for i, blob in zip(missing, blobs):
+                if blob:
+                    res[i] = loads(blob)
+                    self.lru.set(keys[i], res[i])
+        hits = len([v for v in res if v is not None])
+        self.hits += hits
+        self.misses += len(res) - hits
+        return res
+
+    def set_many(self, llmnm, texts, vectors, kind="doc"):
+        kvs = {}
+        for t, v in zip(texts, vectors):
+            k = cache_key(llmnm, t, kind)
+            v = np.asarray(v, dtype=np.float32)
+            self.lru.set(k, v)
+            kvs[k] = dumps(v)
+        if not kvs:
+            return
+        try:
+            self._remote_set(kvs)
+        except Exception:
+            logging.exception("EmbeddingCache remote set got exception")
+
+    def get(self, llmnm, txt, kind="doc"):
+        return self.get_many(llmnm, [txt], kind)[0]
+
+    def set(self, llmnm, txt, vec, kind="doc"):
+        self.set_many(llmnm, [txt], [vec], kind)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.,
+                "memory_bytes": self.lru.bytes, "memory_entries": len(self.lru.data), "backend": EMBED_CACHE_BACKEND}
+
+
+EMBED_CACHE = EmbeddingCache()
@@ -0,0 +1,146 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import os
+from timeit import default_timer as timer
+
+import numpy as np
+import trio
+
+from rag.utils import num_tokens_from_string
+
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 16))
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", 8192))
+EMBEDDING_BATCH_WAIT = float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", 20)) / 1000
+
+
+class _Request:
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.tokens = [num_tokens_from_string(t) for t in texts]
+        self.done = trio.Event()
+        self.vectors = None
+        self.used_tokens = 0
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """
+    Merges encode requests of all concurrent trio tasks that use the same embedding model
+    into batches of at most EMBEDDING_BATCH_SIZE texts / EMBEDDING_BATCH_TOKENS tokens.
+
+    The first caller of an empty queue becomes the leader: it waits until the queue is
+    full or EMBEDDING_BATCH_WAIT has passed, then encodes everything queued and hands
+    every caller back its own rows.
+    """
+
+    def __init__(self, mdl):
+        self.mdl = mdl
+        self._pending = []
+        self._pending_tokens = 0
+        self._pending_texts = 0
+        self._full = trio.Event()
+        self.calls = 0
+        self.texts = 0
+
+    def _is_full(self):
+        return self._pending_texts >= EMBEDDING_BATCH_SIZE or self._pending_tokens >= EMBEDDING_BATCH_TOKENS
+
+    async def encode(self, texts: list[str]):
+        if not texts:
+            return np.array([]), 0
+        req = _Request(texts)
+        leader = not self._pending
+        self._pending.append(req)
+        self._pending_texts += len(texts)
+        self._pending_tokens += sum(req.tokens)
+        if self._is_full():
+            self._full.set()
+
+        if leader:
+            try:
+                with trio.move_on_after(EMBEDDING_BATCH_WAIT):
+                    await self._full.wait()
+            finally:
+                # followers are parked on their events, so the batch runs even if the leader is cancelled
+                batch = self._pending
+                self._pending, self._pending_texts, self._pending_tokens = [], 0, 0
+                self._full = trio.Event()
+                with trio.CancelScope(shield=True):
+                    await self._run(batch)
+        else:
+            await req.done.wait()
+
+        if req.error:
+            raise req.error
+        return req.vectors, req.used_tokens
+
+    def _split(self, texts, tokens):
+        batches, b, tks = [], [], 0
+        for i, t in enumerate(texts):
+            if b and (len(b) >= EMBEDDING_BATCH_SIZE or tks + tokens[i] > EMBEDDING_BATCH_TOKENS):
+                batches.append(b)
+                b, tks = [], 0
+            b.append(t)
+            tks += tokens[i]
+        if b:
+            batches.append(b)
+        return batches
+
+    async def _run(self, batch: list[_Request]):
+        texts, tokens = [], []
+        for req in batch:
+            texts.extend(req.texts)
+            tokens.extend(req.tokens)
+        try:
+            st = timer()
+            vects, used_tokens = [], 0
+            for b in self._split(texts, tokens):
+                vts, c = await trio.to_thread.run_sync(lambda: self.mdl.encode(b))
+                vects.append(vts)
+                used_tokens += c
+                self.calls += 1
+            vects = np.concatenate(vects, axis=0)
+            self.texts += len(texts)
+            logging.debug("EmbeddingBatcher({}) encoded {} texts of {} requests in {:.3f}s".format(
+                self.mdl.llm_name, len(texts), len(batch), timer() - st))
+        except Exception as e:
+            for req in batch:
+                req.error = e
+                req.done.set()
+            return
+
+        total = max(sum(tokens), 1)
+        i = 0
+        for req in batch:
+            req.vectors = vects[i: i + len(req.texts)]
+            req.used_tokens = int(used_tokens * sum(req.tokens) / total)
+            i += len(req.texts)
+            req.done.set()
+
+
+_BATCHERS = {}
+
+
+def get_embedding_batcher(mdl) -> EmbeddingBatcher:
+    """Process-wide batcher for the (tenant, embedding model) of the given LLMBundle."""
+    key = (mdl.tenant_id, mdl.llm_name)
+    if key not in _BATCHERS:
+        _BATCHERS[key] = EmbeddingBatcher(mdl)
+    else:
+        # keep the freshest bundle so changed credentials are picked up
+        _BATCHERS[key].mdl = mdl
+    return _BATCHERS[key]
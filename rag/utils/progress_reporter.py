@@ -0,0 +1,182 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Coalescing task progress reporter.
+
+Progress callbacks are merged in memory per task and written at most every
+PROGRESS_FLUSH_INTERVAL_MS (terminal states, progress >= 1 or < 0, are written at once).
+All tasks due at the same time are written with a single UPDATE, and a background thread
+flushes whatever is left pending.
+
+Cancellation checks are served from a per-task cached flag. The API publishes the doc id on
+TASK_CANCEL_CHANNEL when parsing is canceled, which invalidates the flag of that doc's tasks;
+without a subscription the flag is re-read from the database on every check.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from api.db.services.task_service import TaskService
+from rag.utils.redis_conn import REDIS_CONN
+
+PROGRESS_FLUSH_INTERVAL = int(os.environ.get("PROGRESS_FLUSH_INTERVAL_MS", 1000)) / 1000
+PROGRESS_CANCEL_CHECK_INTERVAL = float(os.environ.get("PROGRESS_CANCEL_CHECK_INTERVAL", 30))
+TASK_CANCEL_CHANNEL = "ragflow_task_cancel"
+
+
+def is_terminal(prog) -> bool:
+    return prog is not None and (prog >= 1 or prog < 0)
+
+
+def publish_task_cancel(doc_ids):
+    """Tell every task executor to re-check the cancel state of these documents."""
+    for doc_id in doc_ids:
+        REDIS_CONN.publish(TASK_CANCEL_CHANNEL, doc_id)
+
+
+class ProgressReporter:
+    def __init__(self, flush_interval=PROGRESS_FLUSH_INTERVAL, cancel_check_interval=PROGRESS_CANCEL_CHECK_INTERVAL):
+        self.flush_interval = flush_interval
+        self.cancel_check_interval = cancel_check_interval
+        self.lock = threading.Lock()
+        # held from popping the pending updates until they are written, so an older progress
+        # popped by a concurrent flush can't be written after a newer (e.g. terminal) one
+        self.write_lock = threading.Lock()
+        self.pending = {}  # task_id -> {"msgs": [...], "progress": float}
+        self.last_flush = {}
+        self.task_docs = {}
+        self.cancel_cache = {}  # task_id -> (checked_at, canceled)
+        self.subscribed = False
+        self.reports = 0
+        self.flushes = 0
+        self._started = False
+
+    def _start(self):
+        if self._started:
+            return
+        with self.lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._flush_loop, name="progress-flusher", daemon=True).start()
+        threading.Thread(target=self._cancel_listener, name="progress-cancel-listener", daemon=True).start()
+        atexit.register(self.flush)
+
+    def report(self, task_id, prog=None, msg=""):
+        self._start()
+        now = time.time()
+        with self.lock:
+            p = self.pending.setdefault(task_id, {"msgs": []})
+            if msg:
+                p["msgs"].append(msg)
+            if prog is not None:
+                p["progress"] = prog
+            self.reports += 1
+            if not is_terminal(prog) and now - self.last_flush.get(task_id, 0) < self.flush_interval:
+                return
+            # write every task that is due together with this one
+            due = [t for t in self.pending if t == task_id or now - self.last_flush.get(t, 0) >= self.flush_interval]
+        self.flush(due)
+
+    def flush(self, task_ids=None):
+        with self.write_lock:
+            self._flush(task_ids)
+
+    def _flush(self, task_ids=None):
+        now = time.time()
+        with self.lock:
+            task_ids = list(self.pending) if task_ids is None else [t for t in task_ids if t in self.pending]
+            updates = {t: self.pending.pop(t) for t in task_ids}
+            for t in task_ids:
+                self.last_flush[t] = now
+        if not updates:
+            return
+        infos = {}
+        for t, p in updates.items():
+            infos[t] = {"progress_msg": "\n".join(p["msgs"])}
+            if "progress" in p:
+                infos[t]["progress"] = p["progress"]
+        try:
+            TaskService.update_progress_many(infos)
+            self.flushes += 1
+        except Exception:
+            logging.exception(f"ProgressReporter.flush of {len(updates)} tasks got exception, will retry")
+            with self.lock:
+                for t, p in updates.items():
+                    newer = self.pending.get(t, {"msgs": []})
+                    p["msgs"].extend(newer["msgs"])
+                    if "progress" in newer:
+                        p["progress"] = newer["progress"]
+                    self.pending[t] = p
+            return
+        with self.lock:
+            for t, p in updates.items():
+                if is_terminal(p.get("progress")) and t not in self.pending:
+                    self.last_flush.pop(t, None)
+                    self.cancel_cache.pop(t, None)
+                    self.task_docs.pop(t, None)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("ProgressReporter flush loop got exception")
+
+    def is_canceled(self, task_id) -> bool:
+        self._start()
+        checked_at, canceled = self.cancel_cache.get(task_id, (0, False))
+        if canceled:
+            return True
+        if self.subscribed and time.time() - checked_at < self.cancel_check_interval:
+            return False
+        doc_id, canceled = TaskService.cancel_state(task_id)
+        self.task_docs[task_id] = doc_id
+        self.cancel_cache[task_id] = (time.time(), canceled)
+        return canceled
+
+    def _cancel_listener(self):
+        while True:
+            pubsub = REDIS_CONN.pubsub()
+            if pubsub is None:
+                time.sleep(10)
+                continue
+            try:
+                pubsub.subscribe(TASK_CANCEL_CHANNEL)
+                self.subscribed = True
+                for message in pubsub.listen():
+                    doc_id = message.get("data")
+                    for t, d in list(self.task_docs.items()):
+                        if d == doc_id:
+                            self.cancel_cache.pop(t, None)
+            except Exception as e:
+                logging.warning(f"ProgressReporter cancel listener got exception: {e}")
+            finally:
+                self.subscribed = False
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(1)
+
+    def stats(self):
+        return {"reports": self.reports, "flushes": self.flushes, "pending": len(self.pending), "subscribed": self.subscribed}
+
+
+PROGRESS_REPORTER = ProgressReporter()
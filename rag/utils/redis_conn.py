@@ -113,6 +113,46 @@ class RedisDB:
             self.__open__()
         return False
 
+    def mget(self, keys: list[str]):
+        if not self.REDIS:
+            return [None] * len(keys)
+        try:
+            return self.REDIS.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget got exception: " + str(e))
+            self.__open__()
+        return [None] * len(keys)
+
+    def set_many(self, kvs: dict, exp=3600):
+        try:
+            pipeline = self.REDIS.pipeline(transaction=False)
+            for k, v in kvs.items():
+                pipeline.set(k, v, exp)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.set_many got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def publish(self, channel: str, message: str):
+        try:
+            self.REDIS.publish(channel, message)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.publish " + str(channel) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def pubsub(self):
+        """A new PubSub of the shared connection pool, None if Redis is unavailable."""
+        try:
+            return self.REDIS.pubsub(ignore_subscribe_messages=True)
+        except Exception as e:
+            logging.warning("RedisDB.pubsub got exception: " + str(e))
+            self.__open__()
+        return None
+
     def sadd(self, key: str, member: str):
         try:
             self.REDIS.sadd(key, member)
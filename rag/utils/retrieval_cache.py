@@ -0,0 +1,113 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Per-process cache of Dealer.retrieval results.
+
+Every knowledge base has a version stamp in Redis which is bumped whenever its chunks change
+(chunk counters, chunk edits, availability, pagerank, tags). The stamps of the searched KBs are
+part of the cache key, so a bump makes all cached results of that KB unreachable at once, in
+every process; stale entries simply age out of the TTL cache.
+
+Entries keep the chunk vectors as read-only float32 arrays (the precision of the doc stores)
+apart from the chunk dicts; a hit hands out fresh shallow copies of the dicts with the vector
+turned back into a list, so callers may pop or set keys without touching the cached entry.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import xxhash
+from cachetools import TTLCache
+
+from rag.utils.redis_conn import REDIS_CONN
+
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", 1024))
+RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", 300))
+KB_VERSION_TTL = 7 * 24 * 3600
+
+
+def _version_key(kb_id):
+    return f"retrieval_kb_version:{kb_id}"
+
+
+class RetrievalCache:
+    def __init__(self, maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL):
+        self.enabled = maxsize > 0 and ttl > 0
+        self.cache = TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 1))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kb_ids, *args):
+        if not self.enabled or not kb_ids:
+            return None
+        kb_ids = sorted(kb_ids)
+        versions = REDIS_CONN.mget([_version_key(kb_id) for kb_id in kb_ids])
+        hasher = xxhash.xxh64()
+        for v in [kb_ids, versions, *args]:
+            hasher.update(str(v).encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def get(self, k):
+        if k is None:
+            return None
+        with self.lock:
+            res = self.cache.get(k)
+            if res is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        ranks = dict(res)
+        ranks["chunks"] = [dict(ck, vector=v.tolist()) if v is not None else dict(ck) for ck, v in res["chunks"]]
+        ranks["doc_aggs"] = [dict(a) for a in res["doc_aggs"]]
+        return ranks
+
+    def set(self, k, ranks):
+        if k is None:
+            return
+        chunks = []
+        for ck in ranks["chunks"]:
+            ck = dict(ck)
+            v = ck.pop("vector", None)
+            if v is not None:
+                v = np.asarray(v, dtype=np.float32)
+                v.setflags(write=False)
+            chunks.append((ck, v))
+        entry = dict(ranks)
+        entry["chunks"] = tuple(chunks)
+        entry["doc_aggs"] = tuple(dict(a) for a in ranks["doc_aggs"])
+        with self.lock:
+            self.cache[k] = entry
+
+    def invalidate(self, kb_ids):
+        if isinstance(kb_ids, str):
+            kb_ids = [kb_ids]
+        stamp = str(time.time_ns())
+        if not REDIS_CONN.set_many({_version_key(kb_id): stamp for kb_id in kb_ids}, KB_VERSION_TTL):
+            logging.warning(f"RetrievalCache.invalidate can't bump version of {kb_ids}, clear local cache")
+            with self.lock:
+                self.cache.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.,
+                "size": len(self.cache), "maxsize": self.cache.maxsize, "ttl": self.cache.ttl}
+
+
+RETRIEVAL_CACHE = RetrievalCache()
@@ -0,0 +1,124 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Concurrent retrieval fan-out.
+
+The sources of a question (knowledge bases, web search, knowledge graph, ...) are submitted
+to thread pools at once. A source with a deadline (ms from the start of the fan-out) is
+dropped if it has not returned by then, its late result is discarded; a source without a
+deadline is always waited for and its exception is raised. The latency is thus the one of the
+slowest source waited for instead of the sum of all of them.
+
+A dropped source can't be interrupted and keeps its worker until it returns, so every source
+with a deadline runs in a pool of its own: a hung web search only piles up in its pool and
+can't delay the knowledge base retrievals, nor the other sources, queued in the shared one.
+
+Sources that fan out themselves must use another pool (see executor()), a source blocked on
+subtasks queued behind it in its own pool would never finish.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from timeit import default_timer as timer
+
+RETRIEVAL_FANOUT_WORKERS = int(os.environ.get("RETRIEVAL_FANOUT_WORKERS", 16))
+RETRIEVAL_KB_DEADLINE_MS = int(os.environ.get("RETRIEVAL_KB_DEADLINE_MS", 0))
+RETRIEVAL_WEB_DEADLINE_MS = int(os.environ.get("RETRIEVAL_WEB_DEADLINE_MS", 5000))
+RETRIEVAL_KG_DEADLINE_MS = int(os.environ.get("RETRIEVAL_KG_DEADLINE_MS", 10000))
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def executor(name="sources") -> ThreadPoolExecutor:
+    """The process-wide pool with this name."""
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=RETRIEVAL_FANOUT_WORKERS,
+                                                  thread_name_prefix=f"retrieval-{name}")
+        return _executors[name]
+
+
+class RetrievalFanout:
+    def __init__(self, pool="sources"):
+        self.pool = pool
+        self.executor = executor(pool)
+        self.sources = []  # (name, fn, args, kwargs, deadline ms or 0)
+        self.timings = {}  # name -> ms, None if dropped
+        self.errors = {}
+
+    def add(self, name, fn, *args, deadline_ms=0, **kwargs):
+        """Run fn(*args, **kwargs) as source `name`; deadline_ms <= 0 waits for it whatever it takes."""
+        self.sources.append((name, fn, args, kwargs, deadline_ms))
+        return self
+
+    def run(self) -> dict:
+        """Run all sources -> {name: result} of the sources which returned in time."""
+        start = timer()
+        futures = {}
+        for name, fn, args, kwargs, deadline in self.sources:
+            pool = executor(f"{self.pool}:{name}") if deadline > 0 else self.executor
+            futures[pool.submit(self._timed, name, fn, *args, **kwargs)] = (name, deadline)
+
+        results = {}
+        pending = set(futures.keys())
+        while pending:
+            deadlines = [futures[f][1] for f in pending if futures[f][1] > 0]
+            timeout = None
+            # stop waiting at the nearest deadline, unless a source without deadline is still running
+            if len(deadlines) == len(pending):
+                timeout = max(0, min(deadlines) / 1000 - (timer() - start))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for f in done:
+                name, deadline = futures[f]
+                try:
+                    results[name] = f.result()
+                except Exception as e:
+                    if deadline <= 0:
+                        for p in pending:
+                            p.cancel()
+                        raise
+                    logging.exception(f"RetrievalFanout source {name} failed")
+                    self.errors[name] = e
+            elapsed = (timer() - start) * 1000
+            for f in [f for f in pending if 0 < futures[f][1] <= elapsed]:
+                name, deadline = futures[f]
+                f.cancel()
+                pending.discard(f)
+                self.timings[name] = None
+                logging.warning(f"RetrievalFanout dropped source {name} after {deadline}ms")
+        return results
+
+    def _timed(self, name, fn, *args, **kwargs):
+        st = timer()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # a dropped source keeps None
+            self.timings.setdefault(name, (timer() - st) * 1000)
+
+    def timing_lines(self, indent="    "):
+        lines = []
+        for name, _, _, _, deadline in self.sources:
+            cost = self.timings.get(name)
+            if cost is None:
+                lines.append(f"{indent}- {name}: dropped after {deadline}ms")
+            elif name in self.errors:
+                lines.append(f"{indent}- {name}: failed after {cost:.1f}ms")
+            else:
+                lines.append(f"{indent}- {name}: {cost:.1f}ms")
+        return lines
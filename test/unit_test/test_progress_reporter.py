@@ -0,0 +1,60 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import threading
+import time
+
+from rag.utils import progress_reporter
+from rag.utils.progress_reporter import ProgressReporter
+
+
+def test_concurrent_flushes_end_terminal(monkeypatch):
+    db = {}
+    writes = []
+    stalled = threading.Event()
+    release = threading.Event()
+
+    def update_progress_many(infos):
+        writes.append(infos)
+        # the second write stalls, as a slow UPDATE would, while a terminal progress comes in
+        if len(writes) == 2:
+            stalled.set()
+            release.wait(5)
+        for task_id, info in infos.items():
+            if "progress" in info:
+                db[task_id] = info["progress"]
+
+    monkeypatch.setattr(progress_reporter.TaskService, "update_progress_many", update_progress_many)
+    reporter = ProgressReporter(flush_interval=3600)
+    monkeypatch.setattr(reporter, "_start", lambda: None)
+
+    # the first report is written at once, the next one waits for the flush interval
+    reporter.report("task", prog=0.1, msg="Page(1~12): Start to parse.")
+    reporter.report("task", prog=0.5, msg="Page(1~12): OCR finished")
+    assert len(writes) == 1
+    slow = threading.Thread(target=reporter.flush)
+    slow.start()
+    assert stalled.wait(5)
+
+    done = threading.Thread(target=reporter.report, args=("task",), kwargs={"prog": 1.0, "msg": "Done!"})
+    done.start()
+    time.sleep(0.2)
+    release.set()
+    slow.join(5)
+    done.join(5)
+
+    assert len(writes) == 3
+    assert db["task"] == 1.0
+    assert not reporter.pending